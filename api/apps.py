@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from tracker.metrics import request_metrics
+        from .cache import team_bug_resolutions_cache
+        request_metrics.register_collector(team_bug_resolutions_cache.collect_metrics)
@@ -0,0 +1,246 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Subquery, Sum, Value
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.decorators import classonlymethod
+from django.views import View
+
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, NotFound
+from rest_framework.utils.encoders import JSONEncoder
+
+from tracker.media import signed_url_expiry
+from tracker.routers import use_primary
+from .cache import team_bug_resolutions_cache
+from user.authentication import ClaimsJWTAuthentication
+from tracker.models import Teams, Bug, BugResolution
+from tracker.selectors import get_bugs_queryset, get_bug_resolutions_queryset, get_team_bug_resolutions_queryset
+
+from .pagination import KeysetPagination
+from .serializers import BugsSerializer, BugResolutionSerializer
+from .views import BugList, BugDetail, BugResolutionList, BugResolutionDetail, TeamBugResolutionList
+
+
+async def aauthenticate(request):
+    # DRF authentication in the event loop, None without a token, AuthenticationFailed for a bad one
+    return await ClaimsJWTAuthentication().aauthenticate(request)
+
+
+class AsyncReadView(View):
+    """Authenticated GETs served async under bug_imprints.asgi, other methods go to sync_view_class in a thread."""
+    sync_view_class = None
+    paginator_class = KeysetPagination
+    validator_relations = None          # related lookups folded into the validator of a paginated list, None disables it
+    lookup_model = None                 # model of the <id> url argument, parsed before aget runs
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True                      # same as DRF's APIView, writes are authenticated by token
+        return view
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            user = await aauthenticate(request)
+        except AuthenticationFailed as exc:
+            return self.error_response(exc)
+        if user is None:
+            return self.error_response(NotAuthenticated())
+        request.user = user
+        self.etag = self.last_modified = None
+        if self.lookup_model is not None:
+            try:
+                kwargs['id'] = self.lookup_model._meta.pk.to_python(kwargs['id'])
+            except ValidationError:                         # malformed lookup value, same as DRF's get_object_or_404
+                return self.error_response(NotFound())
+        try:
+            response = await self.aget(request, user, *args, **kwargs)
+        except NotFound as exc:                              # eg: an invalid pagination cursor
+            return self.error_response(exc)
+        if self.etag is not None and response.status_code == status.HTTP_200_OK:
+            response['ETag'] = self.etag
+            if self.last_modified is not None:
+                response['Last-Modified'] = http_date(self.last_modified)
+            response['Cache-Control'] = 'private, no-cache'         # clients keep the body but revalidate every time
+        return response
+
+    async def aget(self, request, user, *args, **kwargs):
+        raise NotImplementedError
+
+    async def post(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def put(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def patch(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def delegate(self, request, *args, **kwargs):
+        view = self.sync_view_class.as_view()
+        return await sync_to_async(view)(request, *args, **kwargs)
+
+    def json_response(self, data, status=status.HTTP_200_OK):
+        return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+    def error_response(self, exc):
+        response = self.json_response({'detail': exc.detail} if isinstance(exc.detail, str) else exc.detail, status=exc.status_code)
+        if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+            response['WWW-Authenticate'] = ClaimsJWTAuthentication().authenticate_header(self.request)
+        return response
+
+    async def avalidator(self, queryset, relations=(), **aggregates):
+        # max modified_at and count of queryset and of each relation in one query, any write or soft delete moves one
+        aggregates = {'modified_at': Max('modified_at'), 'count': Count('pk', distinct=True), **aggregates}
+        for relation in relations:
+            aggregates[relation + '__modified_at'] = Max(relation + '__modified_at')
+            aggregates[relation + '__count'] = Count(relation, distinct=True)
+        return await queryset.order_by().aaggregate(**aggregates)
+
+    def not_modified(self, validator, shared=False):
+        # sets the ETag and Last-Modified from validator, returns a 304 response when the client's copy is current
+        # shared bodies are the same for every user allowed to read them, their ETag is too
+        state = (None if shared else self.request.user.pk, self.request.get_full_path(), signed_url_expiry(), sorted(validator.items()))    # signed media urls rotate
+        self.etag = 'W/"%s"' % hashlib.md5(repr(state).encode()).hexdigest()
+        modified = [value for key, value in validator.items() if key.endswith('modified_at') and value is not None]
+        self.last_modified = int(max(modified).timestamp()) if modified else None
+        return self.conditional_response()
+
+    def conditional_response(self):
+        response = get_conditional_response(self.request, etag=self.etag, last_modified=self.last_modified)
+        if response is not None:
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    async def paginated_response(self, queryset, serializer_class):
+        paginator = self.paginator_class()
+        page_queryset = paginator.get_page_queryset(queryset, self.request)
+        if self.validator_relations is not None:            # one aggregate over the rows of this page, nothing is serialized on a 304
+            page_rows = queryset.model.objects.filter(pk__in=page_queryset.values('pk'))
+            response = self.not_modified(await self.avalidator(page_rows, self.validator_relations, **self.validator_aggregates(page_rows)))
+            if response is not None:
+                return response
+        page = paginator.set_page([obj async for obj in page_queryset])
+        data = serializer_class(page, many=True).data      # the page is fully prefetched, serializing does not touch the db
+        return self.json_response({'next': paginator.get_next_link(), 'results': data})
+
+    def validator_aggregates(self, rows):
+        return {}
+
+
+def row_aggregate(rows, aggregate):
+    # aggregate of rows computed once in a subquery, the joins of the validator's relations would count each row several times
+    return Max(Subquery(rows.order_by().annotate(group=Value(1)).values('group').annotate(value=aggregate).values('value')))
+
+
+BUG_VALIDATOR_RELATIONS = ('attachments', 'found_by', 'team')
+
+
+class AsyncBugList(AsyncReadView):
+    sync_view_class = BugList
+    validator_relations = BUG_VALIDATOR_RELATIONS
+
+    async def aget(self, request, user, *args, **kwargs):
+        return await self.paginated_response(get_bugs_queryset(), BugsSerializer)
+
+    def validator_aggregates(self, rows):
+        # BugCluster rows carry no modified_at, watcher_count is moved by F() updates which leave modified_at as is
+        return {'canonical': row_aggregate(rows, Sum('cluster__canonical_id')), 'watchers': row_aggregate(rows, Sum('watcher_count'))}
+
+
+class AsyncBugDetail(AsyncReadView):
+    sync_view_class = BugDetail
+    lookup_model = Bug
+
+    async def aget(self, request, user, id, *args, **kwargs):
+        validator = await self.avalidator(Bug.objects.filter(id=id), BUG_VALIDATOR_RELATIONS, canonical=Max('cluster__canonical_id'), watchers=Max('watcher_count'))
+        if validator['count'] == 0:
+            return self.error_response(NotFound())
+        response = self.not_modified(validator)
+        if response is not None:
+            return response
+        bug = await get_bugs_queryset().filter(id=id).afirst()
+        if bug is None:
+            return self.error_response(NotFound())
+        return self.json_response(BugsSerializer(bug).data)
+
+
+BUG_RESOLUTION_VALIDATOR_RELATIONS = ('assigned_members', 'messeges_bug_resolution', 'messeges_bug_resolution__attachments')
+
+
+class AsyncBugResolutionList(AsyncReadView):
+    sync_view_class = BugResolutionList
+    validator_relations = BUG_RESOLUTION_VALIDATOR_RELATIONS
+
+    async def aget(self, request, user, *args, **kwargs):
+        queryset = get_bug_resolutions_queryset().filter(bug__team_id__in=user.team_ids)     # only return bug resolutions available to the user
+        return await self.paginated_response(queryset, BugResolutionSerializer)
+
+
+class AsyncBugResolutionDetail(AsyncReadView):
+    sync_view_class = BugResolutionDetail
+    lookup_model = BugResolution
+
+    async def aget(self, request, user, id, *args, **kwargs):
+        # the validator query also returns the team, an unchanged poll costs this one query
+        validator = await self.avalidator(BugResolution.objects.filter(id=id), BUG_RESOLUTION_VALIDATOR_RELATIONS, team_id=Max('bug__team_id'))
+        if validator['count'] == 0:
+            return self.error_response(NotFound())
+        if not user.in_team(validator['team_id']):
+            return self.json_response({"error": "You are not a member of this team"}, status=status.HTTP_400_BAD_REQUEST)
+        response = self.not_modified(validator)
+        if response is not None:
+            return response
+        bug_resolution = await get_bug_resolutions_queryset().filter(id=id).afirst()
+        if bug_resolution is None:
+            return self.error_response(NotFound())
+        return self.json_response(BugResolutionSerializer(bug_resolution).data)
+
+
+class AsyncTeamBugResolutionList(AsyncReadView):
+    sync_view_class = TeamBugResolutionList
+    lookup_model = Teams
+
+    async def aget(self, request, user, id, *args, **kwargs):
+        team = await Teams.objects.select_related('team_leader').filter(id=id).afirst()
+        if team is None:
+            return self.error_response(NotFound())
+        if not user.in_team(team.id):
+            return self.json_response({"error": "You are not a member of this team"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # the output is the same for every member, it is cached per team version, query string and signed url window
+        variant = hashlib.md5(repr((request.get_full_path(), signed_url_expiry())).encode()).hexdigest()
+        entry, cache_key = await team_bug_resolutions_cache.aget(team.id, variant)
+        if entry is not None:
+            self.etag, self.last_modified = entry['etag'], entry['last_modified']
+            response = self.conditional_response() or HttpResponse(entry['body'], content_type='application/json')
+            response['X-Cache'] = 'HIT'
+            return response
+
+        with use_primary():                                         # the entry outlives the request, it must not keep a lagging replica's rows
+            team = await Teams.objects.select_related('team_leader').aget(id=team.id)
+            paginator = self.paginator_class()
+            page_queryset = paginator.get_page_queryset(get_team_bug_resolutions_queryset(team.id), request)
+            validator = await self.avalidator(BugResolution.objects.filter(pk__in=page_queryset.values('pk')), BUG_RESOLUTION_VALIDATOR_RELATIONS)
+            validator.update(team__modified_at=team.modified_at, team_leader__modified_at=team.team_leader.modified_at)    # loaded for the membership check
+            response = self.not_modified(validator, shared=True)        # the entry and its ETag are served to every member
+            if response is not None:
+                return response
+            page = paginator.set_page([obj async for obj in page_queryset])
+            serializer = TeamBugResolutionList.TeamBugResolutionSerializer(team, context={'bug_resolution_page': page})
+            data = serializer.data
+            data['bug_resolution_next'] = paginator.get_next_link()      # cursor for the next page of bug_resolution_list
+            response = self.json_response(data)
+        await team_bug_resolutions_cache.aset(cache_key, {'etag': self.etag, 'last_modified': self.last_modified, 'body': response.content})
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,225 @@
+import gc
+import statistics
+import subprocess
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.urls import URLResolver, get_resolver
+
+from tracker.models import Teams, Bug, BugResolution, Messeges
+from user.models import User
+from user.tokens import ClaimsRefreshToken
+
+
+BENCHMARKED_URLCONFS = ('api.urls', 'user.urls')
+
+
+def endpoint_routes():
+    """Full routes (eg: api/bugs/<id>/) of BENCHMARKED_URLCONFS, in urlpatterns order."""
+    routes = []
+    for top in get_resolver().url_patterns:
+        if isinstance(top, URLResolver) and getattr(top.urlconf_module, '__name__', None) in BENCHMARKED_URLCONFS:
+            routes.extend(str(top.pattern) + str(pattern.pattern) for pattern in top.url_patterns)
+    return routes
+
+
+def git_commit():
+    """Commit of the checkout the results belong to, None outside of git."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+@dataclass
+class Fixture:
+    """Rows the cases point at, a team leader of a seeded team and a staff user, see the seed_data command."""
+    user: User
+    admin: User
+    team: Teams
+    bug: Bug
+    resolution: BugResolution
+    outsider: User                          # not in team, moved in and out of it by the membership cases
+    password: str
+    tokens: dict = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, password, username=None):
+        users = User.objects.filter(teams_team_leader__isnull=False).distinct()
+        user = users.get(username=username) if username else users.order_by('id').first()
+        if user is None:
+            raise LookupError('No team leader found, seed the database first (manage.py seed_data)')
+        team = Teams.objects.filter(team_leader=user).order_by('id').first()
+        resolution = BugResolution.objects.filter(bug__team=team, assigned_members=user).select_related('bug').order_by('id').first()
+        if resolution is None:
+            raise LookupError('%s is assigned no resolution of %s' % (user.username, team.team_name))
+        admin = User.objects.filter(is_staff=True, is_active=True).order_by('id').first()
+        if admin is None:
+            raise LookupError('No staff user found, seed the database first (manage.py seed_data)')
+        outsider = User.objects.exclude(teams=team).exclude(pk=admin.pk).filter(is_staff=False).order_by('id').first()
+        return cls(user=user, admin=admin, team=team, bug=resolution.bug, resolution=resolution, outsider=outsider, password=password)
+
+    def token(self, user):
+        if user.pk not in self.tokens:
+            self.tokens[user.pk] = ClaimsRefreshToken.for_user(user)
+        return self.tokens[user.pk]
+
+    def headers(self, user):
+        return {'HTTP_AUTHORIZATION': 'Bearer %s' % self.token(user).access_token}
+
+
+@dataclass
+class Case:
+    """One request of the benchmark. setup(fixture) runs untimed before every request, what it returns is passed to path / data."""
+    route: str
+    method: str
+    path: Callable
+    data: Optional[Callable] = None
+    content_type: Optional[str] = 'application/json'
+    as_admin: bool = False
+    anonymous: bool = False
+    setup: Optional[Callable] = None
+
+    @property
+    def name(self):
+        return '%s %s' % (self.method.upper(), self.route)
+
+
+def _unique():
+    return uuid.uuid4().hex[:12]
+
+def _new_bug(f):
+    bug = Bug(title='Benchmark bug %s' % _unique(), description='Created by the benchmark', team=f.team, found_by=f.user)
+    bug.save(auth_user=f.user)
+    return bug
+
+def _new_message(f):
+    message = Messeges(message='Benchmark comment', user=f.user, bug_resolution_id=f.resolution)
+    message.save(auth_user=f.user)
+    return message
+
+def _new_user(f):
+    name = 'benchmark-%s' % _unique()
+    return User.objects.create(username=name, email='%s@example.com' % name)
+
+def _upload():
+    return SimpleUploadedFile('benchmark-%s.txt' % _unique(), _unique().encode(), content_type='text/plain')
+
+
+CASES = [
+    Case('api/teams/', 'get', lambda f, _: '/api/teams/'),
+    Case('api/teams/', 'post', lambda f, _: '/api/teams/', lambda f, _: {'team_name': 'Benchmark team %s' % _unique(), 'team_leader': f.admin.pk}, as_admin=True),
+    Case('api/teams/<id>/', 'get', lambda f, _: '/api/teams/%d/' % f.team.pk),
+    Case('api/teams/<id>/', 'patch', lambda f, _: '/api/teams/%d/' % f.team.pk, lambda f, _: {'team_name': f.team.team_name}),
+    Case('api/teams/bugResolution/<id>/', 'get', lambda f, _: '/api/teams/bugResolution/%d/' % f.team.pk),
+    Case('api/teams/export/<id>/', 'get', lambda f, _: '/api/teams/export/%d/' % f.team.pk),
+    Case('api/bugs/', 'get', lambda f, _: '/api/bugs/'),
+    Case('api/bugs/', 'post', lambda f, _: '/api/bugs/', lambda f, _: {'title': 'Benchmark bug %s' % _unique(), 'description': 'Login crashes on android', 'team': f.team.pk}),
+    Case('api/bugs/bulk/', 'post', lambda f, _: '/api/bugs/bulk/', lambda f, _: [{'title': 'Benchmark bulk bug %d' % index, 'team': f.team.pk} for index in range(20)]),
+    Case('api/bugs/<id>/', 'get', lambda f, _: '/api/bugs/%d/' % f.bug.pk),
+    Case('api/bugs/<id>/', 'patch', lambda f, _: '/api/bugs/%d/' % f.bug.pk, lambda f, _: {'description': f.bug.description}),
+    Case('api/bugs/<id>/', 'delete', lambda f, bug: '/api/bugs/%d/' % bug.pk, setup=_new_bug),
+    Case('api/bugResolution/', 'get', lambda f, _: '/api/bugResolution/'),
+    Case('api/bugResolution/', 'post', lambda f, _: '/api/bugResolution/', lambda f, bug: {'bug': bug.pk, 'assigned_members': [f.user.pk]}, setup=_new_bug),
+    Case('api/bugResolution/<id>/', 'get', lambda f, _: '/api/bugResolution/%d/' % f.resolution.pk),
+    Case('api/bugResolution/<id>/', 'patch', lambda f, _: '/api/bugResolution/%d/' % f.resolution.pk, lambda f, _: {'assigned_remarks': 'Benchmark remark'}),
+    Case('api/search/', 'get', lambda f, _: '/api/search/?q=crashes%20android'),
+    Case('api/etc/upload/', 'post', lambda f, _: '/api/etc/upload/', lambda f, _: {'attachment': _upload()}, content_type=None),
+    Case('api/etc/comments/add/', 'post', lambda f, _: '/api/etc/comments/add/', lambda f, _: {
+        'message': 'Benchmark comment', 'user_id': f.user.pk, 'bug_resolution_id': f.resolution.pk, 'attachments': _upload(),
+    }, content_type=None),
+    Case('api/etc/comments/<id>/', 'delete', lambda f, message: '/api/etc/comments/%d/' % message.pk, setup=_new_message),
+    Case('api/auth/token/', 'post', lambda f, _: '/api/auth/token/', lambda f, _: {'email': f.user.email, 'password': f.password}, anonymous=True),
+    Case('api/auth/token/refresh/', 'post', lambda f, _: '/api/auth/token/refresh/', lambda f, _: {'refresh': str(f.token(f.user))}, anonymous=True),
+    Case('api/auth/register/', 'post', lambda f, _: '/api/auth/register/', lambda f, name: {'username': name, 'email': '%s@example.com' % name, 'password': 'Benchmark-%s' % name},
+         anonymous=True, setup=lambda f: 'benchmark-%s' % _unique()),
+    Case('api/auth/extras/userList/', 'get', lambda f, _: '/api/auth/extras/userList/'),
+    Case('api/auth/extras/assignTeam/', 'post', lambda f, _: '/api/auth/extras/assignTeam/', lambda f, _: {'user_id': f.outsider.pk, 'team_id': f.team.pk},
+         setup=lambda f: f.outsider.teams.remove(f.team)),
+    Case('api/auth/extras/unsassignTeam/', 'post', lambda f, _: '/api/auth/extras/unsassignTeam/', lambda f, _: {'user_id': f.outsider.pk, 'team_id': f.team.pk},
+         setup=lambda f: f.outsider.teams.add(f.team)),
+    Case('api/auth/extras/updateAccountType/', 'post', lambda f, _: '/api/auth/extras/updateAccountType/', lambda f, _: {'user_id': f.outsider.pk, 'account_type': f.outsider.account_type},
+         as_admin=True),
+    Case('api/auth/extras/disableAccount/', 'post', lambda f, _: '/api/auth/extras/disableAccount/', lambda f, user: {'user_id': user.pk}, as_admin=True, setup=_new_user),
+]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(sorted_values, fraction):
+    # linear interpolation between the closest ranks
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _request(client, case, fixture, state):
+    kwargs = {} if case.anonymous else fixture.headers(fixture.admin if case.as_admin else fixture.user)
+    data = case.data(fixture, state) if case.data else None
+    if data is not None:
+        if case.content_type is None:
+            kwargs['data'] = data                       # multipart
+        else:
+            kwargs.update(data=data, content_type=case.content_type)
+    response = getattr(client, case.method)(case.path(fixture, state), **kwargs)
+    if response.streaming:
+        b''.join(response.streaming_content)            # a streamed body is part of the request's cost
+    return response
+
+def run_case(case, fixture, iterations, warmup):
+    """
+    Times iterations requests of case through the test client, after warmup untimed ones.
+    Queries are counted on every request, peak memory is taken on one more request under tracemalloc, which would skew the timings.
+    """
+    client = Client()
+    timings, queries, statuses = [], [], set()
+    for index in range(warmup + iterations):
+        state = case.setup(fixture) if case.setup else None
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            response = _request(client, case, fixture, state)
+            elapsed = time.perf_counter() - start
+        if index >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(counter.count)
+            statuses.add(response.status_code)
+
+    state = case.setup(fixture) if case.setup else None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _request(client, case, fixture, state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'route': case.route,
+        'method': case.method.upper(),
+        'status': sorted(statuses),
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': statistics.median_low(queries),
+        'queries_max': max(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
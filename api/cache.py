@@ -0,0 +1,87 @@
+import time
+from collections import Counter
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class TeamResponseCache:
+    """
+    Serialized responses of a team endpoint, keyed by team, a per team version and the request's query string.
+    The receivers in api.signals bump the version of a team whenever something shown by the endpoint changes,
+    entries of older versions are never read again and age out of the cache backend, nothing has to be scanned or deleted.
+    Versions live in the cache backend, so every worker sees a bump only if settings.TEAM_RESPONSE_CACHE is a shared cache.
+    """
+    def __init__(self, prefix, timeout=None):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.stats = Counter()              # hits, misses and invalidations of this process
+        self._lock = Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'TEAM_RESPONSE_CACHE', 'default')]
+
+    def _get_timeout(self):
+        if self.timeout is None:
+            return getattr(settings, 'TEAM_RESPONSE_CACHE_TIMEOUT', 24 * 60 * 60)
+        return self.timeout
+
+    def _version_key(self, team_id):
+        return '%s:version:%s' % (self.prefix, team_id)
+
+    def _entry_key(self, team_id, version, variant):
+        return '%s:%s:%s:%s' % (self.prefix, team_id, version, variant)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    async def aget(self, team_id, variant):
+        """
+        Returns (entry, store key). entry is None on a miss, the response is then built and saved with aset(store key, entry).
+        The version is read before the response is built, so a bump during the build can only leave a newer body under an old key.
+        """
+        version = await self.cache.aget(self._version_key(team_id))
+        if version is None:
+            version = time.time_ns()                            # not 1, a version evicted by the backend must not meet its old entries again
+            if not await self.cache.aadd(self._version_key(team_id), version, None):
+                version = await self.cache.aget(self._version_key(team_id))
+        key = self._entry_key(team_id, version, variant)
+        entry = await self.cache.aget(key)
+        self._count('hits' if entry is not None else 'misses')
+        return entry, key
+
+    async def aset(self, key, entry):
+        await self.cache.aset(key, entry, self._get_timeout())
+
+    def bump(self, team_ids):
+        team_ids = {team_id for team_id in team_ids if team_id is not None}
+        if not team_ids:
+            return
+        transaction.on_commit(lambda: self._bump(team_ids))     # readers must not cache the old rows under the new version
+
+    def _bump(self, team_ids):
+        for team_id in team_ids:
+            try:
+                self.cache.incr(self._version_key(team_id))
+            except ValueError:                                  # no version yet, nothing is cached for the team
+                continue
+            self._count('invalidations')
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def collect_metrics(self):
+        # for tracker.metrics.request_metrics.register_collector
+        stats = self.get_stats()
+        return [(
+            'team_response_cache_events_total', 'counter', 'Hits, misses and invalidations of api.cache.TeamResponseCache.',
+            [({'cache': self.prefix, 'event': event}, stats.get(event, 0)) for event in ('hits', 'misses', 'invalidations')],
+        )]
+
+
+team_bug_resolutions_cache = TeamResponseCache('team-bug-resolutions')
@@ -0,0 +1,90 @@
+import json
+from queue import Queue, Empty, Full
+from threading import Event, Thread
+
+from django.db import connections
+from django.db.models import Prefetch
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from tracker.models import Teams
+from tracker.selectors import get_bugs_queryset, get_bug_resolutions_queryset
+
+from .serializers import BugsSerializer, BugResolutionSerializer
+
+
+EXPORT_CHUNK_SIZE = 500
+
+
+def _line(record_type, data):
+    return json.dumps({'type': record_type, **data}, cls=JSONEncoder) + '\n'
+
+def iter_team_export(team: Teams, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields a team's bugs and their resolutions as newline delimited json.
+    Bugs are read through a server side cursor, chunk_size rows at a time with their resolutions, messages
+    and attachments prefetched per chunk, so memory stays flat whatever the size of the team.
+    """
+    yield _line('team', {'pk': team.pk, 'team_name': team.team_name, 'team_leader': team.team_leader_id})
+
+    bugs = get_bugs_queryset().filter(team_id=team.pk).prefetch_related(
+        Prefetch('bugresolution_bug', queryset=get_bug_resolutions_queryset(), to_attr='live_resolution'),
+    ).order_by('id')
+    for bug in bugs.iterator(chunk_size=chunk_size):
+        lines = _line('bug', BugsSerializer(bug).data)
+        if bug.live_resolution is not None:
+            lines += _line('bug_resolution', BugResolutionSerializer(bug.live_resolution).data)
+        yield lines
+
+
+class ThreadedIterator:
+    """
+    Drains an iterator from a worker thread through a bounded queue.
+    Django 4.1 consumes streaming content inside the event loop under ASGI, where the ORM refuses to run,
+    so database backed streams are produced in a thread and only handed over to the event loop.
+    The loop still waits on the queue while a chunk is fetched, drop this once Django accepts async streaming content (4.2).
+    """
+    _done = object()
+
+    def __init__(self, iterator, buffer=8):
+        self.queue = Queue(maxsize=buffer)
+        self.closed = Event()
+        self.thread = Thread(target=self._produce, args=(iterator,), daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce(self, iterator):
+        try:
+            for item in iterator:
+                if not self._put(item):                 # the client went away
+                    return
+            self._put(self._done)
+        except Exception as exc:
+            self._put(exc)
+        finally:
+            connections.close_all()                     # only closes this thread's connections
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=1)
+            except Empty:
+                if not self.thread.is_alive():
+                    return
+                continue
+            if item is self._done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        self.closed.set()
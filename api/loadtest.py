@@ -0,0 +1,216 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import List
+
+from .benchmarks import percentile
+
+
+class HTTPConnection:
+    """
+    Minimal HTTP/1.1 keep-alive client over asyncio streams, one request at a time, enough to drive the api without outside packages.
+    A connection closed by the server between requests is reopened once.
+    """
+    def __init__(self, host, port, timeout=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        """Returns (status, headers, body)."""
+        for attempt in (0, 1):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            try:
+                return await asyncio.wait_for(self._exchange(method, path, headers or {}, body), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if not reused or attempt:               # only a stale keep-alive connection is retried
+                    raise
+            except BaseException:
+                await self.close()
+                raise
+
+    async def _exchange(self, method, path, headers, body):
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s:%d' % (self.host, self.port), 'Content-Length: %d' % len(body)]
+        lines.extend('%s: %s' % item for item in headers.items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by the server')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            response_body = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            response_body = await self.reader.readexactly(int(response_headers['content-length']))
+        elif method == 'HEAD' or status in (204, 304):
+            response_body = b''
+        else:
+            response_body = await self.reader.read()        # delimited by the end of the connection
+            response_headers['connection'] = 'close'
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response_headers, response_body
+
+
+def multipart(fields, files):
+    """Encodes fields {name: value} and files {name: (filename, content type, bytes)} as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (boundary, name, value)).encode())
+    for name, (filename, content_type, content) in files.items():
+        parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: %s\r\n\r\n' % (boundary, name, filename, content_type)).encode())
+        parts.append(content + b'\r\n')
+    parts.append(('--%s--\r\n' % boundary).encode())
+    return 'multipart/form-data; boundary=%s' % boundary, b''.join(parts)
+
+
+@dataclass
+class Profile:
+    """A seeded user a virtual client acts as, with ids of rows it may read and write."""
+    user_id: int
+    email: str
+    password: str
+    team_ids: List[int]
+    bug_ids: List[int]
+    resolution_ids: List[int]           # resolutions the user is assigned to
+
+
+# action: share of the requests, see VirtualClient
+DEFAULT_MIX = {
+    'login': 2,
+    'bug_list': 25,
+    'bug_detail': 25,
+    'team_resolutions': 20,
+    'resolution_patch': 15,
+    'comment_with_attachment': 13,
+}
+
+
+@dataclass
+class Sample:
+    action: str
+    status: int                         # 0 when the request failed before a response
+    latency: float                      # seconds
+
+
+class VirtualClient:
+    """One simulated user on its own keep-alive connection, logs in once and then sends actions of the mix back to back."""
+    def __init__(self, host, port, profile: Profile, mix, rng: random.Random):
+        self.connection = HTTPConnection(host, port)
+        self.profile = profile
+        self.actions, self.weights = list(mix), list(mix.values())
+        self.rng = rng
+        self.access = None
+
+    async def run(self, stop_at, samples: list):
+        try:
+            await self.timed('login', samples)
+            while time.monotonic() < stop_at:
+                await self.timed(self.rng.choices(self.actions, self.weights)[0], samples)
+        finally:
+            await self.connection.close()
+
+    async def timed(self, action, samples):
+        start = time.monotonic()
+        try:
+            status = await getattr(self, action)()
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            status = 0
+        samples.append(Sample(action, status, time.monotonic() - start))
+
+    async def send(self, method, path, data=None, files=None):
+        headers = {'Authorization': 'Bearer %s' % self.access} if self.access else {}
+        body = b''
+        if files:
+            headers['Content-Type'], body = multipart(data or {}, files)
+        elif data is not None:
+            headers['Content-Type'], body = 'application/json', json.dumps(data).encode()
+        status, _, content = await self.connection.request(method, path, headers, body)
+        return status, content
+
+    async def login(self):
+        self.access = None
+        status, content = await self.send('POST', '/api/auth/token/', {'email': self.profile.email, 'password': self.profile.password})
+        if status == 200:
+            self.access = json.loads(content)['access']
+        return status
+
+    async def bug_list(self):
+        return (await self.send('GET', '/api/bugs/'))[0]
+
+    async def bug_detail(self):
+        return (await self.send('GET', '/api/bugs/%d/' % self.rng.choice(self.profile.bug_ids)))[0]
+
+    async def team_resolutions(self):
+        return (await self.send('GET', '/api/teams/bugResolution/%d/' % self.rng.choice(self.profile.team_ids)))[0]
+
+    async def resolution_patch(self):
+        path = '/api/bugResolution/%d/' % self.rng.choice(self.profile.resolution_ids)
+        return (await self.send('PATCH', path, {'assigned_remarks': 'Load test remark %d' % self.rng.randrange(10 ** 6)}))[0]
+
+    async def comment_with_attachment(self):
+        data = {'message': 'Load test comment', 'user_id': self.profile.user_id, 'bug_resolution_id': self.rng.choice(self.profile.resolution_ids)}
+        attachment = ('loadtest.txt', 'text/plain', uuid.uuid4().hex.encode() * 64)     # 2KB, distinct so every upload is stored
+        return (await self.send('POST', '/api/etc/comments/add/', data, {'attachments': attachment}))[0]
+
+
+async def run_step(host, port, profiles, mix, concurrency, duration, seed):
+    """Runs concurrency clients for duration seconds, returns their samples and the wall time."""
+    rng = random.Random(seed)
+    samples = []
+    started = time.monotonic()
+    stop_at = started + duration
+    clients = [VirtualClient(host, port, profiles[index % len(profiles)], mix, random.Random(rng.random())) for index in range(concurrency)]
+    await asyncio.gather(*(client.run(stop_at, samples) for client in clients))
+    return samples, time.monotonic() - started
+
+
+def summarize(samples, elapsed):
+    """Throughput, latency percentiles (ms) and error rate, overall and per action."""
+    def stats(group):
+        latencies = sorted(sample.latency * 1000 for sample in group)
+        errors = sum(1 for sample in group if not 200 <= sample.status < 400)
+        return {
+            'requests': len(group),
+            'throughput_rps': round(len(group) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 0.50), 2) if latencies else None,
+            'p95_ms': round(percentile(latencies, 0.95), 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99), 2) if latencies else None,
+            'error_rate': round(errors / len(group), 4) if group else 0,
+            'statuses': dict(sorted(Counter(str(sample.status) for sample in group).items())),
+        }
+    actions = {}
+    for sample in samples:
+        actions.setdefault(sample.action, []).append(sample)
+    return {'overall': stats(samples), 'actions': {action: stats(group) for action, group in sorted(actions.items())}}
+
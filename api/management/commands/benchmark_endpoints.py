@@ -0,0 +1,96 @@
+import json
+import platform
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from api.benchmarks import CASES, Fixture, endpoint_routes, git_commit, run_case
+from tracker.models import Teams, Bug, BugResolution, Messeges, MediaStore
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks every route of api/urls.py and user/urls.py through the test client on the current database '
+        '(seed it first with seed_data) and writes p50/p95/p99 latency, query counts and peak memory as json. '
+        'Rows created by the requests are rolled back unless --commit is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help='results of an earlier run, eg: of the previous commit')
+        parser.add_argument('--route', action='append', help='only routes containing this, can be repeated')
+        parser.add_argument('--username', help='team leader the requests are made as, the first seeded one by default')
+        parser.add_argument('--password', default='benchmark', help='password of --username, for the token route')
+        parser.add_argument('--commit', action='store_true', help='keep the rows created by the write routes')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 2:
+            raise CommandError('--iterations must be at least 2')
+        routes = endpoint_routes()
+        cases = [case for case in CASES if not options['route'] or any(part in case.route for part in options['route'])]
+        for route in sorted(set(routes) - {case.route for case in CASES}):
+            self.stderr.write(self.style.WARNING('No benchmark case for %s, add one to api.benchmarks.CASES' % route))
+
+        results = []
+        # no silk profiling, the benchmark measures the request and not the profiler
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], SILK_SAMPLE_RATE=0, SILK_SLOW_REQUEST_THRESHOLD=None):
+            with transaction.atomic():
+                try:
+                    fixture = Fixture.load(options['password'], options['username'])
+                except (LookupError, User.DoesNotExist) as exc:
+                    raise CommandError(str(exc))
+                for case in cases:
+                    if case.route not in routes:
+                        self.stderr.write(self.style.WARNING('Skipping %s, the route no longer exists' % case.name))
+                        continue
+                    result = run_case(case, fixture, options['iterations'], options['warmup'])
+                    results.append(result)
+                    self.stdout.write('%-52s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  %3d queries  %8.1fKB  %s' % (
+                        case.name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['queries'], result['peak_memory_kb'], result['status'],
+                    ))
+                if not options['commit']:
+                    transaction.set_rollback(True)
+
+        report = {'meta': self.meta(options), 'results': results}
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+        self.stdout.write(self.style.SUCCESS('Wrote %d results to %s' % (len(results), options['output'])))
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def meta(self, options):
+        return {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'dataset': {
+                'users': User.objects.count(), 'teams': Teams.objects.count(), 'bugs': Bug.objects.count(),
+                'resolutions': BugResolution.objects.count(), 'messages': Messeges.objects.count(), 'attachments': MediaStore.objects.count(),
+            },
+        }
+
+    def compare(self, path, results):
+        with open(path) as file:
+            previous = {(result['method'], result['route']): result for result in json.load(file)['results']}
+        self.stdout.write('\n%-52s %21s %13s' % ('compared to %s' % path, 'p95', 'queries'))
+        for result in results:
+            before = previous.get((result['method'], result['route']))
+            name = '%s %s' % (result['method'], result['route'])
+            if before is None:
+                self.stdout.write('%-52s %21s' % (name, 'new'))
+                continue
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            line = '%-52s %8.2f -> %8.2fms %+5.0f%% %4d -> %4d' % (name, before['p95_ms'], result['p95_ms'], change, before['queries'], result['queries'])
+            style = self.style.ERROR if change > 20 or result['queries'] > before['queries'] else self.style.SUCCESS if change < -20 or result['queries'] < before['queries'] else str
+            self.stdout.write(style(line))
@@ -0,0 +1,187 @@
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from api.benchmarks import git_commit
+from api.loadtest import DEFAULT_MIX, Profile, run_step, summarize
+from tracker.models import Bug, BugResolution
+from user.models import User
+
+
+HOST = '127.0.0.1'
+
+# how each --server is started, gunicorn and uvicorn are used when installed, they are not requirements of the app
+SERVERS = {
+    'runserver': lambda port, options: [str(settings.BASE_DIR / 'manage.py'), 'runserver', '%s:%d' % (HOST, port), '--noreload'],
+    'gunicorn': lambda port, options: [
+        '-m', 'gunicorn', 'bug_imprints.wsgi:application', '--bind', '%s:%d' % (HOST, port),
+        '--workers', str(options['workers']), '--threads', str(options['threads']), '--log-level', 'warning',
+    ],
+    'uvicorn': lambda port, options: [
+        '-m', 'uvicorn', 'bug_imprints.asgi:application', '--host', HOST, '--port', str(port),
+        '--workers', str(options['workers']), '--no-access-log', '--log-level', 'warning',
+    ],
+}
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+def _mix(value):
+    mix = {}
+    for part in value.split(','):
+        action, _, weight = part.partition('=')
+        if action.strip() not in DEFAULT_MIX:
+            raise ValueError(action)
+        mix[action.strip()] = float(weight)
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts the app under a real http server and drives it with concurrent clients logged in as seeded users (see seed_data): '
+        'logins, bug list and detail, resolution patches, comments with attachments and team resolution reads. '
+        'Reports throughput, p50/p95/p99 latency and the error rate for every --concurrency step. '
+        'The requests write to the configured database and media storage, run it on a seeded database you can throw away.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=_int_list, default=[1, 5, 10, 25, 50], help='comma separated clients of each step, eg: 1,5,10,25,50')
+        parser.add_argument('--duration', type=float, default=20, help='seconds of each step')
+        parser.add_argument('--warmup', type=float, default=3, help='seconds of untimed requests before the first step')
+        parser.add_argument('--mix', type=_mix, default=DEFAULT_MIX, help='weights of the actions, eg: bug_list=50,bug_detail=50, actions: %s' % ', '.join(DEFAULT_MIX))
+        parser.add_argument('--server', choices=sorted(SERVERS), default='runserver', help='runserver is threaded but a development server, prefer gunicorn or uvicorn')
+        parser.add_argument('--workers', type=int, default=4, help='gunicorn / uvicorn processes')
+        parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn process')
+        parser.add_argument('--url', help='load an already running server instead, eg: http://127.0.0.1:8000')
+        parser.add_argument('--server-log', help='file the server output goes to, discarded by default')
+        parser.add_argument('--prefix', default='seed', help='the --prefix given to seed_data')
+        parser.add_argument('--password', default='benchmark', help='the --password given to seed_data')
+        parser.add_argument('--users', type=int, default=100, help='seeded users the clients log in as, taken in turn')
+        parser.add_argument('--output', default='loadtest.json')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not options['concurrency'] or min(options['concurrency']) < 1:
+            raise CommandError('--concurrency must be positive numbers')
+        profiles = self.profiles(options)
+
+        server = None
+        if options['url']:
+            host, _, port = options['url'].split('://')[-1].rstrip('/').partition(':')
+            port = int(port or 80)
+        else:
+            host, port = HOST, self.free_port()
+            server = self.start_server(port, options)
+        try:
+            self.wait_until_ready(host, port, server)
+            steps = asyncio.run(self.run_steps(host, port, profiles, options))
+        finally:
+            if server is not None:
+                self.stop_server(server)
+
+        report = {'meta': self.meta(options, len(profiles)), 'steps': steps}
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+        peak = max(steps, key=lambda step: step['overall']['throughput_rps'])
+        self.stdout.write(self.style.SUCCESS('Peak throughput %.1f req/s at %d clients, wrote %s' % (
+            peak['overall']['throughput_rps'], peak['concurrency'], options['output'],
+        )))
+
+    def profiles(self, options):
+        # users of the seeded teams with a resolution assigned to them, so every action of the mix has rows to use
+        users = User.objects.filter(username__startswith='%s-t' % options['prefix'], is_active=True).prefetch_related('teams').order_by('id')
+        profiles = []
+        for user in users.iterator(chunk_size=options['users']):
+            team_ids = [team.id for team in user.teams.all()]
+            resolution_ids = list(BugResolution.objects.filter(assigned_members=user, bug__team_id__in=team_ids).order_by('id').values_list('id', flat=True)[:50])
+            bug_ids = list(Bug.objects.filter(team_id__in=team_ids).order_by('id').values_list('id', flat=True)[:100])
+            if resolution_ids and bug_ids:
+                profiles.append(Profile(user.id, user.email, options['password'], team_ids, bug_ids, resolution_ids))
+            if len(profiles) == options['users']:
+                break
+        if not profiles:
+            raise CommandError('No seeded user with an assigned resolution, run seed_data first (its --prefix and --password are needed here)')
+        return profiles
+
+    def free_port(self):
+        with socket.socket() as sock:
+            sock.bind((HOST, 0))
+            return sock.getsockname()[1]
+
+    def start_server(self, port, options):
+        if options['server'] != 'runserver' and importlib.util.find_spec(options['server']) is None:
+            raise CommandError('%s is not installed, pip install %s or use --server runserver' % (options['server'], options['server']))
+        env = dict(os.environ, ALLOWED_HOSTS='%s,localhost' % HOST)          # DJANGO_SETTINGS_MODULE and the DB_* settings are inherited
+        log = open(options['server_log'], 'ab') if options['server_log'] else subprocess.DEVNULL
+        try:
+            return subprocess.Popen([sys.executable, *SERVERS[options['server']](port, options)], cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        finally:
+            if log is not subprocess.DEVNULL:
+                log.close()
+
+    def wait_until_ready(self, host, port, server, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server is not None and server.poll() is not None:
+                raise CommandError('The server exited with %d, see --server-log' % server.returncode)
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('Nothing listens on %s:%d after %ds' % (host, port, timeout))
+
+    def stop_server(self, server):
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    async def run_steps(self, host, port, profiles, options):
+        if options['warmup']:
+            await run_step(host, port, profiles, options['mix'], min(options['concurrency']), options['warmup'], options['seed'])
+        steps = []
+        self.stdout.write('%8s %9s %10s %10s %10s %10s %8s' % ('clients', 'requests', 'req/s', 'p50', 'p95', 'p99', 'errors'))
+        for concurrency in options['concurrency']:
+            samples, elapsed = await run_step(host, port, profiles, options['mix'], concurrency, options['duration'], options['seed'] + concurrency)
+            step = {'concurrency': concurrency, 'elapsed': round(elapsed, 3), **summarize(samples, elapsed)}
+            steps.append(step)
+            self.write_stats('%8d' % concurrency, step['overall'])
+            for action, stats in step['actions'].items():
+                self.write_stats('%8s' % '', stats, '  %s' % action)
+        return steps
+
+    def write_stats(self, prefix, stats, suffix=''):
+        line = '%s %9d %10.1f %8.1fms %8.1fms %8.1fms %7.2f%%%s' % (
+            prefix, stats['requests'], stats['throughput_rps'], stats['p50_ms'] or 0, stats['p95_ms'] or 0, stats['p99_ms'] or 0, stats['error_rate'] * 100, suffix,
+        )
+        self.stdout.write(self.style.ERROR(line) if stats['error_rate'] else line)
+
+    def meta(self, options, users):
+        return {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'server': options['url'] or options['server'],
+            'workers': options['workers'] if options['server'] != 'runserver' and not options['url'] else None,
+            'duration': options['duration'],
+            'mix': options['mix'],
+            'users': users,
+        }
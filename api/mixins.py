@@ -8,7 +8,7 @@ class SoftDeleteModelMixin:
     """
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        if (request.user == instance.created_by) or (request.user.is_superuser): # only the creator or superuser can soft delete
+        if (request.user.pk == instance.created_by_id) or (request.user.is_superuser): # only the creator or superuser can soft delete
             self.perform_destroy(instance)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,94 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination keyed on (created_at, id), newest first.
+    The cursor holds the key of the last row sent, the next page is read with a range condition on
+    the (created_at, id) index instead of an OFFSET, so deep pages cost the same as the first one.
+    """
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_page([obj async for obj in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            created_at, pk = cursor
+            queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=pk)
+        return queryset[:self.page_size + 1]                 # one extra row tells us if there is a next page
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_query_params(self, request):
+        return getattr(request, 'query_params', request.GET)    # plain django requests for the async views
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(self.get_query_params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(last.created_at, last.pk))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, created_at, pk):
+        raw = '%s|%s' % (created_at.isoformat(), pk)
+        return b64encode(raw.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = self.get_query_params(request).get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            created_at, pk = b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
@@ -1,5 +1,8 @@
 from rest_framework import serializers
-from tracker.models import Teams, Bug, MediaStore, Messeges, BugResolution
+from rest_framework.validators import UniqueValidator
+from tracker.models import Teams, Bug, MediaStore, Messeges, BugResolution, BugCluster
+from tracker.media import signed_media_url
+from tracker.thumbnails import is_image, thumbnail_urls
 
 from django.contrib.auth import get_user_model
 User = get_user_model()
@@ -10,6 +13,10 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('pk', 'username', 'email', 'password')
+        extra_kwargs = {                                            # soft deleted users still hold their username and email in the database
+            'username': {'validators': [User.username_validator, UniqueValidator(queryset=User.all_objects.all())]},
+            'email': {'validators': [UniqueValidator(queryset=User.all_objects.all())]},
+        }
 
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
@@ -21,29 +28,73 @@ class TeamsSerializer(serializers.ModelSerializer):
     team_leader_name = serializers.ReadOnlyField(source='team_leader.username')
     class Meta:
         model = Teams
-        fields = ('pk', 'team_name', 'team_leader','team_leader_name')
+        fields = ('pk', 'team_name', 'team_leader','team_leader_name', 'open_resolution_count')
+        extra_kwargs = {'team_name': {'validators': [UniqueValidator(queryset=Teams.all_objects.all())]}}     # names of soft deleted teams stay taken
         # depth = 0
 
+class SignedMediaField(serializers.FileField):
+    # media is served by tracker.views.serve_media, urls carry a signature so reading them needs no permission check
+    def __init__(self, **kwargs):
+        kwargs.setdefault('read_only', True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return signed_media_url(value.name, value.storage)
+
 class MediaStoreSerializer(serializers.ModelSerializer):
+    media_file = SignedMediaField()
+    thumbnails = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = MediaStore
-        fields = ('pk', 'media_file', 'media_type')
+        fields = ('pk', 'media_file', 'media_type', 'thumbnails')
+
+    def get_thumbnails(self, obj):
+        if not is_image(obj.media_type):
+            return None
+        return thumbnail_urls(obj.media_file, obj.thumbnails_ready)
 
 class BugsSerializer(serializers.ModelSerializer):
     found_by_username = serializers.ReadOnlyField(source='found_by.username')
     team_name = serializers.ReadOnlyField(source='team.team_name')
     attachment_list = serializers.SerializerMethodField(read_only=True)
+    canonical_bug = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Bug
-        fields = ('pk', 'title','description','reproduction_steps','found_by','found_by_username','acceptance','team', 'team_name','attachments','attachment_list')
+        fields = ('pk', 'title','description','reproduction_steps','found_by','found_by_username','acceptance','team', 'team_name','attachments','attachment_list','canonical_bug', 'attachment_count', 'watcher_count')
         extra_kwargs = {'attachments': {'write_only': True}}
 
 
+    def create(self, validated_data):
+        attached = bool(validated_data.get('attachments'))                  # popped by ModelSerializer.create
+        instance = super().create(validated_data)
+        if attached:
+            instance.refresh_from_db(fields=['attachment_count'])           # moved in the database by the m2m receiver in tracker.signals
+        return instance
+
+    def update(self, instance, validated_data):
+        attached = 'attachments' in validated_data
+        instance = super().update(instance, validated_data)
+        instance.__dict__.pop('live_attachments', None)                     # attachments may have changed, drop the stale prefetch
+        if attached:
+            instance.refresh_from_db(fields=['attachment_count'])
+        return instance
+
     def get_attachment_list(self, obj):
-        attachments = obj.attachments.all().filter(deleted_at__isnull=True)
+        attachments = getattr(obj, 'live_attachments', None)                 # filled by tracker.selectors.get_bugs_queryset
+        if attachments is None:                                             # instance not loaded through the selector, eg: right after create
+            attachments = obj.attachments.all()
         return MediaStoreSerializer(attachments, many=True).data
 
+    def get_canonical_bug(self, obj):
+        try:
+            return obj.cluster.canonical_id                                 # select_related by tracker.selectors.get_bugs_queryset
+        except BugCluster.DoesNotExist:                                     # not a duplicate and has no duplicates
+            return obj.pk
+
 class MessegesSerializer(serializers.ModelSerializer):
     attachment_list = serializers.SerializerMethodField(read_only=True)
     class Meta:
@@ -53,7 +104,9 @@ class MessegesSerializer(serializers.ModelSerializer):
 
     
     def get_attachment_list(self, obj):
-        attachments = obj.attachments.all().filter(deleted_at__isnull=True)
+        attachments = getattr(obj, 'live_attachments', None)                 # filled by tracker.selectors.live_messages_prefetch
+        if attachments is None:
+            attachments = obj.attachments.all()
         return MediaStoreSerializer(attachments, many=True).data
 
 
@@ -62,10 +115,12 @@ class BugResolutionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = BugResolution
-        fields = ('pk', 'bug', 'assigned_members', 'assigned_remarks','root_cause', 'error_function', 'error_function_owner', 'pull_req_id', 'merge_req_id', 'approved_by', 'end_time', 'messages_list')
+        fields = ('pk', 'bug', 'assigned_members', 'assigned_remarks','root_cause', 'error_function', 'error_function_owner', 'pull_req_id', 'merge_req_id', 'approved_by', 'end_time', 'messages_list', 'message_count', 'attachment_count')
         extra_kwargs = {'comments': {'write_only': True}}
 
     def get_messages_list(self, obj):
-        attachments = Messeges.objects.all().filter(bug_resolution_id=obj).filter(deleted_at__isnull=True)
-        return MessegesSerializer(attachments, many=True).data
+        messages = getattr(obj, 'live_messages', None)                      # filled by tracker.selectors.get_bug_resolutions_queryset
+        if messages is None:                                                # instance not loaded through the selector, eg: right after create
+            messages = Messeges.objects.filter(bug_resolution_id=obj)
+        return MessegesSerializer(messages, many=True).data
 
@@ -0,0 +1,92 @@
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.dispatch import receiver
+
+from tracker.models import Teams, Bug, BugResolution, Messeges, MediaStore
+from tracker.thumbnails import thumbnails_recorded
+from user.models import User
+
+from .cache import team_bug_resolutions_cache
+
+
+# every receiver below bumps the teams whose TeamBugResolutionList output the write changes
+
+M2M_ACTIONS = ('post_add', 'post_remove', 'pre_clear')        # a clear is handled before it happens, the cleared rows are unknown afterwards
+
+
+def teams_of_resolutions(bug_resolution_ids):
+    return BugResolution.all_objects.filter(pk__in=bug_resolution_ids).values_list('bug__team_id', flat=True)
+
+def teams_of_messages(message_ids):
+    return Messeges.all_objects.filter(pk__in=message_ids).values_list('bug_resolution_id__bug__team_id', flat=True)
+
+
+@receiver(post_save, sender=Teams)
+def bump_on_team_save(sender, instance, **kwargs):
+    team_bug_resolutions_cache.bump([instance.pk])
+
+
+@receiver(pre_save, sender=Bug)
+def remember_bug_team(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:                   # a new bug has no resolution yet
+        return
+    instance._previous_team_id = Bug.all_objects.filter(pk=instance.pk).values_list('team_id', flat=True).first()
+
+@receiver(post_save, sender=Bug)
+def bump_on_bug_save(sender, instance, created, raw=False, **kwargs):
+    # only the team of a bug decides where its resolution is listed
+    previous_team_id = instance.__dict__.pop('_previous_team_id', instance.team_id)
+    if not created and previous_team_id != instance.team_id:
+        team_bug_resolutions_cache.bump([previous_team_id, instance.team_id])
+
+
+@receiver(post_save, sender=BugResolution)
+def bump_on_bug_resolution_save(sender, instance, **kwargs):
+    team_bug_resolutions_cache.bump([instance.bug.team_id])         # BugResolution.save has loaded the bug already
+
+
+@receiver(m2m_changed, sender=BugResolution.assigned_members.through)
+def bump_on_assigned_members_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if not reverse:
+        team_bug_resolutions_cache.bump([instance.bug.team_id])
+    elif pk_set:                                        # user.bugresolution_assigned_members.add(...), pk_set holds resolution ids
+        team_bug_resolutions_cache.bump(teams_of_resolutions(pk_set))
+    else:
+        team_bug_resolutions_cache.bump(BugResolution.all_objects.filter(assigned_members=instance).values_list('bug__team_id', flat=True))
+
+
+@receiver(post_save, sender=Messeges)
+def bump_on_message_save(sender, instance, **kwargs):
+    team_bug_resolutions_cache.bump(teams_of_resolutions([instance.bug_resolution_id_id]))
+
+
+@receiver(m2m_changed, sender=Messeges.attachments.through)
+def bump_on_message_attachments_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if not reverse:
+        team_bug_resolutions_cache.bump(teams_of_resolutions([instance.bug_resolution_id_id]))
+    elif pk_set:                                        # media.messeges_attachments.add(...), pk_set holds message ids
+        team_bug_resolutions_cache.bump(teams_of_messages(pk_set))
+    else:
+        team_bug_resolutions_cache.bump(Messeges.all_objects.filter(attachments=instance).values_list('bug_resolution_id__bug__team_id', flat=True))
+
+
+@receiver(post_save, sender=MediaStore)
+def bump_on_media_save(sender, instance, created, **kwargs):
+    if created:                                         # not attached to anything yet
+        return
+    team_bug_resolutions_cache.bump(Messeges.all_objects.filter(attachments=instance).values_list('bug_resolution_id__bug__team_id', flat=True))
+
+
+@receiver(thumbnails_recorded)
+def bump_on_thumbnails_recorded(sender, source_name, **kwargs):
+    team_bug_resolutions_cache.bump(Messeges.all_objects.filter(attachments__media_file=source_name).values_list('bug_resolution_id__bug__team_id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def bump_on_team_leader_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and set(update_fields) == {'last_login'}):    # a login changes nothing that is shown
+        return
+    team_bug_resolutions_cache.bump(Teams.all_objects.filter(team_leader=instance).values_list('id', flat=True))     # team_leader_name
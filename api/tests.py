@@ -1,3 +1,552 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from tracker.membership import team_membership
+from tracker.middlewares import _request
+from tracker.models import Teams, Bug, BugResolution, BugWatch, MediaStore, Messeges
+from tracker.services import bulk_create_bugs
+from tracker.thumbnails import record_thumbnails
+from user.tokens import ClaimsRefreshToken
+
+from .benchmarks import CASES, endpoint_routes, percentile
+from .exports import ThreadedIterator, iter_team_export
+from .loadtest import HTTPConnection, Sample, multipart, summarize
+from .management.commands.loadtest import Command as LoadTestCommand, _int_list, _mix
+from .pagination import KeysetPagination
+
+from django.contrib.auth import get_user_model
+User = get_user_model()
+
+
+def make_user(username, **extra_fields):
+    return User.objects.create_user(username=username, email='%s@example.com' % username, password='secret-password', **extra_fields)
+
+def make_team(team_name, team_leader, auth_user, members=()):
+    team = Teams(team_name=team_name, team_leader=team_leader)
+    team.save(auth_user=auth_user)
+    for member in (team_leader, *members):
+        member.teams.add(team)
+    return team
+
+
+@override_settings(SILK_SAMPLE_RATE=0)
+class ApiTestCase(TestCase):
+    # an admin and a team led by leader with member in it, clients authenticate with the claims tokens of user.tokens
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', is_staff=True, is_superuser=True)
+        cls.leader = make_user('leader', account_type='T')
+        cls.member = make_user('member', account_type='C')
+        cls.outsider = make_user('outsider', account_type='C')
+        cls.team = make_team('Core', cls.leader, cls.admin, members=[cls.member])
+
+    def setUp(self):
+        cache.clear()                       # team response cache versions and entries
+        team_membership.invalidate()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % ClaimsRefreshToken.for_user(user).access_token)
+        return client
+
+
+class SoftDeletedNamesTests(ApiTestCase):
+    def test_name_of_soft_deleted_team_is_still_taken(self):
+        make_team('Retired', self.leader, self.admin).soft_delete(auth_user=self.admin)
+        response = self.client_for(self.admin).post('/api/teams/', {'team_name': 'Retired', 'team_leader': self.leader.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('team_name', response.data)
+
+    def test_soft_deleted_team_is_hidden_from_default_manager(self):
+        team = make_team('Retired', self.leader, self.admin)
+        team.soft_delete(auth_user=self.admin)
+        self.assertFalse(Teams.objects.filter(pk=team.pk).exists())
+        self.assertTrue(Teams.all_objects.filter(pk=team.pk).exists())
+        response = self.client_for(self.admin).get('/api/teams/%d/' % team.pk)
+        self.assertEqual(response.status_code, 404)
+
+
+def make_bug(title, team, auth_user, **fields):
+    bug = Bug(title=title, team=team, found_by=auth_user, **fields)
+    bug.save(auth_user=auth_user)
+    return bug
+
+@contextmanager
+def as_request_user(user):
+    # BugResolution.save saves its bug with the user of the request
+    request = RequestFactory().post('/')
+    request.user = user
+    token = _request.set(request)
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+def make_resolution(bug, auth_user, assigned=()):
+    resolution = BugResolution(bug=bug)
+    with as_request_user(auth_user):
+        resolution.save(auth_user)
+    resolution.assigned_members.add(*assigned)
+    return resolution
+
+def make_message(resolution, auth_user, message='Looking into it', attachments=()):
+    messege = Messeges(message=message, user=auth_user, bug_resolution_id=resolution)
+    messege.save(auth_user=auth_user)
+    messege.attachments.add(*attachments)
+    return messege
+
+
+class SearchTests(ApiTestCase):
+    def test_matches_bugs_and_messages_of_the_users_teams_only(self):
+        bug = make_bug('Login crashes on android', self.team, self.member, description='The app closes after the password is typed')
+        message = make_message(make_resolution(bug, self.leader), self.member, 'Crash reproduced on android 13')
+        other_team = make_team('Other', self.outsider, self.admin)
+        make_bug('Android login crash elsewhere', other_team, self.outsider)
+
+        response = self.client_for(self.member).get('/api/search/', {'q': 'android crash'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['pk'] for row in response.data['bugs']], [bug.pk])
+        self.assertEqual([row['pk'] for row in response.data['messages']], [message.pk])
+        self.assertEqual(response.data['messages'][0]['bug'], bug.pk)
+
+    def test_scopes_and_query_are_validated(self):
+        client = self.client_for(self.member)
+        self.assertEqual(client.get('/api/search/').status_code, 400)
+        self.assertEqual(client.get('/api/search/', {'q': 'crash', 'in': 'teams'}).status_code, 400)
+        self.assertEqual(set(client.get('/api/search/', {'q': 'crash', 'in': 'bugs'}).data), {'bugs'})
+
+
+class BugBulkCreateTests(ApiTestCase):
+    def test_all_created(self):
+        media = MediaStore(media_file='attachments/log.txt', media_type='text/plain')
+        media.save(auth_user=self.member)
+        response = self.client_for(self.member).post('/api/bugs/bulk/', [
+            {'title': 'First', 'team': self.team.pk, 'attachments': [media.pk, media.pk]},
+            {'title': 'Second', 'team': self.team.pk, 'found_by': self.member.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'created'])
+        first = Bug.objects.get(pk=response.data['results'][0]['pk'])
+        self.assertEqual((first.created_by_id, first.modified_by_id), (self.member.pk, self.member.pk))
+        self.assertEqual(first.attachment_count, 1)
+        self.assertEqual(list(first.attachments.values_list('pk', flat=True)), [media.pk])
+
+    def test_partly_created(self):
+        response = self.client_for(self.member).post('/api/bugs/bulk/', [
+            {'title': 'Valid', 'team': self.team.pk},
+            {'title': 'Unknown team', 'team': 0},
+            {'description': 'No title'},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2])
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'error'])
+        self.assertIn('team', results[1]['errors'])
+        self.assertIn('title', results[2]['errors'])
+        self.assertEqual(Bug.objects.filter(title__in=['Valid', 'Unknown team']).count(), 1)
+
+    def test_none_created(self):
+        client = self.client_for(self.member)
+        response = client.post('/api/bugs/bulk/', [{'title': 'Accepted', 'acceptance': True}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['results'][0]['status'], 'error')
+        self.assertEqual(client.post('/api/bugs/bulk/', [], format='json').status_code, 400)
+        self.assertFalse(Bug.objects.exists())
+
+    def test_service_needs_a_user(self):
+        with self.assertRaises(ValueError):
+            bulk_create_bugs([{'title': 'No user'}], auth_user=None)
+
+
+def make_media(auth_user, name='attachments/photo.png', media_type='image/png'):
+    media = MediaStore(media_file=name, media_type=media_type)
+    media.save(auth_user=auth_user)
+    return media
+
+
+class ConditionalGetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.member)
+        self.media = make_media(self.member)
+        self.bug = make_bug('Login crashes', self.team, self.member)
+        self.bug.attachments.add(self.media)
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response
+
+    def test_list_and_detail_are_conditional(self):
+        for url in ('/api/bugs/', '/api/bugs/%d/' % self.bug.pk):
+            first = self.assertRevalidates(url)
+            self.bug.title = 'Login crashes on android'
+            self.bug.save(auth_user=self.member)
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(second.status_code, 200)
+            self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_etag_moves_with_counters_and_thumbnails(self):
+        for url in ('/api/bugs/', '/api/bugs/%d/' % self.bug.pk):
+            etag = self.assertRevalidates(url)['ETag']
+            watch = BugWatch(bug=self.bug, watcher=self.member)
+            watch.save(auth_user=self.member)                        # watcher_count moves with an F() update only
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            record_thumbnails(self.media.media_file.name)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            attachments = response.json()['attachment_list'] if url != '/api/bugs/' else response.json()['results'][0]['attachment_list']
+            self.assertIsNotNone(attachments[0]['thumbnails']['small'])
+            MediaStore.all_objects.filter(pk=self.media.pk).update(thumbnails_ready=False)
+
+    def test_attachments_do_not_multiply_row_aggregates(self):
+        # with its row repeated per attachment, -1 on this bug and +2 on the other one would cancel out
+        self.bug.attachments.add(make_media(self.member, 'attachments/other.png'))
+        other = make_bug('Logout crashes', self.team, self.member)
+        etag = self.assertRevalidates('/api/bugs/')['ETag']
+        Bug.all_objects.filter(pk=self.bug.pk).update(watcher_count=F('watcher_count') - 1)
+        Bug.all_objects.filter(pk=other.pk).update(watcher_count=F('watcher_count') + 2)
+        self.assertEqual(self.client.get('/api/bugs/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class TeamResponseCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = '/api/teams/bugResolution/%d/' % self.team.pk
+        self.media = make_media(self.member)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.resolution = make_resolution(make_bug('Login crashes', self.team, self.member), self.leader, assigned=[self.member])
+            self.message = make_message(self.resolution, self.member, attachments=[self.media])
+
+    def test_entry_is_shared_by_members_and_invalidated_by_writes(self):
+        first = self.client_for(self.member).get(self.url)
+        self.assertEqual((first.status_code, first['X-Cache']), (200, 'MISS'))
+        second = self.client_for(self.leader).get(self.url)
+        self.assertEqual((second['X-Cache'], second.content), ('HIT', first.content))
+        self.assertEqual(self.client_for(self.leader).get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_message(self.resolution, self.leader, 'Fixed on master')
+        third = self.client_for(self.leader).get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((third.status_code, third['X-Cache']), (200, 'MISS'))
+
+    def test_recorded_thumbnails_invalidate_the_entry(self):
+        client = self.client_for(self.member)
+        etag = client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            record_thumbnails(self.media.media_file.name)
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['X-Cache']), (200, 'MISS'))
+        self.assertIn('thumbnails/128x128/', response.content.decode())
+
+    def test_outsiders_get_no_entry(self):
+        self.client_for(self.member).get(self.url)
+        self.assertEqual(self.client_for(self.outsider).get(self.url).status_code, 400)
+
+
+class QueryCountTestCase(ApiTestCase):
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+class BugSerializationQueryTests(QueryCountTestCase):
+    def add_bugs(self, count):
+        for index in range(count):
+            bug = make_bug('Bug %d' % index, self.team, self.member)
+            bug.attachments.add(make_media(self.member, 'attachments/%d-a.png' % index), make_media(self.member, 'attachments/%d-b.txt' % index, 'text/plain'))
+
+    def test_list_queries_do_not_grow_with_the_page(self):
+        client = self.client_for(self.member)
+        self.add_bugs(2)
+        few = self.count_queries(client, '/api/bugs/')
+        self.assertGreater(few, 1)
+        self.add_bugs(8)
+        self.assertEqual(self.count_queries(client, '/api/bugs/'), few)
+        response = client.get('/api/bugs/')
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertEqual(len(response.json()['results'][0]['attachment_list']), 2)
+
+    def test_soft_deleted_attachments_are_left_out(self):
+        bug = make_bug('Login crashes', self.team, self.member)
+        kept, deleted = make_media(self.member, 'attachments/kept.txt'), make_media(self.member, 'attachments/deleted.txt')
+        bug.attachments.add(kept, deleted)
+        deleted.soft_delete(auth_user=self.member)
+        response = self.client_for(self.member).get('/api/bugs/%d/' % bug.pk)
+        self.assertEqual([media['pk'] for media in response.json()['attachment_list']], [kept.pk])
+        self.assertEqual(response.json()['attachment_count'], 1)
+
+
+class BugResolutionTreeQueryTests(QueryCountTestCase):
+    def add_resolutions(self, count):
+        for index in range(count):
+            resolution = make_resolution(make_bug('Bug %d' % index, self.team, self.member), self.leader, assigned=[self.member, self.leader])
+            for message in range(2):
+                make_message(resolution, self.member, 'Message %d' % message, attachments=[make_media(self.member, 'attachments/%d-%d.txt' % (index, message), 'text/plain')])
+
+    def test_list_queries_do_not_grow_with_the_tree(self):
+        client = self.client_for(self.member)
+        self.add_resolutions(2)
+        few = self.count_queries(client, '/api/bugResolution/')
+        self.add_resolutions(6)
+        self.assertEqual(self.count_queries(client, '/api/bugResolution/'), few)
+        results = client.get('/api/bugResolution/').json()['results']
+        self.assertEqual(len(results), 8)
+        self.assertEqual([message['message'] for message in results[0]['messages_list']], ['Message 0', 'Message 1'])
+        self.assertEqual(len(results[0]['messages_list'][0]['attachment_list']), 1)
+
+    def test_soft_deleted_messages_are_left_out(self):
+        resolution = make_resolution(make_bug('Login crashes', self.team, self.member), self.leader)
+        make_message(resolution, self.member, 'Kept')
+        make_message(resolution, self.member, 'Deleted').soft_delete(auth_user=self.member)
+        response = self.client_for(self.member).get('/api/bugResolution/%d/' % resolution.pk)
+        self.assertEqual([message['message'] for message in response.json()['messages_list']], ['Kept'])
+        self.assertEqual(response.json()['message_count'], 1)
+
+    def test_resolutions_of_other_teams_are_hidden(self):
+        other_team = make_team('Other', self.outsider, self.admin)
+        resolution = make_resolution(make_bug('Elsewhere', other_team, self.outsider), self.outsider)
+        client = self.client_for(self.member)
+        self.assertEqual(client.get('/api/bugResolution/').json()['results'], [])
+        self.assertEqual(client.get('/api/bugResolution/%d/' % resolution.pk).status_code, 400)
+
+
+class KeysetPaginationTests(ApiTestCase):
+    def walk(self, client, url):
+        pages, ids = 0, []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['pk'] for row in response.json()['results']]
+            url, pages = response.json()['next'], pages + 1
+        return pages, ids
+
+    def test_pages_follow_created_at_then_id_with_ties(self):
+        teams = [make_team('Team %d' % index, self.leader, self.admin) for index in range(4)]
+        same_time = timezone.now()
+        Teams.all_objects.filter(pk__in=[team.pk for team in teams[1:]]).update(created_at=same_time)   # ties are broken by id
+        expected = list(Teams.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        pages, ids = self.walk(self.client_for(self.member), '/api/teams/?page_size=2')
+        self.assertEqual((pages, ids), (3, expected))
+
+    def test_cursor_round_trip(self):
+        paginator = KeysetPagination()
+        created_at = timezone.now()
+        request = Request(RequestFactory().get('/', {'cursor': paginator.encode_cursor(created_at, 42)}))
+        self.assertEqual(paginator.decode_cursor(request), (created_at, 42))
+
+    def test_invalid_cursor_and_page_size(self):
+        client = self.client_for(self.member)
+        self.assertEqual(client.get('/api/teams/', {'cursor': 'not-a-cursor'}).status_code, 404)
+        self.assertEqual(client.get('/api/bugs/', {'cursor': 'bm90LWEtY3Vyc29y'}).status_code, 404)
+        paginator = KeysetPagination()
+        for value, expected in (('0', 50), ('abc', 50), ('10', 10), ('100000', 500)):
+            self.assertEqual(paginator.get_page_size(Request(RequestFactory().get('/', {'page_size': value}))), expected)
+
+
+class AsyncReadTests(ApiTestCase):
+    def test_reads_need_a_valid_token(self):
+        for client in (APIClient(), APIClient(HTTP_AUTHORIZATION='Bearer not-a-token')):
+            response = client.get('/api/bugs/')
+            self.assertEqual(response.status_code, 401)
+            self.assertTrue(response['WWW-Authenticate'].startswith('Bearer'))
+
+    def test_reads_are_served_async(self):
+        for url in ('/api/bugs/', '/api/bugs/1/', '/api/bugResolution/', '/api/bugResolution/1/', '/api/teams/bugResolution/1/'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func), url)     # the handler awaits it, no sync_to_async
+        bug = make_bug('Async read', self.team, self.member)
+        client = self.client_for(self.member)
+        self.assertEqual([row['pk'] for row in client.get('/api/bugs/').json()['results']], [bug.pk])
+        self.assertEqual(client.get('/api/bugs/%d/' % bug.pk).json()['title'], 'Async read')
+
+    def test_only_malformed_ids_are_not_found(self):
+        client = self.client_for(self.member)
+        for url in ('/api/bugs/0/', '/api/bugs/abc/', '/api/bugResolution/1.5/', '/api/teams/bugResolution/abc/'):
+            self.assertEqual(client.get(url).status_code, 404, url)
+        make_bug('Async read', self.team, self.member)
+        with mock.patch('api.async_views.BugsSerializer', side_effect=ValueError('serializer bug')):
+            with self.assertRaisesMessage(ValueError, 'serializer bug'):                # a bug in the view is not turned into a 404
+                client.get('/api/bugs/')
+
+    def test_writes_go_to_the_drf_views(self):
+        client = self.client_for(self.member)
+        response = client.post('/api/bugs/', {'title': 'Written in a thread', 'team': self.team.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['possible_duplicates'], [])
+        self.assertEqual(Bug.objects.get(title='Written in a thread').created_by, self.member)
+        self.assertEqual(APIClient().post('/api/bugs/', {'title': 'Anonymous'}, format='json').status_code, 401)
+
+
+class TeamExportTests(ApiTestCase):
+    def export(self, client, team):
+        response = client.get('/api/teams/export/%d/' % team.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_streams_the_team_bugs_and_resolutions(self):
+        first, second = make_bug('First', self.team, self.member), make_bug('Second', self.team, self.member)
+        resolution = make_resolution(first, self.leader, assigned=[self.member])
+        make_message(resolution, self.member)
+        make_bug('Elsewhere', make_team('Other', self.outsider, self.admin), self.outsider)
+
+        records = self.export(self.client_for(self.member), self.team)
+        self.assertEqual([(record['type'], record['pk']) for record in records], [
+            ('team', self.team.pk), ('bug', first.pk), ('bug_resolution', resolution.pk), ('bug', second.pk),
+        ])
+        self.assertEqual(len(records[2]['messages_list']), 1)
+
+    def test_output_does_not_depend_on_the_chunk_size(self):
+        for index in range(5):
+            make_bug('Bug %d' % index, self.team, self.member)
+        self.assertEqual(list(iter_team_export(self.team, chunk_size=2)), list(iter_team_export(self.team)))
+
+    def test_only_members_can_export(self):
+        self.assertEqual(self.client_for(self.outsider).get('/api/teams/export/%d/' % self.team.pk).status_code, 400)
+        self.assertEqual(self.client_for(self.member).get('/api/teams/export/0/').status_code, 404)
+
+    def test_threaded_iterator(self):
+        self.assertEqual(list(ThreadedIterator(iter(range(20)), buffer=2)), list(range(20)))
+
+        def failing():
+            yield 1
+            raise ValueError('export failed')
+        with self.assertRaisesMessage(ValueError, 'export failed'):
+            list(ThreadedIterator(failing()))
+
+        lines = ThreadedIterator(iter(range(1000)), buffer=1)
+        lines.close()                                           # the producer stops instead of blocking on the full queue
+        lines.thread.join(timeout=5)
+        self.assertFalse(lines.thread.is_alive())
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_data', teams=2, users_per_team=3, bugs_per_team=5, no_files=True, stdout=StringIO())
+
+    def test_every_route_has_a_case(self):
+        self.assertLessEqual(set(endpoint_routes()), {case.route for case in CASES})
+
+    def test_percentile(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2.5)
+        self.assertAlmostEqual(percentile([1, 2, 3, 4], 0.99), 3.97)
+        self.assertEqual(percentile([5], 0.95), 5)
+
+    def test_command_writes_and_compares_results(self):
+        bugs = Bug.objects.count()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark.json')
+            call_command('benchmark_endpoints', iterations=2, warmup=0, route=['api/bugs/<id>/'], output=output, stdout=StringIO(), stderr=StringIO())
+            with open(output) as file:
+                report = json.load(file)
+            self.assertEqual([(result['method'], result['route']) for result in report['results']], [
+                ('GET', 'api/bugs/<id>/'), ('PATCH', 'api/bugs/<id>/'), ('DELETE', 'api/bugs/<id>/'),
+            ])
+            for result in report['results']:
+                self.assertTrue(all(status < 400 for status in result['status']), result)
+                self.assertGreater(result['queries'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertEqual(report['meta']['dataset']['bugs'], bugs)
+
+            stdout = StringIO()
+            call_command('benchmark_endpoints', iterations=2, warmup=0, route=['api/bugs/<id>/'], output=os.path.join(directory, 'next.json'), compare=output, stdout=stdout, stderr=StringIO())
+            self.assertIn('compared to %s' % output, stdout.getvalue())
+        self.assertEqual(Bug.objects.count(), bugs)                          # the rows created by the requests are rolled back
+
+    def test_iterations_are_validated(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_endpoints', iterations=1, stdout=StringIO())
+
+
+class LoadTestTests(TestCase):
+    def test_summarize(self):
+        samples = [Sample('bug_list', 200, 0.010), Sample('bug_list', 304, 0.030), Sample('bug_detail', 500, 0.020), Sample('login', 0, 0.040)]
+        summary = summarize(samples, elapsed=2)
+        self.assertEqual(summary['overall']['requests'], 4)
+        self.assertEqual(summary['overall']['throughput_rps'], 2)
+        self.assertEqual(summary['overall']['error_rate'], 0.5)                 # failed connections count as errors
+        self.assertEqual(summary['overall']['statuses'], {'0': 1, '200': 1, '304': 1, '500': 1})
+        self.assertEqual(list(summary['actions']), ['bug_detail', 'bug_list', 'login'])
+        self.assertEqual((summary['actions']['bug_list']['p50_ms'], summary['actions']['bug_list']['error_rate']), (20, 0))
+        self.assertIsNone(summarize([], elapsed=1)['overall']['p50_ms'])
+
+    def test_options(self):
+        self.assertEqual(_int_list('1, 5,,10'), [1, 5, 10])
+        self.assertEqual(_mix('bug_list=3,login=1'), {'bug_list': 3.0, 'login': 1.0})
+        with self.assertRaises(ValueError):
+            _mix('drop_tables=1')
+        with self.assertRaises(CommandError):
+            call_command('loadtest', concurrency=[0], stdout=StringIO())
+
+    def test_profiles_of_seeded_users(self):
+        with self.assertRaises(CommandError):
+            LoadTestCommand().profiles({'prefix': 'seed', 'password': 'benchmark', 'users': 5})
+        call_command('seed_data', teams=2, users_per_team=3, bugs_per_team=5, no_files=True, stdout=StringIO())
+        profiles = LoadTestCommand().profiles({'prefix': 'seed', 'password': 'benchmark', 'users': 5})
+        self.assertTrue(0 < len(profiles) <= 5)
+        for profile in profiles:
+            user = User.objects.get(pk=profile.user_id)
+            self.assertEqual(set(BugResolution.objects.filter(pk__in=profile.resolution_ids, assigned_members=user, bug__team_id__in=profile.team_ids).values_list('pk', flat=True)), set(profile.resolution_ids))
+            self.assertEqual(Bug.objects.filter(pk__in=profile.bug_ids).exclude(team_id__in=profile.team_ids).count(), 0)
+
+    def test_multipart(self):
+        content_type, body = multipart({'message': 'Hello'}, {'attachments': ('log.txt', 'text/plain', b'log line')})
+        boundary = content_type.split('boundary=')[1]
+        self.assertTrue(content_type.startswith('multipart/form-data; '))
+        self.assertIn(b'name="message"\r\n\r\nHello\r\n', body)
+        self.assertIn(b'filename="log.txt"\r\nContent-Type: text/plain\r\n\r\nlog line\r\n', body)
+        self.assertTrue(body.endswith(('--%s--\r\n' % boundary).encode()))
+
+    def test_http_connection(self):
+        responses = [
+            b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nfirst',
+            b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nsec\r\n3\r\nond\r\n0\r\n\r\n',
+            b'HTTP/1.1 304 Not Modified\r\n\r\n',
+        ]
+        connections = []
+
+        async def handle(reader, writer):                   # answers one request per connection, then closes it
+            connections.append(writer)
+            headers = (await reader.readuntil(b'\r\n\r\n')).decode().lower()
+            await reader.readexactly(int(headers.split('content-length: ')[1].split('\r\n')[0]))
+            writer.write(responses[len(connections) - 1])
+            await writer.drain()
+            writer.close()
+
+        async def exchange():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            connection = HTTPConnection('127.0.0.1', server.sockets[0].getsockname()[1], timeout=5)
+            try:
+                results = [await connection.request('GET', '/'), await connection.request('POST', '/', body=b'{}'), await connection.request('GET', '/')]
+            finally:
+                await connection.close()
+                server.close()
+                await server.wait_closed()
+            return results
+
+        results = asyncio.run(exchange())
+        self.assertEqual([(status, body) for status, headers, body in results], [(200, b'first'), (200, b'second'), (304, b'')])
+        self.assertEqual(len(connections), 3)                # the connections closed by the server were reopened
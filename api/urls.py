@@ -1,16 +1,20 @@
 from django.urls import path
 
-from . views import TeamsList, TeamsDetail, BugList, BugDetail, BugResolutionList, BugResolutionDetail, MessegeCreate, MessegeDestroy, TeamBugResolutionList, MediaUpload
+from . views import TeamsList, TeamsDetail, MessegeCreate, MessegeDestroy, MediaUpload, TeamExport, BugBulkCreate, Search
+from . async_views import AsyncBugList, AsyncBugDetail, AsyncBugResolutionList, AsyncBugResolutionDetail, AsyncTeamBugResolutionList
 
 urlpatterns = [
 
     path('teams/', TeamsList.as_view()), #OK
     path('teams/<id>/', TeamsDetail.as_view()), #OK
-    path('teams/bugResolution/<id>/', TeamBugResolutionList.as_view()), #OK
-    path('bugs/', BugList.as_view()),
-    path('bugs/<id>/', BugDetail.as_view()),
-    path('bugResolution/', BugResolutionList.as_view()),
-    path('bugResolution/<id>/', BugResolutionDetail.as_view()),
+    path('teams/bugResolution/<id>/', AsyncTeamBugResolutionList.as_view()), #OK
+    path('teams/export/<id>/', TeamExport.as_view()),
+    path('bugs/', AsyncBugList.as_view()),                              # async reads, writes go to the DRF views, see api.async_views
+    path('bugs/bulk/', BugBulkCreate.as_view()),
+    path('bugs/<id>/', AsyncBugDetail.as_view()),
+    path('bugResolution/', AsyncBugResolutionList.as_view()),
+    path('bugResolution/<id>/', AsyncBugResolutionDetail.as_view()),
+    path('search/', Search.as_view()),
     
     path('etc/upload/', MediaUpload.as_view()),
     path('etc/comments/add/', MessegeCreate.as_view()),
@@ -1,27 +1,34 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
 from rest_framework import status, serializers
 from rest_framework.response import Response
 
 from rest_framework import generics
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from user.authentication import ClaimsJWTAuthentication
 
-from tracker.services import add_messege_to_bug_resolution, upload_media_return_id
-from tracker.selectors import get_assigned_team_members, get_team_members, get_team_leader
+from tracker.services import add_messege_to_bug_resolution, upload_media_return_id, bulk_create_bugs
+from tracker.selectors import get_assigned_team_members, get_bugs_queryset, get_bug_resolutions_queryset, get_team_bug_resolutions_queryset, search_bugs, search_messages
+from tracker.duplicates import similar_bugs
 
 from .serializers import TeamsSerializer, BugsSerializer, BugResolutionSerializer
-from tracker.models import Teams, Bug, Messeges, BugResolution
+from tracker.models import Teams, Messeges
 
 from .mixins import SoftDeleteModelMixin
+from .pagination import KeysetPagination
+from .exports import iter_team_export, ThreadedIterator
 
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
 
 class TeamsList(generics.ListCreateAPIView):
-    queryset = Teams.objects.all().filter(deleted_at__isnull=True)
+    queryset = Teams.objects.all()
     serializer_class = TeamsSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+    pagination_class = KeysetPagination
     
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -31,7 +38,7 @@ class TeamsList(generics.ListCreateAPIView):
         return super(TeamsList, self).get_permissions()
 
     def get(self, request, *args, **kwargs):
-        self.queryset = Teams.objects.select_related('team_leader').filter(deleted_at__isnull=True)
+        self.queryset = Teams.objects.select_related('team_leader')
         return super().get(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
@@ -41,44 +48,104 @@ class TeamsList(generics.ListCreateAPIView):
         return super().post(request, *args, **kwargs)
 
 class TeamsDetail(SoftDeleteModelMixin, generics.RetrieveUpdateDestroyAPIView):
-    queryset = Teams.objects.all().filter(deleted_at__isnull=True)
+    queryset = Teams.objects.all()
     serializer_class = TeamsSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     lookup_field = 'id'
 
 class BugList(generics.ListCreateAPIView):
-    queryset = Bug.objects.all().filter(deleted_at__isnull=True)
+    queryset = get_bugs_queryset()
     serializer_class = BugsSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def post(self, request, *args, **kwargs):
         if request.data.get('acceptance') in [True, False]:
             return Response({"error": "Bug entry needs to be created first before updating acceptance"}, status=status.HTTP_400_BAD_REQUEST)
-        return super().post(request, *args, **kwargs)
+        response = super().post(request, *args, **kwargs)
+        response.data['possible_duplicates'] = [                        # likely duplicates in the same team, for the reporter to link or withdraw
+            {'pk': bug.pk, 'title': bug.title, 'similarity': round(similarity, 3)}
+            for bug, similarity in self.possible_duplicates
+        ]
+        return response
+
+    def perform_create(self, serializer):
+        bug = serializer.save()
+        self.possible_duplicates = similar_bugs(bug)
 
     # def get_queryset(self): TODO: find ways to reduce queries
     #     user = self.request.user
-    #     return Bug.objects.filter(Q(found_by=user) | Q(team__team_members=user)).filter(deleted_at__isnull=True)
+    #     return Bug.objects.filter(Q(found_by=user) | Q(team__team_members=user))
+
+
+class BugBulkCreate(generics.GenericAPIView): # create many bugs in one request, eg: from QA automation
+    class InputSerializer(serializers.Serializer):
+        title              = serializers.CharField(max_length=100, required=True)
+        description        = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+        reproduction_steps = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+        found_by           = serializers.IntegerField(required=False, allow_null=True)
+        team               = serializers.IntegerField(required=False, allow_null=True)
+        attachments        = serializers.ListField(child=serializers.IntegerField(), required=False)
+        acceptance         = serializers.BooleanField(required=False, allow_null=True)
+
+        def validate_acceptance(self, value):
+            if value is not None:
+                raise serializers.ValidationError("Bug entry needs to be created first before updating acceptance")
+            return value
+
+    serializer_class = InputSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    max_batch_size = 1000
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list) or request.data == []:
+            return Response({"error": "Expected a non empty list of bugs"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.max_batch_size:
+            return Response({"error": "At most %d bugs can be created per request" % self.max_batch_size}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer()                      # one serializer validates every item, related ids are checked in bulk by the service
+        validated, results = [], []
+        for index, item in enumerate(request.data):
+            try:
+                validated.append((index, serializer.run_validation(item)))
+            except serializers.ValidationError as exc:
+                results.append({"index": index, "status": "error", "errors": exc.detail})
+
+        created = bulk_create_bugs([bug for _, bug in validated], auth_user=request.user)
+        for (index, _), result in zip(validated, created):
+            result['index'] = index
+        results = sorted(results + created, key=lambda result: result['index'])
+
+        created_count = sum(1 for result in results if result['status'] == 'created')
+        if created_count == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created_count == 0:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response({"results": results}, status=response_status)
 
 
 class BugDetail(SoftDeleteModelMixin, generics.RetrieveUpdateDestroyAPIView):
-    queryset = Bug.objects.all().filter(deleted_at__isnull=True)
+    queryset = get_bugs_queryset()
     serializer_class = BugsSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     lookup_field = 'id'
 
 
 class BugResolutionList(generics.ListCreateAPIView):
-    queryset = BugResolution.objects.all().filter(deleted_at__isnull=True)
+    queryset = get_bug_resolutions_queryset()
     serializer_class = BugResolutionSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get(self, request, *args, **kwargs): # only return bug resolutions available to the user
-        self.queryset =  self.queryset.filter(bug__team__team_members=request.user).order_by('-created_at')
+        self.queryset =  self.queryset.filter(bug__team_id__in=request.user.team_ids)             # ordered by the paginator
         return self.list(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
@@ -86,34 +153,32 @@ class BugResolutionList(generics.ListCreateAPIView):
 
 
 class BugResolutionDetail(SoftDeleteModelMixin, generics.RetrieveUpdateDestroyAPIView):
-    queryset = BugResolution.objects.all().filter(deleted_at__isnull=True)
+    queryset = get_bug_resolutions_queryset()
     serializer_class = BugResolutionSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     lookup_field = 'id'
 
     def get(self, request, *args, **kwargs):
-        team_id = self.get_object().bug.team.id
-        if request.user not in get_team_members(team_id):
+        team_id = self.get_object().bug.team_id
+        if not request.user.in_team(team_id):
             return Response({"error": "You are not a member of this team"}, status=status.HTTP_400_BAD_REQUEST)
         return self.retrieve(request, *args, **kwargs)
 
     def put(self, request, *args, **kwargs):
-        team_id = self.get_object().bug.team.id
-        if request.user not in get_assigned_team_members(team_id):
+        if request.user not in get_assigned_team_members(self.get_object().id):
             return Response({"error": "You are not a member of this team"}, status=status.HTTP_400_BAD_REQUEST)
         return self.update(request, *args, **kwargs)
 
     def patch(self, request, *args, **kwargs):
-        team_id = self.get_object().bug.team.id
-        if request.user not in get_assigned_team_members(team_id):
+        if request.user not in get_assigned_team_members(self.get_object().id):
             return Response({"error": "You are not a member of this team"}, status=status.HTTP_400_BAD_REQUEST)
         return self.partial_update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        team_id = instance.bug.team.id
-        if (request.user == get_team_leader(team_id)) or (request.user.is_superuser): # only the teamLeader or superuser can soft delete
+        team_id = instance.bug.team_id
+        if request.user.leads_team(team_id) or request.user.is_superuser: # only the teamLeader or superuser can soft delete
             self.perform_destroy(instance)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_403_FORBIDDEN)
@@ -133,9 +198,9 @@ class MessegeCreate(generics.CreateAPIView):
         user_id           = serializers.IntegerField(required=True)
         bug_resolution_id = serializers.IntegerField(required=True)
 
-    queryset = Messeges.objects.all().filter(deleted_at__isnull=True)
+    queryset = Messeges.objects.all()
     serializer_class = MessegesSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
@@ -143,14 +208,14 @@ class MessegeCreate(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        context = add_messege_to_bug_resolution(**serializer.validated_data, files = request.FILES.getlist("attachments"))
+        context = add_messege_to_bug_resolution(**serializer.validated_data, auth_user = request.user, files = request.FILES.getlist("attachments"))
 
         return Response(context, status = status.HTTP_201_CREATED)
 
 
 class MessegeDestroy(SoftDeleteModelMixin, generics.DestroyAPIView):
-    queryset = Messeges.objects.all().filter(deleted_at__isnull=True)
-    authentication_classes = [JWTAuthentication]
+    queryset = Messeges.objects.all()
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     lookup_field = 'id'
 
@@ -166,33 +231,102 @@ class TeamBugResolutionList(generics.RetrieveAPIView): # get all bug resolution
 
 
         def get_bug_resolution_list(self, obj):
-            team_id = hasattr(obj, 'id')
-            bug_resolution_list = BugResolution.objects.filter(bug__team__id=team_id).filter(deleted_at__isnull=True).order_by('-created_at')
+            bug_resolution_list = self.context.get('bug_resolution_page')         # only one page of the team's resolutions is embedded, paginated by the view
+            if bug_resolution_list is None:
+                bug_resolution_list = get_team_bug_resolutions_queryset(obj.id)
             return BugResolutionSerializer(bug_resolution_list, many=True).data
 
 
-    queryset = Teams.objects.all().filter(deleted_at__isnull=True)
+    queryset = Teams.objects.all()
     serializer_class = TeamBugResolutionSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     lookup_field = 'id'
 
     def get(self, request, *args, **kwargs):
         team_id = self.get_object().id
-        if request.user not in get_team_members(team_id):
+        if not request.user.in_team(team_id):
             return Response({"error": "You are not a member of this team"}, status=status.HTTP_400_BAD_REQUEST)
         return self.retrieve(request, *args, **kwargs)
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        context = self.get_serializer_context()
+        context['bug_resolution_page'] = self.paginate_queryset(get_team_bug_resolutions_queryset(instance.id))
+        serializer = self.get_serializer(instance, context=context)
+        data = serializer.data
+        data['bug_resolution_next'] = self.paginator.get_next_link()      # cursor for the next page of bug_resolution_list
+        return Response(data)
+
+
+class Search(generics.GenericAPIView): # full text search over the bugs and comments of the user's teams
+    class BugSearchSerializer(BugsSerializer):
+        rank = serializers.FloatField(read_only=True)
+
+        class Meta(BugsSerializer.Meta):
+            fields = BugsSerializer.Meta.fields + ('rank',)
+
+    class MessegeSearchSerializer(serializers.ModelSerializer):
+        bug = serializers.ReadOnlyField(source='bug_resolution_id.bug_id')
+        rank = serializers.FloatField(read_only=True)
+
+        class Meta:
+            model = Messeges
+            fields = ('pk', 'message', 'user', 'bug_resolution_id', 'bug', 'rank')
+
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
+    scopes = ('bugs', 'messages')
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Query parameter q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        scopes = request.query_params.get('in', ','.join(self.scopes)).split(',')
+        if not set(scopes) <= set(self.scopes):
+            return Response({"error": "in must be a comma separated subset of %s" % ', '.join(self.scopes)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+
+        data = {}
+        if 'bugs' in scopes:                                    # best matches only, ranked results have no stable cursor
+            data['bugs'] = self.BugSearchSerializer(search_bugs(query, request.user.team_ids)[:limit], many=True).data
+        if 'messages' in scopes:
+            data['messages'] = self.MessegeSearchSerializer(search_messages(query, request.user.team_ids)[:limit], many=True).data
+        return Response(data)
+
 
 class MediaUpload(generics.CreateAPIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
         files = request.FILES.getlist("attachment")
-        if files is None or files == '' or files is []:
+        if not files:
             return Response({'response': 'ERROR: No Files Received'}, status=status.HTTP_400_BAD_REQUEST)
-        context = upload_media_return_id(files=files)
+        context = upload_media_return_id(files=files, auth_user=request.user)
     
         return Response(context, status = status.HTTP_201_CREATED)
 
+
+class TeamExport(generics.RetrieveAPIView): # stream a team's bugs, resolutions, messages and attachments as ndjson
+    queryset = Teams.objects.select_related('team_leader')
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'id'
+
+    def get(self, request, *args, **kwargs):
+        team = self.get_object()
+        if not request.user.in_team(team.id):
+            return Response({"error": "You are not a member of this team"}, status=status.HTTP_400_BAD_REQUEST)
+        lines = iter_team_export(team)
+        if isinstance(request._request, ASGIRequest):
+            lines = ThreadedIterator(lines)
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="team-%s.ndjson"' % team.id
+        return response
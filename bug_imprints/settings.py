@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -27,7 +27,7 @@ SECRET_KEY = config('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', default=False, cast=bool)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='', cast=Csv())
 
 
 # Application definition
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'silk',
@@ -48,15 +49,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tracker.middlewares.MetricsMiddleware',
+    'tracker.middlewares.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'tracker.middlewares.StaticFilesMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'silk.middleware.SilkyMiddleware',
+    'tracker.profiling.SampledSilkyMiddleware',
     'tracker.middlewares.RequestMiddleware',
 ]
 
@@ -82,7 +85,7 @@ WSGI_APPLICATION = 'bug_imprints.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.ClaimsJWTAuthentication',
     )
 }
 
@@ -109,7 +112,9 @@ SIMPLE_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-    'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
+    'TOKEN_USER_CLASS': 'user.authentication.ClaimsUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'user.tokens.ClaimsTokenObtainPairSerializer',       # tokens carry the claims read by user.authentication
+    'TOKEN_REFRESH_SERIALIZER': 'user.tokens.ClaimsTokenRefreshSerializer',
 
     'JTI_CLAIM': 'jti',
 
@@ -140,6 +145,24 @@ DATABASES = {
     }
 }
 
+# read replicas, comma separated host[:port][/name], missing parts are the primary's, eg: replica-1,replica-2:5433
+# locally a copy of the database stands in for one: createdb -T <DB_NAME> <DB_NAME>_replica, then DB_REPLICAS=/<DB_NAME>_replica
+DATABASE_REPLICAS = []
+for index, replica in enumerate(config('DB_REPLICAS', default='', cast=Csv())):
+    address, _, name = replica.partition('/')
+    host, _, port = address.partition(':')
+    DATABASES['replica_%d' % index] = {
+        **DATABASES['default'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append('replica_%d' % index)
+
+DATABASE_ROUTERS = ['tracker.routers.PrimaryReplicaRouter']
+DB_READ_YOUR_WRITES_WINDOW = config('DB_READ_YOUR_WRITES_WINDOW', default=5, cast=float)     # seconds a client that wrote reads from the primary
+
 
 
 # Password validation
@@ -184,9 +207,39 @@ MEDIA_URL = '/media/'
 
 STATIC_ROOT = Path.joinpath(BASE_DIR, "..",  "WWW", "staticfiles")
 MEDIA_ROOT = Path.joinpath(BASE_DIR, "..",  "WWW", "mediafiles")
+# with several worker processes the default cache has to be shared (eg: django.core.cache.backends.redis.RedisCache),
+# api.cache.TeamResponseCache keeps its version counters there
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+TEAM_RESPONSE_CACHE = 'default'
+TEAM_RESPONSE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# silk profiles a sample of the requests, written in batches by a background thread, see tracker.profiling
+SILKY_MIDDLEWARE_CLASS = 'tracker.profiling.SampledSilkyMiddleware'
+SILK_SAMPLE_RATE = config('SILK_SAMPLE_RATE', default=1.0 if DEBUG else 0.01, cast=float)
+SILK_SLOW_REQUEST_THRESHOLD = config('SILK_SLOW_REQUEST_THRESHOLD', default=None, cast=lambda value: None if value in (None, '') else float(value))
+SILK_ROUTES = config('SILK_ROUTES', default='', cast=Csv())          # eg: api/bugs/,api/bugs/<id>/
+SILK_FLUSH_INTERVAL = 5
+SILK_FLUSH_BATCH_SIZE = 100
+SILK_BUFFER_SIZE = 1000
+
+# /metrics asks for 'Authorization: Bearer <METRICS_TOKEN>' (bearer_token in the prometheus scrape config), it is a 404 without a token unless DEBUG is on
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+MEDIA_URL_TTL = 3600                                            # seconds a signed media url stays valid
+MEDIA_ACCEL = config('MEDIA_ACCEL', default='')                 # '' serves media from django, 'nginx' uses X-Accel-Redirect, 'sendfile' uses X-Sendfile
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')  # nginx internal location aliased to MEDIA_ROOT
 STATICFILES_LOCATION = 'static'
 MEDIAFILES_LOCATION = 'media'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
+FILE_UPLOAD_HANDLERS = [                                        # same as django's defaults, plus a sha256 of each file for media deduplication
+    'tracker.uploadhandlers.HashingMemoryFileUploadHandler',
+    'tracker.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
 WHITENOISE_MANIFEST_STRICT = False
 
 # Default primary key field type
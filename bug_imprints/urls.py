@@ -3,16 +3,18 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from tracker.views import serve_media, metrics
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('user.urls')),
     path('api/', include('api.urls')),
     path('test/', include('tracker.urls')),
+    path(settings.MEDIA_URL.lstrip('/') + '<path:name>', serve_media),    # signed / permission checked, see tracker.views.serve_media
+    path('metrics', metrics),                                               # prometheus, see tracker.metrics
 ]
 
-urlpatterns += static(settings.MEDIA_URL,
-                              document_root=settings.MEDIA_ROOT)
 urlpatterns += static(settings.STATIC_URL,
                               document_root=settings.STATIC_ROOT)
 
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class TrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tracker'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from .metrics import install_query_recorder
+        from .routers import install_write_recorder
+        connection_created.connect(install_query_recorder)
+        connection_created.connect(install_write_recorder)
@@ -0,0 +1,57 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, group):
+    # rows of queryset per outer row, 0 when there are none
+    return Coalesce(Subquery(queryset.order_by().values(group).annotate(count=Count('*')).values('count')), Value(0))
+
+def counter_expressions(get_model=apps.get_model):
+    # {model name: {counter field: its true value}}, base managers only so migrations can pass their historical models
+    Bug = get_model('tracker', 'Bug')
+    BugResolution = get_model('tracker', 'BugResolution')
+    BugWatch = get_model('tracker', 'BugWatch')
+    Messeges = get_model('tracker', 'Messeges')
+    return {
+        'Teams': {
+            'open_resolution_count': _count(BugResolution._base_manager.filter(bug__team_id=OuterRef('pk'), deleted_at__isnull=True, end_time__isnull=True), 'bug__team_id'),
+        },
+        'Bug': {
+            'attachment_count': _count(Bug.attachments.through._base_manager.filter(bug_id=OuterRef('pk'), mediastore__deleted_at__isnull=True), 'bug_id'),
+            'watcher_count': _count(BugWatch._base_manager.filter(bug_id=OuterRef('pk'), deleted_at__isnull=True), 'bug_id'),
+        },
+        'BugResolution': {
+            'message_count': _count(Messeges._base_manager.filter(bug_resolution_id=OuterRef('pk'), deleted_at__isnull=True), 'bug_resolution_id'),
+            'attachment_count': _count(Messeges.attachments.through._base_manager.filter(
+                messeges__bug_resolution_id=OuterRef('pk'), messeges__deleted_at__isnull=True, mediastore__deleted_at__isnull=True,
+            ), 'messeges__bug_resolution_id'),
+        },
+    }
+
+
+def reconcile_counters(get_model=apps.get_model, batch_size=1000, models=None):
+    # recomputes the counters in batches by primary key and fixes the drifted ones, returns {model name: rows corrected}
+    corrected = {}
+    for name, counters in counter_expressions(get_model).items():
+        if models and name not in models:
+            continue
+        model = get_model('tracker', name)
+        fields = list(counters)
+        corrected[name] = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():                          # locked before counting, a concurrent F() update waits for the batch
+                pks = list(model._base_manager.filter(pk__gt=last_pk).order_by('pk').select_for_update().values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                last_pk = pks[-1]
+                rows = model._base_manager.filter(pk__in=pks).annotate(**{'true_' + field: expression for field, expression in counters.items()})
+                stale = []
+                for row in rows.values('pk', *fields, *['true_' + field for field in fields]):
+                    if any(row[field] != row['true_' + field] for field in fields):
+                        stale.append(model(pk=row['pk'], **{field: row['true_' + field] for field in fields}))
+                model._base_manager.bulk_update(stale, fields)
+                corrected[name] += len(stale)
+    return corrected
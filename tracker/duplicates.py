@@ -0,0 +1,191 @@
+import hashlib
+import re
+import struct
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Bug, BugCluster, BugDuplicate, BugSignature, BugSignatureBand
+
+
+# 32 bands of 4 rows: a pair with 0.5 jaccard similarity shares a band 87% of the time, a pair with 0.2 only 5% of the time
+NUM_BANDS = 32
+BAND_ROWS = 4
+NUM_PERM = NUM_BANDS * BAND_ROWS
+CANDIDATE_LIMIT = 200               # candidates compared on full signatures, the rest are dropped by shared band count
+MIN_SIMILARITY = 0.3
+SIMILAR_BUGS_COUNT = 5              # overridable with settings.SIMILAR_BUGS_COUNT
+
+# each salt yields 16 independent 32 bit hashes of a shingle, the salts are fixed so stored signatures stay comparable
+_SALTS = [index.to_bytes(16, 'little') for index in range(NUM_PERM // 16)]
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def shingles(title, description=None, reproduction_steps=None):
+    # words and word bigrams, bigrams keep some order while single words tolerate rephrasing
+    tokens = _TOKEN_RE.findall(' '.join(text for text in (title, description, reproduction_steps) if text).lower())
+    return set(tokens) | {tokens[i] + ' ' + tokens[i + 1] for i in range(len(tokens) - 1)}
+
+def _shingle_hashes(shingle):
+    data = shingle.encode()
+    return struct.unpack('<%dI' % NUM_PERM, b''.join(hashlib.blake2b(data, digest_size=64, salt=salt).digest() for salt in _SALTS))
+
+def minhash_signature(shingle_set):
+    """Returns NUM_PERM minimum hash values of the shingles, None for a bug without text."""
+    if not shingle_set:
+        return None
+    return list(map(min, zip(*map(_shingle_hashes, shingle_set))))     # hashing and minimums run in C, about 1ms for a long bug
+
+def band_buckets(signature):
+    # one signed 64 bit bucket per band, so it fits a BigIntegerField
+    buckets = []
+    for band in range(NUM_BANDS):
+        rows = struct.pack('<%dI' % BAND_ROWS, *signature[band * BAND_ROWS:(band + 1) * BAND_ROWS])
+        buckets.append(int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), 'little', signed=True))
+    return buckets
+
+def pack_signature(signature):
+    return struct.pack('<%dI' % NUM_PERM, *signature)
+
+def unpack_signature(data):
+    return struct.unpack('<%dI' % NUM_PERM, bytes(data))
+
+def estimated_similarity(signature, other):
+    return sum(1 for a, b in zip(signature, other) if a == b) / NUM_PERM
+
+def bug_signature(bug: Bug):
+    return minhash_signature(shingles(bug.title, bug.description, bug.reproduction_steps))
+
+
+def index_bugs(bugs):
+    """
+    Replaces the signature and bands of each bug whose text or team changed, with one bulk insert per table for the whole list.
+    Soft deleted bugs and bugs without text are only removed from the index.
+    """
+    bugs = list(bugs)
+    if not bugs:
+        return
+    stored = {
+        bug_id: (bytes(signature), team_id)
+        for bug_id, signature, team_id in BugSignature.objects.filter(bug_id__in=[bug.pk for bug in bugs]).values_list('bug_id', 'signature', 'team_id')
+    }
+    changed, signatures, bands = [], [], []
+    for bug in bugs:
+        signature = bug_signature(bug) if bug.deleted_at is None else None
+        packed = pack_signature(signature) if signature is not None else None
+        if (packed is None and bug.pk not in stored) or stored.get(bug.pk) == (packed, bug.team_id):
+            continue                                            # eg: only acceptance changed, the index is already current
+        changed.append(bug.pk)
+        if packed is None:
+            continue
+        signatures.append(BugSignature(bug_id=bug.pk, team_id=bug.team_id, signature=packed))
+        bands.extend(
+            BugSignatureBand(bug_id=bug.pk, team_id=bug.team_id, band=band, bucket=bucket)
+            for band, bucket in enumerate(band_buckets(signature))
+        )
+    if not changed:
+        return
+    with transaction.atomic():
+        BugSignatureBand.objects.filter(bug_id__in=changed).delete()
+        BugSignature.objects.filter(bug_id__in=changed).delete()
+        BugSignature.objects.bulk_create(signatures)
+        BugSignatureBand.objects.bulk_create(bands)
+
+def index_bug(bug: Bug):
+    index_bugs([bug])
+
+
+def similar_bugs(bug: Bug, count=None):
+    """
+    Returns up to count (bug, similarity) of live bugs in the same team that are likely duplicates of bug, best first.
+    Candidates come from the band index, so the cost depends on the number of bugs sharing a bucket, not the size of the team.
+    """
+    if count is None:
+        count = getattr(settings, 'SIMILAR_BUGS_COUNT', SIMILAR_BUGS_COUNT)
+    signature = bug_signature(bug)
+    if signature is None or bug.team_id is None:
+        return []
+
+    buckets = band_buckets(signature)
+    candidate_bands = BugSignatureBand.objects.filter(team_id=bug.team_id, bucket__in=buckets).exclude(bug_id=bug.pk).values_list('bug_id', 'band', 'bucket')
+    shared = Counter(bug_id for bug_id, band, bucket in candidate_bands if buckets[band] == bucket)    # a bucket only counts in its own band
+    candidate_ids = [bug_id for bug_id, _ in shared.most_common(CANDIDATE_LIMIT)]
+    if not candidate_ids:
+        return []
+
+    scored = []
+    for bug_id, data in BugSignature.objects.filter(bug_id__in=candidate_ids).values_list('bug_id', 'signature'):
+        similarity = estimated_similarity(signature, unpack_signature(data))
+        if similarity >= MIN_SIMILARITY:
+            scored.append((similarity, bug_id))
+    scored = sorted(scored, reverse=True)[:count]
+    bugs = Bug.objects.in_bulk([bug_id for _, bug_id in scored])     # the alive manager drops bugs deleted since they were indexed
+    return [(bugs[bug_id], similarity) for similarity, bug_id in scored if bug_id in bugs]
+
+
+def link_duplicate(parent_id, child_id):
+    """
+    Merges the clusters of parent and child once a BugDuplicate is created, the canonical bug of the parent's cluster wins.
+    Only the rows of the child's cluster are rewritten, with one update.
+    """
+    with transaction.atomic():
+        canonical = dict(BugCluster.objects.select_for_update().filter(bug_id__in=[parent_id, child_id]).values_list('bug_id', 'canonical_id'))
+        parent_root = canonical.get(parent_id, parent_id)
+        child_root = canonical.get(child_id, child_id)
+        if parent_root == child_root:
+            return
+        if child_id in canonical:
+            BugCluster.objects.filter(canonical_id=child_root).update(canonical_id=parent_root)
+        new_rows = [BugCluster(bug_id=bug_id, canonical_id=parent_root) for bug_id in (parent_id, child_id) if bug_id not in canonical]
+        BugCluster.objects.bulk_create(new_rows)
+
+def resolve_clusters(edges):
+    """
+    Union find over (parent_id, child_id) edges applied in order, with the same rule as link_duplicate.
+    Returns {bug id: canonical bug id} for every bug of an edge.
+    """
+    roots = {}
+
+    def find(bug_id):
+        root = bug_id
+        while roots.get(root, root) != root:
+            root = roots[root]
+        while bug_id != root:                               # path compression
+            roots[bug_id], bug_id = root, roots[bug_id]
+        return root
+
+    for parent_id, child_id in edges:
+        roots.setdefault(parent_id, parent_id)
+        roots.setdefault(child_id, child_id)
+        parent_root, child_root = find(parent_id), find(child_id)
+        if parent_root != child_root:
+            roots[child_root] = parent_root
+    return {bug_id: find(bug_id) for bug_id in roots}
+
+def rebuild_clusters(bug_ids):
+    """
+    Recomputes the clusters of bug_ids from their live BugDuplicate rows, replayed in creation order.
+    Needed when a link is soft deleted or changed, a cluster may split. The cost is bounded by the size of the clusters involved.
+    """
+    with transaction.atomic():
+        members = set(bug_ids)
+        while True:                                         # a re-pointed link can reach into another cluster, take that one in too
+            roots = BugCluster.objects.filter(bug_id__in=members).values_list('canonical_id', flat=True)
+            members |= set(BugCluster.objects.select_for_update().filter(canonical_id__in=list(roots)).values_list('bug_id', flat=True))
+            edges = list(BugDuplicate.objects.filter(Q(parent_id__in=members) | Q(child_id__in=members)).order_by('id').values_list('parent_id', 'child_id'))
+            reached = members.union(*edges)
+            if reached == members:
+                break
+            members = reached
+        canonical = resolve_clusters(edges)
+        BugCluster.objects.filter(bug_id__in=members).delete()
+        BugCluster.objects.bulk_create([BugCluster(bug_id=bug_id, canonical_id=root) for bug_id, root in canonical.items()])
+
+def cluster_members(bug: Bug):
+    """Live bugs of bug's duplicate cluster, the canonical bug included, or only bug itself when it has no duplicates."""
+    canonical_id = BugCluster.objects.filter(bug_id=bug.pk).values_list('canonical_id', flat=True).first()
+    if canonical_id is None:
+        return Bug.objects.filter(pk=bug.pk)
+    return Bug.objects.filter(cluster__canonical_id=canonical_id)
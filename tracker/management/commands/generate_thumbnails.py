@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from tracker.models import MediaStore
+from tracker.thumbnails import generate_thumbnails, record_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates the missing thumbnails of image attachments and user icons and records them on their rows. '
+        'Run it once for media uploaded before thumbnails were recorded, reads never generate them.'
+    )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        names = list(MediaStore.all_objects.filter(thumbnails_ready=False, media_type__startswith='image/').order_by().values_list('media_file', flat=True).distinct())
+        names += User.all_objects.exclude(icon='').exclude(icon__isnull=True).exclude(icon_thumbnails_for=F('icon')).values_list('icon', flat=True)
+        failed = 0
+        for name in names:
+            try:
+                generate_thumbnails(name)                       # sizes already stored are skipped
+            except Exception as exc:
+                failed += 1
+                self.stderr.write('%s: %s' % (name, exc))
+                continue
+            record_thumbnails(name)
+        self.stdout.write(self.style.SUCCESS('Thumbnails of %d files recorded, %d failed' % (len(names) - failed, failed)))
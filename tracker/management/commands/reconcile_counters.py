@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tracker.counters import counter_expressions, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the counter columns (Teams.open_resolution_count, Bug.attachment_count and watcher_count, '
+        'BugResolution.message_count and attachment_count) from the rows they count, in batches, and fixes the ones that drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', choices=sorted(counter_expressions()), help='only the counters of this model, can be repeated')
+        parser.add_argument('--batch-size', type=int, default=1000, help='rows locked and counted per transaction')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        corrected = reconcile_counters(batch_size=options['batch_size'], models=options['model'])
+        for name, count in corrected.items():
+            self.stdout.write('%-14s %d rows corrected' % (name, count))
+        self.stdout.write(self.style.SUCCESS('Reconciled in %.1fs' % (time.monotonic() - started)))
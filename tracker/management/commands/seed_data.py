@@ -0,0 +1,159 @@
+import hashlib
+import random
+import time
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from PIL import Image
+
+from tracker.counters import reconcile_counters
+from tracker.duplicates import index_bugs
+from tracker.models import Teams, Bug, BugResolution, BugWatch, MediaStore, Messeges
+from user.models import User
+
+
+COMPONENTS = ['login', 'signup', 'dashboard', 'profile', 'settings', 'search', 'checkout', 'cart', 'notifications', 'export',
+              'upload', 'comments', 'billing', 'reports', 'calendar', 'chat', 'admin panel', 'api gateway', 'mobile app', 'sync']
+SYMPTOMS = ['crashes', 'hangs', 'shows a blank page', 'returns a 500 error', 'times out', 'loses unsaved changes', 'renders twice',
+            'shows stale data', 'ignores the filter', 'logs the user out', 'duplicates the entry', 'freezes on scroll']
+TRIGGERS = ['after an update', 'on slow networks', 'with a long name', 'when the session expires', 'on the second click',
+            'with unicode input', 'in dark mode', 'on android', 'on safari', 'with an empty list', 'after a password reset']
+REMARKS = ['Looking into it.', 'Reproduced on staging.', 'Could not reproduce, need logs.', 'Fix is up for review.',
+           'Root cause found in the cache layer.', 'Waiting on the api team.', 'Deployed the fix, please verify.', 'Closing after verification.']
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a synthetic dataset with bulk_create: teams, users, bugs, resolutions, comments, attachments and watchers. '
+        'Users share --password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teams', type=int, default=10)
+        parser.add_argument('--users-per-team', type=int, default=10, help='the first user of a team leads it')
+        parser.add_argument('--bugs-per-team', type=int, default=200)
+        parser.add_argument('--resolved-ratio', type=float, default=0.6, help='fraction of the bugs with a resolution')
+        parser.add_argument('--messages-per-resolution', type=int, default=5)
+        parser.add_argument('--attachments-per-bug', type=int, default=1)
+        parser.add_argument('--message-attachment-ratio', type=float, default=0.2, help='fraction of the comments with an attachment')
+        parser.add_argument('--watchers-per-bug', type=int, default=2)
+        parser.add_argument('--no-files', action='store_true', help='attachment rows only, without writing their images to the media storage')
+        parser.add_argument('--prefix', default='seed', help='names of the seeded teams and users start with it, use another one to seed again')
+        parser.add_argument('--password', default='benchmark')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0, help='random seed, the same arguments give the same dataset')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.all_objects.filter(username__startswith=prefix + '-').exists():
+            raise CommandError('Users prefixed "%s-" already exist, pass another --prefix' % prefix)
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+        with transaction.atomic():
+            counts = self.seed(prefix, options)
+        for name, count in counts.items():
+            self.stdout.write('%-12s %d' % (name, count))
+        self.stdout.write(self.style.SUCCESS('Seeded in %.1fs, users log in with "%s"' % (time.monotonic() - started, options['password'])))
+
+    def seed(self, prefix, options):
+        rng = self.rng
+        password = make_password(options['password'])             # hashed once, the hasher is slow on purpose
+
+        admin = User(username='%s-admin' % prefix, email='%s-admin@example.com' % prefix, password=password, account_type='S', is_staff=True, is_superuser=True)
+        users = [admin] + [
+            User(username='%s-t%d-u%d' % (prefix, team, member), email='%s-t%d-u%d@example.com' % (prefix, team, member),
+                 password=password, account_type='T' if member == 0 else rng.choice('CW'))
+            for team in range(options['teams']) for member in range(options['users_per_team'])
+        ]
+        users = User.objects.bulk_create(users, batch_size=self.batch_size)
+        members_of = [users[1 + team * options['users_per_team']:1 + (team + 1) * options['users_per_team']] for team in range(options['teams'])]
+        members_of = [members for members in members_of if members]
+
+        teams = Teams.objects.bulk_create([
+            Teams(team_name='%s team %d' % (prefix, index), team_leader=members[0], created_by=admin, modified_by=admin)
+            for index, members in enumerate(members_of)
+        ], batch_size=self.batch_size)
+        User.teams.through.objects.bulk_create([
+            User.teams.through(user_id=user.id, teams_id=team.id) for team, members in zip(teams, members_of) for user in members
+        ], batch_size=self.batch_size)
+
+        bugs, bug_members = [], []
+        for team, members in zip(teams, members_of):
+            for _ in range(options['bugs_per_team']):
+                reporter = rng.choice(members)
+                component, symptom, trigger = rng.choice(COMPONENTS), rng.choice(SYMPTOMS), rng.choice(TRIGGERS)
+                resolved = rng.random() < options['resolved_ratio']
+                bugs.append(Bug(
+                    title=('%s %s %s' % (component, symptom, trigger))[:100].capitalize(),
+                    description='The %s %s %s. %s' % (component, symptom, trigger, 'It happens every time.' if rng.random() < 0.5 else 'It happens now and then.'),
+                    reproduction_steps='1. Open the %s\n2. %s\n3. Observe that it %s' % (component, trigger.capitalize(), symptom),
+                    found_by=reporter, team=team, acceptance=True if resolved else rng.choice([None, None, False]),
+                    created_by=reporter, modified_by=reporter,
+                ))
+                bug_members.append(members)
+        bugs = Bug.objects.bulk_create(bugs, batch_size=self.batch_size)
+
+        media = []
+        def new_media(owner):
+            media.append(MediaStore(media_file='attachments/%s/%d.png' % (prefix, len(media)), media_type='image/png', created_by=owner, modified_by=owner))
+            return media[-1]
+
+        bug_attachments = [(bug, new_media(bug.found_by)) for bug in bugs for _ in range(options['attachments_per_bug'])]
+
+        resolved = [(bug, members) for bug, members in zip(bugs, bug_members) if bug.acceptance]
+        resolutions = BugResolution.objects.bulk_create([
+            BugResolution(bug=bug, assigned_remarks=rng.choice(REMARKS), created_by=members[0], modified_by=members[0])
+            for bug, members in resolved
+        ], batch_size=self.batch_size)
+        BugResolution.assigned_members.through.objects.bulk_create([
+            BugResolution.assigned_members.through(bugresolution_id=resolution.id, user_id=user.id)
+            for resolution, (_, members) in zip(resolutions, resolved)
+            for user in rng.sample(members, min(len(members), rng.randint(1, 3)))
+        ], batch_size=self.batch_size)
+
+        messages, message_attachments = [], []
+        for resolution, (_, members) in zip(resolutions, resolved):
+            for _ in range(options['messages_per_resolution']):
+                author = rng.choice(members)
+                messages.append(Messeges(message=rng.choice(REMARKS), user=author, bug_resolution_id=resolution, created_by=author, modified_by=author))
+                if rng.random() < options['message_attachment_ratio']:
+                    message_attachments.append((messages[-1], new_media(author)))
+        messages = Messeges.objects.bulk_create(messages, batch_size=self.batch_size)
+        if not options['no_files']:
+            self.write_images(media)
+        MediaStore.objects.bulk_create(media, batch_size=self.batch_size)
+        Bug.attachments.through.objects.bulk_create([
+            Bug.attachments.through(bug_id=bug.id, mediastore_id=item.id) for bug, item in bug_attachments
+        ], batch_size=self.batch_size)
+        Messeges.attachments.through.objects.bulk_create([
+            Messeges.attachments.through(messeges_id=message.id, mediastore_id=item.id) for message, item in message_attachments
+        ], batch_size=self.batch_size)
+
+        watches = BugWatch.objects.bulk_create([
+            BugWatch(bug=bug, watcher=user, created_by=user, modified_by=user)
+            for bug, members in zip(bugs, bug_members)
+            for user in rng.sample(members, min(len(members), options['watchers_per_bug']))
+        ], batch_size=self.batch_size)
+
+        for start in range(0, len(bugs), self.batch_size):      # bulk_create sends no post_save, the duplicate index is built here
+            index_bugs(bugs[start:start + self.batch_size])
+        reconcile_counters(batch_size=self.batch_size)         # nor do the counter updates run, they are counted once here
+        return {
+            'users': len(users), 'teams': len(teams), 'bugs': len(bugs), 'resolutions': len(resolutions),
+            'messages': len(messages), 'attachments': len(media), 'watchers': len(watches),
+        }
+
+    def write_images(self, media):
+        # small distinct pngs, so thumbnails and content hashes behave as for real uploads
+        for index, item in enumerate(media):
+            image = Image.new('RGB', (64, 48), (index % 256, index // 256 % 256, index // 65536 % 256))
+            data = BytesIO()
+            image.save(data, 'PNG')
+            item.content_hash = hashlib.sha256(data.getvalue()).hexdigest()
+            item.media_file = default_storage.save(item.media_file.name, ContentFile(data.getvalue()))
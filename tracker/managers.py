@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class AliveManagerMixin:
+    # hides soft deleted rows, the all_objects manager of the model includes them
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class AliveManager(AliveManagerMixin, models.Manager):
+    pass
@@ -0,0 +1,89 @@
+import hashlib
+import hmac
+import math
+import posixpath
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils.crypto import salted_hmac
+
+from .models import MediaStore, Teams
+
+
+MEDIA_URL_TTL = 3600                # seconds a signed media url stays valid, overridable with settings.MEDIA_URL_TTL
+MEDIA_PERMISSION_TTL = 300          # seconds a permission decision for an unsigned request is cached
+_SIGNING_SALT = 'tracker.media.signed_url'
+
+
+def get_media_url_ttl():
+    return getattr(settings, 'MEDIA_URL_TTL', MEDIA_URL_TTL)
+
+def _signature(name, expires):
+    return salted_hmac(_SIGNING_SALT, '%s:%d' % (name, expires), algorithm='sha256').hexdigest()
+
+def signed_url_expiry():
+    # rounded up to half a ttl so the same file keeps the same url for a while and stays cacheable by clients
+    ttl = get_media_url_ttl()
+    step = max(ttl // 2, 1)
+    return int(math.ceil((time.time() + ttl) / step) * step)
+
+def signed_media_url(name, storage=None):
+    """Url of a stored file, signed and valid for at least MEDIA_URL_TTL seconds."""
+    if not name:
+        return None
+    storage = storage or default_storage
+    expires = signed_url_expiry()
+    return storage.url(name) + '?' + urlencode({'e': expires, 's': _signature(name, expires)})
+
+def verify_signature(name, expires, signature):
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time() or not signature:
+        return False
+    return hmac.compare_digest(_signature(name, expires), signature)
+
+def signature_expiry(expires):
+    return max(int(expires) - int(time.time()), 0)
+
+def source_name(name):
+    # thumbnails/<WxH>/<source>.jpg is readable by whoever can read <source>, see tracker.thumbnails.thumbnail_name
+    parts = name.split('/', 2)
+    if len(parts) == 3 and parts[0] == 'thumbnails' and parts[2].endswith('.jpg'):
+        return parts[2][:-len('.jpg')]
+    return name
+
+def can_access_media(user, name):
+    """
+    Permission for requests without a signature, decided once per user and file then cached for MEDIA_PERMISSION_TTL seconds.
+    User icons are visible to every authenticated user, attachments to their uploader and to members of the team of a
+    bug or bug resolution they are attached to.
+    """
+    if user is None or not user.is_authenticated:
+        return False
+    if user.is_superuser:
+        return True
+    name = source_name(posixpath.normpath(name))
+    key = 'media-perm:%s:%s' % (user.pk, hashlib.sha256(name.encode()).hexdigest())
+    allowed = cache.get(key)
+    if allowed is None:
+        allowed = _can_access_media(user, name)
+        cache.set(key, allowed, getattr(settings, 'MEDIA_PERMISSION_TTL', MEDIA_PERMISSION_TTL))
+    return allowed
+
+def _can_access_media(user, name):
+    if name.startswith('user_icons/'):
+        return True
+    team_ids = getattr(user, 'team_ids', None)     # a claims user carries its teams, a session user is looked up
+    if team_ids is None:
+        team_ids = Teams.objects.filter(users=user.pk).values_list('id', flat=True)
+    return MediaStore.objects.filter(media_file=name).filter(
+        Q(created_by_id=user.pk)
+        | Q(bug_attachments__team_id__in=team_ids, bug_attachments__deleted_at__isnull=True)
+        | Q(messeges_attachments__bug_resolution_id__bug__team_id__in=team_ids, messeges_attachments__deleted_at__isnull=True)
+    ).exists()
@@ -0,0 +1,72 @@
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from user.models import User
+
+
+class TeamMembershipIndex:
+    # team id -> live member ids of this process, dropped by tracker.signals, other processes' changes show after ttl seconds
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._members = {}                  # team_id -> (loaded_at, frozenset of user ids)
+        self._lock = Lock()
+
+    def _get_ttl(self):
+        if self.ttl is None:
+            return getattr(settings, 'TEAM_MEMBERSHIP_CACHE_TTL', 30)
+        return self.ttl
+
+    def members(self, team_id):
+        team_id = int(team_id)
+        entry = self._members.get(team_id)
+        if entry is not None and monotonic() - entry[0] < self._get_ttl():
+            return entry[1]
+        loaded_at = monotonic()
+        member_ids = frozenset(self._members_queryset(team_id))
+        with self._lock:
+            self._members[team_id] = (loaded_at, member_ids)
+        return member_ids
+
+    async def amembers(self, team_id):
+        team_id = int(team_id)
+        entry = self._members.get(team_id)
+        if entry is not None and monotonic() - entry[0] < self._get_ttl():
+            return entry[1]
+        loaded_at = monotonic()
+        member_ids = frozenset([user_id async for user_id in self._members_queryset(team_id)])
+        with self._lock:
+            self._members[team_id] = (loaded_at, member_ids)
+        return member_ids
+
+    def _members_queryset(self, team_id):
+        # from the primary, a replica lagging behind an invalidation would keep the old members for ttl seconds
+        return User.objects.using(DEFAULT_DB_ALIAS).filter(teams__id=team_id, teams__deleted_at__isnull=True).values_list('id', flat=True)
+
+    def is_member(self, user_id, team_id):
+        if user_id is None or team_id is None:
+            return False
+        return int(user_id) in self.members(team_id)
+
+    async def ais_member(self, user_id, team_id):
+        if user_id is None or team_id is None:
+            return False
+        return int(user_id) in await self.amembers(team_id)
+
+    def invalidate(self, team_ids=None):
+        with self._lock:
+            if team_ids is None:
+                self._members.clear()
+                return
+            for team_id in team_ids:
+                self._members.pop(int(team_id), None)
+
+
+team_membership = TeamMembershipIndex()
+
+members = team_membership.members
+is_member = team_membership.is_member
+amembers = team_membership.amembers
+ais_member = team_membership.ais_member
@@ -0,0 +1,148 @@
+import bisect
+import time
+from contextvars import ContextVar
+from threading import Lock
+
+
+# seconds, bytes and query counts, wide enough for the slowest export and the largest attachment
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+UNMATCHED_ROUTE = 'unmatched'
+
+# [query count, seconds] of the request being served, set by tracker.middlewares.MetricsMiddleware
+# a context variable reaches the threads sync_to_async runs the orm in, so queries of the async views are counted too
+_query_stats = ContextVar('query_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _query_stats.get()
+    if stats is None:                                   # outside a request, eg: management commands
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+
+def install_query_recorder(sender, connection, **kwargs):
+    # connection_created is sent again when a connection wrapper reconnects
+    # first in the list, connection.execute_wrapper() blocks pop the last wrapper when they exit
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in labels) if labels else ''
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative histogram per label values, observe() is called with RequestMetrics' lock held."""
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}                    # label values: [count per bucket (+Inf last), sum]
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s histogram' % self.name]
+        for labels, (counts, total) in self.series.items():
+            labels = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (self.name, _format_labels(labels + [('le', bound)]), cumulative))
+            lines.append('%s_sum%s %s' % (self.name, _format_labels(labels), _format_value(total)))
+            lines.append('%s_count%s %d' % (self.name, _format_labels(labels), cumulative))
+        return lines
+
+
+class RequestMetrics:
+    """
+    Request metrics of this process in the prometheus text format, served by tracker.views.metrics.
+    Requests are labeled by url route (eg: api/bugs/<id>/) and method, never by path, so the number of series stays bounded.
+    Every worker process counts on its own, prometheus has to scrape each of them (or sum the instances).
+    """
+    def __init__(self):
+        self.requests = {}                  # (route, method, status): count
+        self.duration = Histogram('http_request_duration_seconds', 'Time to produce the response, streamed bodies excluded.', ('route', 'method'), DURATION_BUCKETS)
+        self.queries = Histogram('http_request_db_queries', 'Database queries run by a request.', ('route', 'method'), QUERY_COUNT_BUCKETS)
+        self.db_duration = Histogram('http_request_db_duration_seconds', 'Time a request spent waiting on the database.', ('route', 'method'), DB_DURATION_BUCKETS)
+        self.response_size = Histogram('http_response_size_bytes', 'Response body size, from Content-Length for streamed bodies.', ('route', 'method'), SIZE_BUCKETS)
+        self.collectors = []
+        self._lock = Lock()
+
+    def observe(self, route, method, status, duration, queries, db_duration, size):
+        labels = (route, method)
+        with self._lock:                    # one short critical section per request
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.duration.observe(labels, duration)
+            self.queries.observe(labels, queries)
+            self.db_duration.observe(labels, db_duration)
+            if size is not None:
+                self.response_size.observe(labels, size)
+
+    def register_collector(self, collector):
+        """collector() returns (name, type, documentation, [(labels dict, value), ...]) tuples, rendered after the request metrics."""
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = ['# HELP http_requests_total Requests served, by response status.', '# TYPE http_requests_total counter']
+        with self._lock:
+            for (route, method, status), count in self.requests.items():
+                lines.append('http_requests_total%s %d' % (_format_labels((('route', route), ('method', method), ('status', status))), count))
+            for histogram in (self.duration, self.queries, self.db_duration, self.response_size):
+                lines.extend(histogram.render())
+        for collector in self.collectors:
+            for name, kind, documentation, samples in collector():
+                lines.extend(['# HELP %s %s' % (name, documentation), '# TYPE %s %s' % (name, kind)])
+                lines.extend('%s%s %s' % (name, _format_labels(tuple(labels.items())), _format_value(value)) for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+def start_request():
+    """Starts counting the queries of the current request, returns what finish_request() takes."""
+    return _query_stats.set([0, 0]), time.perf_counter()
+
+def finish_request(request, response, started):
+    """Records the request, response is None when the middlewares below raised."""
+    token, start = started
+    duration = time.perf_counter() - start
+    queries, db_duration = _query_stats.get()
+    _query_stats.reset(token)
+
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else UNMATCHED_ROUTE
+    method = request.method if request.method in METHODS else 'other'
+    status = response.status_code if response is not None else 500
+    if response is None:
+        size = None
+    elif response.has_header('Content-Length'):
+        size = int(response['Content-Length'])
+    elif not response.streaming:
+        size = len(response.content)
+    else:
+        size = None                         # streamed without a length, unknown until sent
+    request_metrics.observe(route, method, status, duration, queries, db_duration, size)
@@ -1,15 +1,152 @@
-from threading import current_thread
-from django.utils.deprecation import MiddlewareMixin
+import asyncio
+from contextvars import ContextVar
 
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
 
-_requests = {}
+from .metrics import start_request, finish_request
+from .routers import get_routing_state, start_routing, stop_routing
+
+
+# the request being served by the current thread / coroutine, reset once the response is produced
+_request = ContextVar('request', default=None)
 
 def get_request():
-    t = current_thread()
-    if t not in _requests:
-         return None
-    return _requests[t]
-
-class RequestMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        _requests[current_thread()] = request
\ No newline at end of file
+    return _request.get()
+
+def get_request_user():
+    user = getattr(get_request(), 'user', None)
+    if user is None or user.is_anonymous:
+        return None
+    return user
+
+class RequestMiddleware:
+    """
+    Exposes the current request through get_request() for the audit fields of the models.
+    A context variable is used so concurrent requests never see each other, be it threads under WSGI or coroutines under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Mark the class as async-capable, same as django.utils.deprecation.MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = _request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)
+
+    async def __acall__(self, request):
+        token = _request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _request.reset(token)
+
+class MetricsMiddleware:
+    """
+    Records latency, database queries and time, response size and status of every request for /metrics, see tracker.metrics.
+    First in MIDDLEWARE so the whole stack is timed.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        started, response = start_request(), None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            finish_request(request, response, started)
+
+    async def __acall__(self, request):
+        started, response = start_request(), None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            finish_request(request, response, started)
+
+class ReplicaRoutingMiddleware:
+    """
+    Read-your-writes for tracker.routers.PrimaryReplicaRouter. Reads of unsafe methods and of a request after its first write go to the primary,
+    a request that wrote sets a signed cookie keeping its client on the primary for settings.DB_READ_YOUR_WRITES_WINDOW seconds,
+    longer than the replicas lag behind.
+    """
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'db_primary'
+    cookie_salt = 'tracker.middlewares.ReplicaRoutingMiddleware'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = start_routing(self.pinned(request))
+        try:
+            return self.set_cookie(request, self.get_response(request))
+        finally:
+            stop_routing(token)
+
+    async def __acall__(self, request):
+        token = start_routing(self.pinned(request))
+        try:
+            return self.set_cookie(request, await self.get_response(request))
+        finally:
+            stop_routing(token)
+
+    def pinned(self, request):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return True
+        # the signature carries the time of the write, an older cookie reads as missing
+        return request.get_signed_cookie(self.cookie_name, default=None, salt=self.cookie_salt, max_age=settings.DB_READ_YOUR_WRITES_WINDOW) is not None
+
+    def set_cookie(self, request, response):
+        if get_routing_state().wrote and settings.DATABASE_REPLICAS:
+            response.set_signed_cookie(
+                self.cookie_name, '1', salt=self.cookie_salt, max_age=settings.DB_READ_YOUR_WRITES_WINDOW,
+                secure=request.is_secure(), httponly=True, samesite='Lax',
+            )
+        return response
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also runs in the event loop, whitenoise 6.2 is sync only and would put every ASGI request
+    through a thread hop at its place in MIDDLEWARE. The lookup is a dict read (a stat with WHITENOISE_AUTOREFRESH in development).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        response = self.process_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
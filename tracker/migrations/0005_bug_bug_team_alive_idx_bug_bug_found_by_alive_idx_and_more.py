@@ -0,0 +1,57 @@
+# Generated by Django 4.1 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0004_alter_mediastore_media_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['team'], name='bug_team_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['found_by'], name='bug_found_by_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bugduplicate',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['parent'], name='bugduplicate_parent_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bugduplicate',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['child'], name='bugduplicate_child_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bugresolution',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['created_at'], name='bugres_created_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bugwatch',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['bug'], name='bugwatch_bug_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bugwatch',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['watcher'], name='bugwatch_watcher_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediastore',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['id'], name='mediastore_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messeges',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['bug_resolution_id'], name='messeges_resolution_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messeges',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user'], name='messeges_user_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teams',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['team_leader'], name='teams_leader_alive_idx'),
+        ),
+    ]
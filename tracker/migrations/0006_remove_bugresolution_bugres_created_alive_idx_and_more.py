@@ -0,0 +1,29 @@
+# Generated by Django 4.1 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0005_bug_bug_team_alive_idx_bug_bug_found_by_alive_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bugresolution',
+            name='bugres_created_alive_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['created_at', 'id'], name='bug_created_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bugresolution',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['created_at', 'id'], name='bugres_created_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teams',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['created_at', 'id'], name='teams_created_alive_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0006_remove_bugresolution_bugres_created_alive_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediastore',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='mediastore',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('content_hash',), name='mediastore_hash_alive_uniq'),
+        ),
+    ]
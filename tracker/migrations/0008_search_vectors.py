@@ -0,0 +1,96 @@
+# Generated by Django 4.1 on 2026-10-18 11:43
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+# the vectors are computed by the database so bulk_create, queryset.update and raw writes keep them current as well
+BUG_SEARCH_TRIGGER = '''
+CREATE FUNCTION tracker_bug_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.description, '')), 'B') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.reproduction_steps, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tracker_bug_search_vector_trigger BEFORE INSERT OR UPDATE ON tracker_bug
+    FOR EACH ROW EXECUTE PROCEDURE tracker_bug_search_vector();
+
+UPDATE tracker_bug SET search_vector = NULL;
+'''
+
+MESSEGES_SEARCH_TRIGGER = '''
+CREATE FUNCTION tracker_messeges_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('pg_catalog.english', coalesce(NEW.message, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tracker_messeges_search_vector_trigger BEFORE INSERT OR UPDATE ON tracker_messeges
+    FOR EACH ROW EXECUTE PROCEDURE tracker_messeges_search_vector();
+
+UPDATE tracker_messeges SET search_vector = NULL;
+'''
+
+
+BUG_SEARCH_TRIGGER_REVERSE = 'DROP TRIGGER tracker_bug_search_vector_trigger ON tracker_bug; DROP FUNCTION tracker_bug_search_vector();'
+MESSEGES_SEARCH_TRIGGER_REVERSE = 'DROP TRIGGER tracker_messeges_search_vector_trigger ON tracker_messeges; DROP FUNCTION tracker_messeges_search_vector();'
+
+BUG_SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(condition=models.Q(('deleted_at__isnull', True)), fields=['search_vector'], name='bug_search_alive_idx')
+MESSEGES_SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(condition=models.Q(('deleted_at__isnull', True)), fields=['search_vector'], name='messeges_search_alive_idx')
+
+
+# triggers and gin indexes only exist on postgres, elsewhere search_vector stays empty and tracker.selectors falls back to icontains
+def postgres_sql(sql):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in schema_editor.connection.ops.prepare_sql_script(sql):
+                schema_editor.execute(statement, params=None)
+    return run
+
+def postgres_index(model_name, index, add=True):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            model = apps.get_model('tracker', model_name)
+            if add:
+                schema_editor.add_index(model, index)
+            else:
+                schema_editor.remove_index(model, index)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0007_mediastore_content_hash_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bug',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='messeges',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(postgres_sql(BUG_SEARCH_TRIGGER), postgres_sql(BUG_SEARCH_TRIGGER_REVERSE)),
+        migrations.RunPython(postgres_sql(MESSEGES_SEARCH_TRIGGER), postgres_sql(MESSEGES_SEARCH_TRIGGER_REVERSE)),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='bug', index=BUG_SEARCH_INDEX),
+                migrations.AddIndex(model_name='messeges', index=MESSEGES_SEARCH_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(postgres_index('bug', BUG_SEARCH_INDEX), postgres_index('bug', BUG_SEARCH_INDEX, add=False)),
+                migrations.RunPython(postgres_index('messeges', MESSEGES_SEARCH_INDEX), postgres_index('messeges', MESSEGES_SEARCH_INDEX, add=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.1 on 2026-10-18 11:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_existing_bugs(apps, schema_editor):
+    from tracker.duplicates import bug_signature, band_buckets, pack_signature     # pure functions, safe with historical models
+    Bug = apps.get_model('tracker', 'Bug')
+    BugSignature = apps.get_model('tracker', 'BugSignature')
+    BugSignatureBand = apps.get_model('tracker', 'BugSignatureBand')
+    signatures, bands = [], []
+    for bug in Bug.objects.filter(deleted_at__isnull=True).only('id', 'team_id', 'title', 'description', 'reproduction_steps').iterator(chunk_size=2000):
+        signature = bug_signature(bug)
+        if signature is None:
+            continue
+        signatures.append(BugSignature(bug_id=bug.id, team_id=bug.team_id, signature=pack_signature(signature)))
+        bands.extend(BugSignatureBand(bug_id=bug.id, team_id=bug.team_id, band=band, bucket=bucket) for band, bucket in enumerate(band_buckets(signature)))
+        if len(signatures) >= 2000:
+            BugSignature.objects.bulk_create(signatures)
+            BugSignatureBand.objects.bulk_create(bands)
+            signatures, bands = [], []
+    BugSignature.objects.bulk_create(signatures)
+    BugSignatureBand.objects.bulk_create(bands)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_search_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BugSignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('bug', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_bands', to='tracker.bug')),
+                ('team', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tracker.teams')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BugSignature',
+            fields=[
+                ('bug', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='tracker.bug')),
+                ('signature', models.BinaryField()),
+                ('team', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tracker.teams')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='bugsignatureband',
+            index=models.Index(fields=['team', 'bucket'], name='bugsigband_lookup_idx'),
+        ),
+        migrations.RunPython(index_existing_bugs, migrations.RunPython.noop),
+    ]
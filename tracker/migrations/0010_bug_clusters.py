@@ -0,0 +1,30 @@
+# Generated by Django 4.1 on 2026-10-18 11:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def cluster_existing_duplicates(apps, schema_editor):
+    from tracker.duplicates import resolve_clusters            # pure function, safe with historical models
+    BugDuplicate = apps.get_model('tracker', 'BugDuplicate')
+    BugCluster = apps.get_model('tracker', 'BugCluster')
+    edges = BugDuplicate.objects.filter(deleted_at__isnull=True).order_by('id').values_list('parent_id', 'child_id')
+    BugCluster.objects.bulk_create([BugCluster(bug_id=bug_id, canonical_id=root) for bug_id, root in resolve_clusters(edges.iterator()).items()], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_bug_signatures'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BugCluster',
+            fields=[
+                ('bug', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cluster', serialize=False, to='tracker.bug')),
+                ('canonical', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tracker.bug')),
+            ],
+        ),
+        migrations.RunPython(cluster_existing_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+def count_existing_rows(apps, schema_editor):
+    from tracker.counters import reconcile_counters             # works on the historical models given by get_model
+    reconcile_counters(apps.get_model)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_bug_clusters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bug',
+            name='attachment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bug',
+            name='watcher_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bugresolution',
+            name='attachment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bugresolution',
+            name='message_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='teams',
+            name='open_resolution_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1 on 2026-10-18 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0011_activity_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='mediastore',
+            name='mediastore_hash_alive_uniq',
+        ),
+        migrations.AddIndex(
+            model_name='mediastore',
+            index=models.Index(fields=['content_hash'], name='mediastore_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_mediastore_hash_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediastore',
+            name='thumbnails_ready',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -1,6 +1,11 @@
+from django.core import checks
 from django.utils import timezone
-from django.db import models
-from tracker.middlewares import get_request
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from tracker.middlewares import get_request, get_request_user
+from tracker.managers import AliveManager
 
 #from django.contrib.auth.models import User # Replaced with custom user
 from django.contrib.auth import get_user_model
@@ -16,54 +21,113 @@ class BaseModel(models.Model):
     modified_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, related_name='%(class)s_created', on_delete=models.RESTRICT, null=False, blank=True)
     modified_by = models.ForeignKey(User, related_name='%(class)s_modified', on_delete=models.RESTRICT, null=False, blank=True)
+    counter_fields = ()                 # moved by adjust_counters only, see _do_update
 
     class Meta:
         abstract = True
 
     def save(self, auth_user = None, *args, **kwargs): # if calling via shell, user_id should be passed to the function.
-        if auth_user is not None:
-            self.modified_by = auth_user
-        else:
-            req = get_request()
-            if req is not None:
-                return ValueError("kindly provide auth_user")   # This case is possibe in case of shell use, ask user to provide required field, alternatively can give a cmd form to login in shell                                                   
-            auth_user = getattr(req, 'user', None)
-            if auth_user.is_anonymous is True:                               # this case can happed incase a not logged in user requests for deletion using any bug
+        if auth_user is None:
+            if get_request() is None:
+                raise ValueError("kindly provide auth_user")    # This case is possibe in case of shell use, ask user to provide required field, alternatively can give a cmd form to login in shell
+            auth_user = get_request_user()
+            if auth_user is None:                               # this case can happed incase a not logged in user requests for deletion using any bug
                 raise ValueError("Please login and try again")
-        
+
         if self._state.adding:                                  # if new object, set both created_by and modified_by to auth_user
-            self.created_by = auth_user
-            self.modified_by = auth_user
+            self.created_by_id = auth_user.pk
+            self.modified_by_id = auth_user.pk
         else:                                                   # if existing object, only update the modified_by
-            self.modified_by = auth_user
-        return super(User,self).save(*args, **kwargs)
+            self.modified_by_id = auth_user.pk
+        return super(BaseModel, self).save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # the UPDATE of a full save leaves counter_fields out, the instance may hold a stale copy of them. Inserts still write them,
+        # and so does a save naming them in update_fields. post_save receivers see the update_fields the caller passed.
+        if update_fields is None and self.counter_fields:
+            values = [value for value in values if value[0].name not in self.counter_fields]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
 
-# This model shall be inherited by every model that needs soft delete functionality.
+# This model shall be inherited by every model that needs soft delete functionality, indexes of its models cover live rows only.
 class SoftDeleteModel(models.Model):
     deleted_at = models.DateTimeField(null=True, blank=True)
     deleted_by = models.ForeignKey(User, related_name='%(class)s_deleted', on_delete=models.RESTRICT, null=True, blank=True)
 
+    objects = AliveManager()            # default manager, only rows that are not soft deleted
+    all_objects = models.Manager()      # escape hatch, includes soft deleted rows
+
     class Meta:
         abstract = True
 
     def soft_delete(self, auth_user = None, *args, **kwargs):   # if calling via shell, user_id should be passed to the function.
-        if auth_user is not None:                               # if user is passes as arguement, assign it
-            self.deleted_by = auth_user
-            self.modified_by = auth_user
-        else:
-            req = get_request()
-            if req is not None:
-                return ValueError("kindly provide auth_user")   # This case is possibe in case of shell use, ask user to provide required field, alternatively can give a cmd form to login in shell                                                   
-            auth_user = getattr(req, 'user', None)
-            if auth_user.is_anonymous is True:                               # this case can happed incase a not logged in user requests for deletion using any bug
+        if auth_user is None:
+            if get_request() is None:
+                raise ValueError("kindly provide auth_user")    # This case is possibe in case of shell use, ask user to provide required field, alternatively can give a cmd form to login in shell
+            auth_user = get_request_user()
+            if auth_user is None:                               # this case can happed incase a not logged in user requests for deletion using any bug
                 raise ValueError("Please login and try again")
-        self.deleted_by = auth_user
-        self.modified_by = auth_user                            # if user is not available in request, then it is a shell call, do not update deleted_by and modified_by
+        self.deleted_by_id = auth_user.pk
+        self.modified_by_id = auth_user.pk                      # if user is not available in request, then it is a shell call, do not update deleted_by and modified_by
         self.deleted_at = timezone.now()                        # set deleted_at to current time
         return self.save(auth_user=auth_user, *args, **kwargs)  # save the model
 
-    # def get_queryset(self):                                                                       #TODO figure out how to fix this 
-    #     return super(SoftDeleteModel, self).get_queryset().filter(deleted_at__isnull=True) 
+# counter columns (eg: Bug.watcher_count) are moved with F() updates, concurrent writers never overwrite each other's changes.
+# tracker.counters.reconcile_counters recomputes them from the rows, to fix any drift.
+def adjust_counters(queryset, **deltas):
+    deltas = {name: F(name) + delta for name, delta in deltas.items() if delta}
+    if deltas:
+        queryset.update(**deltas)
+
+# inherited by models whose rows are counted by the counter columns of other models, ahead of BaseModel.
+class CountedModel(models.Model):
+    tracked_fields = ('deleted_at',)    # fields update_counters compares, remembered as loaded from the database
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._tracked_values()
+        return instance
+
+    def _tracked_values(self):
+        values = {}
+        for name in self.tracked_fields:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:                        # deferred fields are left out and read as unchanged
+                values[name] = self.__dict__[attname]
+        return values
+
+    def save(self, *args, **kwargs):
+        adding, loaded = self._state.adding, getattr(self, '_loaded_values', None)
+        with transaction.atomic(savepoint=False):               # the row and the counters it moves are committed together
+            result = super().save(*args, **kwargs)
+            current = self._tracked_values()
+            if adding:
+                self.update_counters(None, current)
+            elif loaded is not None:                            # an instance not loaded from the database has nothing to compare with
+                self.update_counters({**current, **loaded}, current)
+        self._loaded_values = current
+        return result
+
+    @classmethod
+    def check(cls, **kwargs):
+        # update_counters is the contract of a counted model, a model that does not implement it fails the system checks
+        errors = super().check(**kwargs)
+        if cls.update_counters is CountedModel.update_counters:
+            errors.append(checks.Error('%s inherits CountedModel without overriding update_counters.' % cls.__name__, obj=cls, id='tracker.E001'))
+        return errors
+
+    def update_counters(self, previous, current):
+        """Moves the counters this row is part of. previous and current hold tracked_fields before and after the save, previous is None for a new row."""
+        raise NotImplementedError('%s must implement update_counters' % type(self).__name__)
+
+    @staticmethod
+    def alive_change(previous, current):
+        # 1 when the row was created or restored, -1 when it was soft deleted, 0 otherwise
+        was_alive = previous is not None and previous.get('deleted_at') is None
+        return (current.get('deleted_at') is None) - was_alive
 
 # End Base Model Block #
 
@@ -74,38 +138,79 @@ class SoftDeleteModel(models.Model):
 class Teams(BaseModel, SoftDeleteModel):
     team_name = models.CharField(max_length=100, unique=True)
     team_leader = models.ForeignKey(User, related_name='%(class)s_team_leader', on_delete=models.RESTRICT, null=False)
+    open_resolution_count = models.IntegerField(default=0, editable=False)  # live resolutions of the team's bugs without an end_time
+    counter_fields = ('open_resolution_count',)
     # team_members = models.ManyToManyField(User, related_name='%(class)s_team_members', blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['team_leader'], name='teams_leader_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['created_at', 'id'], name='teams_created_alive_idx', condition=models.Q(deleted_at__isnull=True)),     # keyset pagination
+        ]
+
     def __str__(self):
         return self.team_name + " - " + self.team_leader.username
 
 
 # model to accept media files like images, videos, pdfs etc.
-class MediaStore(BaseModel, SoftDeleteModel):
+class MediaStore(CountedModel, BaseModel, SoftDeleteModel):
     media_file = models.FileField(upload_to='attachments/')
     media_type = models.CharField(max_length=20, default='etc')
+    content_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)   # sha256 of media_file, identical uploads share the stored file
+    thumbnails_ready = models.BooleanField(default=False, editable=False)  # set once tracker.thumbnails generated the derivatives of media_file
     #media_owner is from created by field in BaseModel
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], name='mediastore_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['content_hash'], name='mediastore_hash_idx'),
+        ]
+
     def __str__(self):
         return self.media_file.name + " - " + self.media_type
 
+    def update_counters(self, previous, current):
+        change = self.alive_change(previous, current)
+        if not change or previous is None:                      # new media is not attached to anything yet
+            return
+        adjust_counters(Bug.all_objects.filter(attachments=self), attachment_count=change)
+        for bug_resolution_id, count in Messeges.objects.filter(attachments=self).values_list('bug_resolution_id').annotate(count=Count('pk')).order_by():
+            adjust_counters(BugResolution.all_objects.filter(pk=bug_resolution_id), attachment_count=change * count)
+
 
-class Messeges(BaseModel, SoftDeleteModel):
+class Messeges(CountedModel, BaseModel, SoftDeleteModel):
     message = models.TextField()
     # comment_date = models.DateTimeField(auto_now_add=True) ## Removed, redundent since we can take from created_at field
     user = models.ForeignKey(User, related_name='%(class)s_user', on_delete=models.RESTRICT, null=True)
     attachments = models.ManyToManyField(MediaStore, related_name='%(class)s_attachments', blank=True)
     # attachments = GenericRelation(MediaStore, on_delete=models.RESTRICT, null=True, blank=True) ## Not worth it, DRF does not support Generic Relation serialization, implemented it with a complex method but removing it for simplicity sake.
     bug_resolution_id = models.ForeignKey('BugResolution', related_name='%(class)s_bug_resolution', on_delete=models.RESTRICT, null=False, blank=False)
+    search_vector = SearchVectorField(null=True, editable=False)    # maintained by a database trigger, see migration 0008
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='messeges_search_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['bug_resolution_id'], name='messeges_resolution_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['user'], name='messeges_user_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+        ]
 
     def __str__(self):
         return self.user.username + " - " + self.message
 
+    def update_counters(self, previous, current):
+        change = self.alive_change(previous, current)
+        if not change:
+            return
+        attachments = self.attachments.count() if previous is not None else 0     # attachments of a new message are added after it is saved
+        adjust_counters(BugResolution.all_objects.filter(pk=self.bug_resolution_id_id), message_count=change, attachment_count=change * attachments)
+
 # End Supporting Models Block #
 
 # -------------------------------------------------------------------------------------------- #
 
 # Start Bug Tracker Block #
 
-class Bug(BaseModel, SoftDeleteModel):
+class Bug(CountedModel, BaseModel, SoftDeleteModel):
     title = models.CharField(max_length=100, null=False, blank=False)
     description = models.TextField(null=True, blank=True)
     reproduction_steps = models.TextField(null=True, blank=True)
@@ -114,6 +219,19 @@ class Bug(BaseModel, SoftDeleteModel):
     team = models.ForeignKey(Teams, related_name='%(class)s_team', on_delete=models.RESTRICT, null=True, blank=True)
     attachments = models.ManyToManyField(MediaStore, related_name='%(class)s_attachments', blank=True)
     #attachments = GenericRelation(MediaStore, on_delete=models.RESTRICT, null=True, blank=True) ## Not worth it, DRF does not support Generic Relation serialization, implemented it with a complex method but removing it for simplicity sake.
+    search_vector = SearchVectorField(null=True, editable=False)    # title (A), description (B), reproduction_steps (C), maintained by a database trigger, see migration 0008
+    attachment_count = models.IntegerField(default=0, editable=False)   # live attachments
+    watcher_count = models.IntegerField(default=0, editable=False)      # live BugWatch rows
+    tracked_fields = ('team',)
+    counter_fields = ('attachment_count', 'watcher_count')
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='bug_search_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['team'], name='bug_team_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['found_by'], name='bug_found_by_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['created_at', 'id'], name='bug_created_alive_idx', condition=models.Q(deleted_at__isnull=True)),       # keyset pagination
+        ]
 
     def __str__(self):
         if (self.acceptance == None):
@@ -122,8 +240,16 @@ class Bug(BaseModel, SoftDeleteModel):
             return self.title + " - Accepted"
         return self.title + " - Rejected"
 
+    def update_counters(self, previous, current):
+        # the open resolution of a bug moving to another team moves with it
+        if previous is None or previous.get('team') == current.get('team'):
+            return
+        if BugResolution.objects.filter(bug=self, end_time__isnull=True).exists():
+            adjust_counters(Teams.all_objects.filter(pk=previous['team']), open_resolution_count=-1)
+            adjust_counters(Teams.all_objects.filter(pk=current['team']), open_resolution_count=1)
+
 
-class BugResolution(BaseModel, SoftDeleteModel): 
+class BugResolution(CountedModel, BaseModel, SoftDeleteModel): 
     # Bug and Bug Resolution are sepetrated to prevent sparse matrix problem.
     bug = models.OneToOneField(Bug, related_name='%(class)s_bug', on_delete=models.RESTRICT, null=False, blank=False)
     assigned_members = models.ManyToManyField(User, related_name='%(class)s_assigned_members', blank=False)
@@ -138,6 +264,15 @@ class BugResolution(BaseModel, SoftDeleteModel):
     merge_req_id = models.CharField(max_length=100, null=True, blank=True)
     approved_by = models.ForeignKey(User, related_name='%(class)s_approved_by', on_delete=models.RESTRICT, null=True, blank=True)
     end_time = models.DateTimeField(null=True, blank=True)
+    message_count = models.IntegerField(default=0, editable=False)      # live messages
+    attachment_count = models.IntegerField(default=0, editable=False)   # live attachments of the live messages
+    tracked_fields = ('deleted_at', 'end_time')
+    counter_fields = ('message_count', 'attachment_count')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='bugres_created_alive_idx', condition=models.Q(deleted_at__isnull=True)),    # keyset pagination
+        ]
 
     def __str__(self):
         return self.bug.title
@@ -151,21 +286,69 @@ class BugResolution(BaseModel, SoftDeleteModel):
             return super().save(user_id, *args, **kwargs)
         return '{"error": "bug is None, Kindly provide a bug"}'
 
+    def update_counters(self, previous, current):
+        def is_open(values):
+            return values is not None and values.get('deleted_at') is None and values.get('end_time') is None
+        change = is_open(current) - is_open(previous)
+        if change:
+            adjust_counters(Teams.all_objects.filter(pk=self.bug.team_id), open_resolution_count=change)
+
 
 
-class BugWatch(BaseModel, SoftDeleteModel):
+class BugWatch(CountedModel, BaseModel, SoftDeleteModel):
     bug = models.ForeignKey(Bug, related_name='%(class)s_bug', on_delete=models.RESTRICT, null=False)
     watcher = models.ForeignKey(User, related_name='%(class)s_watcher', on_delete=models.RESTRICT, null=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['bug'], name='bugwatch_bug_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['watcher'], name='bugwatch_watcher_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+        ]
+
     def __str__(self):
         return str(self.id) + " - " + self.bug.title + " - " + self.watcher.username
 
+    def update_counters(self, previous, current):
+        adjust_counters(Bug.all_objects.filter(pk=self.bug_id), watcher_count=self.alive_change(previous, current))
+
 
 class BugDuplicate(BaseModel, SoftDeleteModel):
     parent = models.ForeignKey(Bug, related_name='%(class)s_parent', on_delete=models.RESTRICT, null=False)
     child = models.ForeignKey(Bug, related_name='%(class)s_child', on_delete=models.RESTRICT, null=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['parent'], name='bugduplicate_parent_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['child'], name='bugduplicate_child_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+        ]
+
     def __str__(self):
         return str(self.id) + " - " + self.parent.title + " - " + self.child.title
 
+
+# canonical bug of each bug linked by a live BugDuplicate, maintained by tracker.duplicates. The canonical bug points to itself.
+class BugCluster(models.Model):
+    bug = models.OneToOneField(Bug, related_name='cluster', on_delete=models.CASCADE, primary_key=True)
+    canonical = models.ForeignKey(Bug, related_name='+', on_delete=models.CASCADE)     # indexed, lists a whole cluster in one lookup
+
+
+# MinHash signature of a bug's text, maintained by tracker.duplicates. Derived data, so no audit or soft delete fields.
+class BugSignature(models.Model):
+    bug = models.OneToOneField(Bug, related_name='signature', on_delete=models.CASCADE, primary_key=True)
+    team = models.ForeignKey(Teams, related_name='+', on_delete=models.CASCADE, null=True)
+    signature = models.BinaryField()                                # packed minhash values, see tracker.duplicates.pack_signature
+
+
+# one row per LSH band of a live bug, bugs sharing a (band, bucket) in a team are duplicate candidates
+class BugSignatureBand(models.Model):
+    bug = models.ForeignKey(Bug, related_name='signature_bands', on_delete=models.CASCADE)
+    team = models.ForeignKey(Teams, related_name='+', on_delete=models.CASCADE, null=True)
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['team', 'bucket'], name='bugsigband_lookup_idx'),
+        ]
+
 # End Bug Tracker Block #
\ No newline at end of file
@@ -0,0 +1,253 @@
+import asyncio
+import atexit
+import base64
+import json
+import logging
+import os
+import pstats
+import random
+import time
+from collections import deque
+from io import StringIO
+from threading import Event, Lock, Thread
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.sql.compiler import SQLCompiler
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from silk.collector import DataCollector
+from silk.config import SilkyConfig
+from silk.middleware import SilkyMiddleware, _should_intercept
+from silk.model_factory import RequestModelFactory, ResponseModelFactory
+from silk.models import Profile, Request, Response, SQLQuery
+from silk.sql import execute_sql as silk_execute_sql
+
+Logger = logging.getLogger('tracker.profiling')
+
+
+# defaults of the SILK_* settings, see settings.py
+SAMPLE_RATE = 1.0
+FLUSH_INTERVAL = 5                  # seconds
+FLUSH_BATCH_SIZE = 100              # a full batch is flushed without waiting for the interval
+BUFFER_SIZE = 1000                  # profiles past this are dropped until the next flush, the db being slow must not eat the memory
+
+
+class ProfileBuffer:
+    """
+    Profiles captured by SampledSilkyMiddleware, written by a background thread in one transaction per batch
+    instead of the 3 + number of queries writes silk makes inside every request.
+    """
+    def __init__(self):
+        self.profiles = deque()
+        self.dropped = 0
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._pid = None
+
+    def add(self, profile):
+        with self._lock:
+            if len(self.profiles) >= getattr(settings, 'SILK_BUFFER_SIZE', BUFFER_SIZE):
+                self.dropped += 1
+                return
+            self.profiles.append(profile)
+            full = len(self.profiles) >= getattr(settings, 'SILK_FLUSH_BATCH_SIZE', FLUSH_BATCH_SIZE)
+            if self._pid != os.getpid():                # first profile of this process, threads do not survive a fork
+                self._pid = os.getpid()
+                Thread(target=self._run, name='silk-flush', daemon=True).start()
+                atexit.register(self.flush)
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(getattr(settings, 'SILK_FLUSH_INTERVAL', FLUSH_INTERVAL))
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        batch_size = getattr(settings, 'SILK_FLUSH_BATCH_SIZE', FLUSH_BATCH_SIZE)
+        while True:
+            with self._lock:
+                batch = [self.profiles.popleft() for _ in range(min(batch_size, len(self.profiles)))]
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                Logger.warning('%d silk profiles dropped, the buffer was full', dropped)
+            if not batch:
+                return
+            close_old_connections()                     # the thread keeps its own connection, CONN_MAX_AGE applies to it too
+            try:
+                save_profiles(batch)
+            except Exception:
+                Logger.exception('Could not save %d silk profiles', len(batch))
+            finally:
+                close_old_connections()
+
+
+profile_buffer = ProfileBuffer()
+
+
+def execute_sql(self, *args, **kwargs):
+    # silk's execute_sql renders every query before it looks whether the thread is recording, requests left out pay nothing here
+    if DataCollector().request is None:
+        return self._execute_sql(*args, **kwargs)
+    return silk_execute_sql(self, *args, **kwargs)
+
+
+def _python_profile(profiler):
+    # same text silk stores, formatted here in the flush thread instead of the request
+    stream = StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats()
+    return '\n'.join(stream.getvalue().split('\n')[:256])
+
+def _time_taken(start_time, end_time):
+    return (end_time - start_time).total_seconds() * 1000
+
+def save_profiles(batch):
+    """Saves (request, response, query dicts, profile dicts, python profiler) tuples with one insert per silk table."""
+    requests, responses, queries, profiles = [], [], [], []
+    for request, response, query_dicts, profile_dicts, profiler in batch:
+        request.time_taken = _time_taken(request.start_time, request.end_time)
+        request.num_sql_queries = len(query_dicts)
+        request.path, request.view_name = request.path[:190], (request.view_name or '')[:190]
+        if profiler is not None:
+            request.pyprofile = _python_profile(profiler)
+        requests.append(request)
+        responses.append(response)
+        by_identifier = {}
+        for identifier, query in query_dicts.items():
+            query = SQLQuery(identifier=identifier, **query)
+            if query.end_time is not None:
+                query.time_taken = _time_taken(query.start_time, query.end_time)
+            by_identifier[identifier] = query
+            queries.append(query)
+        profiles.extend((profile, [by_identifier[identifier] for identifier in profile.pop('queries', ()) if identifier in by_identifier]) for profile in profile_dicts)
+
+    with transaction.atomic():
+        Request.objects.bulk_create(requests)
+        Response.objects.bulk_create(responses)
+        SQLQuery._base_manager.bulk_create(queries)     # SQLQuery.objects updates the request row once per query, num_sql_queries is set above
+        for profile, profile_queries in profiles:       # only from silk_profile / SILKY_DYNAMIC_PROFILING, rare
+            profile = Profile(**profile)
+            profile.save()
+            profile.queries.set(profile_queries)
+    Request.garbage_collect(force=False)                # SILKY_MAX_RECORDED_REQUESTS
+
+
+class SampledSilkyMiddleware(SilkyMiddleware):
+    """
+    SilkyMiddleware that can stay on in production, it stands in for silk's middleware in MIDDLEWARE.
+    - settings.SILK_ROUTES: url routes profiled (eg: 'api/bugs/<id>/'), all of them when empty.
+    - settings.SILK_SAMPLE_RATE: fraction of the requests kept.
+    - settings.SILK_SLOW_REQUEST_THRESHOLD: seconds, requests slower than this are kept as well. Every request of
+      the routes is then captured in memory (silk still runs an EXPLAIN per query) and dropped at the end if fast.
+    Kept profiles are buffered and written by ProfileBuffer's thread, the request itself never writes to silk's tables.
+    Under ASGI only the profiled requests leave the event loop: silk's collector is per thread, so it is set up and read in the
+    thread sensitive executor the async ORM runs its queries in.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        sampled, threshold = self._sampling()
+        if not (sampled or threshold is not None) or not self._allowed_route(request):
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        self.process_request(request)
+        response = self.get_response(request)
+        if getattr(request, 'silk_is_intercepted', False):
+            keep = sampled or time.perf_counter() - start >= threshold
+            self._process_sampled_response(request, response, keep)
+        return response
+
+    async def __acall__(self, request):
+        sampled, threshold = self._sampling()
+        if not (sampled or threshold is not None) or not self._allowed_route(request):
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        await sync_to_async(self.process_request)(request)
+        response = await self.get_response(request)
+        if getattr(request, 'silk_is_intercepted', False):
+            keep = sampled or time.perf_counter() - start >= threshold
+            await sync_to_async(self._process_sampled_response)(request, response, keep)
+        return response
+
+    def _sampling(self):
+        return random.random() < getattr(settings, 'SILK_SAMPLE_RATE', SAMPLE_RATE), getattr(settings, 'SILK_SLOW_REQUEST_THRESHOLD', None)
+
+    def _allowed_route(self, request):
+        routes = getattr(settings, 'SILK_ROUTES', None)
+        if not routes:
+            return True
+        try:
+            return resolve(request.path_info).route in routes
+        except Resolver404:
+            return False
+
+    def process_request(self, request):
+        # SilkyMiddleware.process_request without the insert of the request row
+        DataCollector().clear()
+        if not _should_intercept(request):
+            return
+        request.silk_is_intercepted = True
+        self._apply_dynamic_mappings()
+        if not hasattr(SQLCompiler, '_execute_sql'):
+            SQLCompiler._execute_sql = SQLCompiler.execute_sql
+            SQLCompiler.execute_sql = execute_sql
+
+        config = SilkyConfig()
+        should_profile = config.SILKY_PYTHON_PROFILER
+        if config.SILKY_PYTHON_PROFILER_FUNC:
+            should_profile = config.SILKY_PYTHON_PROFILER_FUNC(request)
+
+        factory = RequestModelFactory(request)
+        body, raw_body = factory.body()
+        request_model = Request(
+            path=request.path, encoded_headers=factory.encoded_headers(), method=request.method,
+            query_params=factory.query_params(), view_name=factory.view_name(), body=body or '',
+        )
+        try:
+            request_model.raw_body = raw_body or ''
+        except UnicodeDecodeError:
+            pass
+        DataCollector().configure(request_model, should_profile=should_profile)
+
+    def _process_sampled_response(self, request, response, keep):
+        collector = DataCollector()
+        collector.stop_python_profiler()
+        request_model = collector.request
+        if keep and request_model is not None:
+            request_model.end_time = timezone.now()
+            profile_buffer.add((
+                request_model,
+                self._response_model(request_model, response),
+                dict(collector.queries),
+                list(collector.profiles.values()),
+                getattr(collector.local, 'pythonprofiler', None),
+            ))
+        collector.clear()                               # the thread's next request starts empty, fast requests are forgotten here
+
+    def _response_model(self, request_model, response):
+        # ResponseModelFactory.construct_response_model without the insert
+        body, content = ResponseModelFactory(response).body()
+        headers = {key: value for key, value in response.headers.items()}
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return Response(
+            request=request_model,
+            status_code=response.status_code,
+            encoded_headers=json.dumps(headers, ensure_ascii=SilkyConfig().SILKY_JSON_ENSURE_ASCII),
+            body=body,
+            raw_body=base64.b64encode(content).decode('ascii'),
+        )
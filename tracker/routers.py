@@ -0,0 +1,94 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class RoutingState:
+    """Where the reads of one request go, see ReplicaRoutingMiddleware."""
+    def __init__(self, pinned=False):
+        self.pinned = pinned                # reads go to the primary
+        self.wrote = False                  # the request wrote to the primary, its user stays on it for DB_READ_YOUR_WRITES_WINDOW
+        self.replica = None                 # picked on the first read, every read of the request sees the same lag
+
+
+# state of the request being served, None outside of requests (management commands, background threads)
+_state = ContextVar('db_routing', default=None)
+
+def get_routing_state():
+    return _state.get()
+
+def start_routing(pinned=False):
+    return _state.set(RoutingState(pinned))
+
+def stop_routing(token):
+    _state.reset(token)
+
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+def record_writes(execute, sql, params, many, context):
+    # execute wrapper of the primary's connections, a request is pinned by what it runs, not by where it asked to write
+    state = _state.get()
+    if state is not None and not state.wrote and sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+        state.pinned = state.wrote = True
+    return execute(sql, params, many, context)
+
+def install_write_recorder(sender, connection, **kwargs):
+    # connection_created is sent again when a connection wrapper reconnects
+    if connection.alias == DEFAULT_DB_ALIAS and record_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_writes)
+
+
+@contextmanager
+def use_primary():
+    """Reads inside go to the primary, for rows that outlive the request, eg: a cache filled right after an invalidation."""
+    state = _state.get()
+    if state is None:
+        token = _state.set(RoutingState(pinned=True))
+        try:
+            yield
+        finally:
+            _state.reset(token)
+        return
+    pinned, state.pinned = state.pinned, True
+    try:
+        yield
+    finally:
+        state.pinned = pinned or state.wrote
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes go to the primary (default), reads to one of settings.DATABASE_REPLICAS, picked at random once per request.
+    Reads stay on the primary when the replicas could miss what was just written:
+    - inside a transaction of the primary,
+    - for the rest of a request once it ran an INSERT, UPDATE or DELETE, and for every read of unsafe methods,
+    - for the requests of a client that wrote less than DB_READ_YOUR_WRITES_WINDOW seconds ago, see ReplicaRoutingMiddleware,
+    - inside use_primary().
+    """
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', None)
+        if not replicas:
+            return None
+        state = _state.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db is not None:
+            return instance._state.db                # related rows are read where their instance came from
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state is None:
+            return random.choice(replicas)
+        if state.replica not in replicas:                # first read of the request, or the replicas were reconfigured
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS                         # the writes themselves pin the request, see record_writes
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True                                 # the replicas hold the same rows as the primary
@@ -1,33 +1,98 @@
 from xml.dom import ValidationErr
-from .models import Teams, BugResolution
+from django.db import connection
+from django.db.models import Prefetch, F, Q, Value, FloatField
+from django.contrib.postgres.search import SearchQuery, SearchRank
+
+from .models import Teams, Bug, BugResolution, MediaStore, Messeges
 from user.models import User
 
 from user.selectors import get_user_instance
 
+SEARCH_CONFIG = 'english'         # must match the text search configuration of the triggers in migration 0008
+
 # get_team_leader = lambda team_id: Teams.objects.get(id=team_id).team_leader
 
 def get_team_leader(team_id):
-    qs = Teams.objects.get(deleted_at = None,id=team_id)
+    qs = Teams.objects.get(id=team_id)
     return qs.team_leader
 
 def get_team_instance(team_id):
-    qs = Teams.objects.get(deleted_at = None,id=team_id)
+    qs = Teams.objects.get(id=team_id)
     return qs
 
 def get_bug_resolution_instance(bug_resolution_id):
-    qs = BugResolution.objects.get(deleted_at = None,id=bug_resolution_id)
+    qs = BugResolution.objects.get(id=bug_resolution_id)
     return qs
 
 def get_team_members(team_id):
     team  = get_team_instance(team_id)
-    qs = User.objects.all().filter(deleted_at = None, teams__in=[team])
+    qs = User.objects.filter(teams__in=[team])
     return qs
 
 def get_assigned_bug_resolutions(user_id):
     user = get_user_instance(user_id)
-    qs = BugResolution.objects.filter(deleted_at = None, assigned_members__in = [user])
+    qs = BugResolution.objects.filter(assigned_members__in = [user])
     return qs
 
 def get_assigned_team_members(bug_resolution_id):
     bug_resolution = get_bug_resolution_instance(bug_resolution_id)
-    return bug_resolution.assigned_members.all().filter(deleted_at = None)
+    return bug_resolution.assigned_members.all()
+
+def live_attachments_prefetch(lookup='attachments', to_attr='live_attachments'):
+    # filtering a prefetched relation afterwards bypasses the prefetch cache, so the prefetch is given the alive queryset explicitly
+    return Prefetch(lookup, queryset=MediaStore.objects.all(), to_attr=to_attr)
+
+def get_bugs_queryset():
+    qs = Bug.objects.select_related('found_by', 'team', 'cluster').prefetch_related(live_attachments_prefetch())
+    return qs
+
+def live_messages_prefetch(lookup='messeges_bug_resolution', to_attr='live_messages'):
+    # one query for the messages of every resolution in the page, and one more for all of their attachments
+    qs = Messeges.objects.prefetch_related(live_attachments_prefetch()).order_by('created_at')
+    return Prefetch(lookup, queryset=qs, to_attr=to_attr)
+
+def get_bug_resolutions_queryset():
+    qs = BugResolution.objects.prefetch_related('assigned_members', live_messages_prefetch())
+    return qs
+
+def get_team_bug_resolutions_queryset(team_id):
+    qs = get_bug_resolutions_queryset().filter(bug__team__id=team_id).order_by('-created_at', '-id')
+    return qs
+
+def get_search_query(query):
+    # websearch syntax: quoted phrases, "or", and -word to exclude
+    return SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+
+def has_full_text_search():
+    # search_vector is only maintained on postgres, see migration 0008
+    return connection.vendor == 'postgresql'
+
+def contains_all_words(query, fields):
+    # fallback of the full text search, every word of query in one of fields, unranked
+    condition = Q()
+    for word in query.split():
+        word_condition = Q()
+        for field in fields:
+            word_condition |= Q(**{field + '__icontains': word})
+        condition &= word_condition
+    return condition
+
+def search_bugs(query, team_ids):
+    # @@ against the trigger maintained search_vector uses the partial gin index, ranking only runs on the matches
+    qs = get_bugs_queryset().filter(team_id__in=team_ids, team__deleted_at__isnull=True)          # only bugs of the user's teams
+    if not has_full_text_search():
+        return qs.filter(contains_all_words(query, ['title', 'description', 'reproduction_steps'])).annotate(rank=Value(0.0, output_field=FloatField())).order_by('-id')
+    search_query = get_search_query(query)
+    qs = qs.filter(search_vector=search_query).annotate(rank=SearchRank(F('search_vector'), search_query)).order_by('-rank', '-id')
+    return qs
+
+def search_messages(query, team_ids):
+    qs = Messeges.objects.select_related('bug_resolution_id').filter(
+        bug_resolution_id__deleted_at__isnull=True, bug_resolution_id__bug__deleted_at__isnull=True,   # messages of a deleted resolution or bug are gone with it
+        bug_resolution_id__bug__team_id__in=team_ids,
+    )
+    if not has_full_text_search():
+        return qs.filter(contains_all_words(query, ['message'])).annotate(rank=Value(0.0, output_field=FloatField())).order_by('-id')
+    search_query = get_search_query(query)
+    qs = qs.filter(search_vector=search_query).annotate(rank=SearchRank(F('search_vector'), search_query)).order_by('-rank', '-id')
+    return qs
@@ -1,12 +1,22 @@
 #services
-from . selectors import get_bug_resolution_instance, get_team_members
+from . selectors import get_bug_resolution_instance
+from . membership import is_member
 from user.selectors import get_user_instance
-from . models import Messeges, MediaStore
+from . models import Messeges, MediaStore, Bug, Teams
+from . middlewares import get_request_user
+from . thumbnails import is_image, schedule_thumbnails
+from . duplicates import index_bugs
+from django.db import transaction
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 
 from user.models import User
 
 
-def add_messege_to_bug_resolution(message, attachments, user_id, bug_resolution_id, auth_user: User = None, files = []):
+MEDIA_UPLOAD_WORKERS = 4    # bound on the threads writing one request's files to storage
+
+
+def add_messege_to_bug_resolution(message, user_id, bug_resolution_id, attachments = None, auth_user: User = None, files = []):
     if message is None or user_id is None or bug_resolution_id is None:
         return {"error": "Invalid data"}
     
@@ -18,38 +28,144 @@ def add_messege_to_bug_resolution(message, attachments, user_id, bug_resolution_
     if user is None:
         return ({'error': 'User does not exist'})
 
-    if user not in get_team_members(team_id=bug_resolution.team.id):
+    if not is_member(user.id, bug_resolution.bug.team_id):
         return ({'error': 'User is not a member of the team'})
     
-    messege = Messeges.objects.create(message=message, user=user, bug_resolution_id=bug_resolution)
-    messege.save(auth_user = auth_user)
+    messege = Messeges(message=message, user=user, bug_resolution_id=bug_resolution)
+    messege.save(auth_user = auth_user)                         # single insert, audit fields are set before it
     
     file_response = _add_files_to_obj(messege, files, auth_user)
     
     return ({"response": "Messege Successfully added to bug resolution", "files": file_response})
 
 def upload_media_return_id(files, auth_user: User = None, *args, **kwargs):
-    upload_status = []
-    for file in files:
-        media_store = MediaStore.objects.create(media_file=file, media_type=file.content_type)
-        media_store.save(auth_user = auth_user)
-        upload_status.append(media_store.id)
+    media_stores = _create_media(files, auth_user)
+    if media_stores is None:
+        return {"error": "Please login and try again"}
 
-    return {'response': 'Upload Successful', 'id': upload_status}
+    return {'response': 'Upload Successful', 'id': [media_store.id for media_store in media_stores]}
 
 def _add_files_to_obj(obj, files, auth_user: User = None):
     
     if obj is None:
         return {"status": "Error : Invalid data"}
 
-    if files is []:
+    if not files:
         return {"status": "No Files to add"}
-    # upload_status = []
-    for file in files:
-        # upload_status.append(upload_media_return_id(file, auth_user)) object retuns ID, needs instance of object, commented to work on later
-        media_store = MediaStore.objects.create(media_file=file, media_type=file.content_type)
-        media_store.save(auth_user = auth_user)
-        obj.attachments.add(media_store)
+
+    media_stores = _create_media(files, auth_user)
+    if media_stores is None:
+        return {"status": "Error : Please login and try again"}
+    obj.attachments.add(*media_stores)                          # one insert into the through table for all files
 
     return ({"response": "Files Successfully added to object"})
 
+def _create_media(files, auth_user: User = None):
+    # a new MediaStore per file, in the order of files, None if no user is available for the audit fields
+    if auth_user is None:
+        auth_user = get_request_user()                          # bulk_create skips BaseModel.save, resolve the user here
+        if auth_user is None:
+            return None
+
+    hashes = [_content_hash(file) for file in files]
+    # identical content shares its stored file and thumbnails, soft deleted media included, only the rows are per upload
+    stored = {content_hash: (name, ready) for content_hash, name, ready in MediaStore.all_objects.filter(content_hash__in=set(hashes)).values_list('content_hash', 'media_file', 'thumbnails_ready')}
+    new_files = {}                                              # hash -> first file with that content
+    for file, content_hash in zip(files, hashes):
+        if content_hash not in stored:
+            new_files.setdefault(content_hash, file)
+    written_names = _store_files(list(new_files.values()))
+    stored.update((content_hash, (name, False)) for content_hash, name in zip(new_files, written_names))
+
+    try:
+        with transaction.atomic():
+            created = MediaStore.objects.bulk_create([
+                MediaStore(
+                    media_file=stored[content_hash][0], media_type=file.content_type, content_hash=content_hash, thumbnails_ready=stored[content_hash][1],
+                    created_by_id=auth_user.pk, modified_by_id=auth_user.pk,
+                )
+                for file, content_hash in zip(files, hashes)
+            ])
+    except Exception:
+        media_storage = MediaStore._meta.get_field('media_file').storage
+        for name in written_names:                              # do not leave orphan files behind
+            media_storage.delete(name)
+        raise
+
+    for name in {media.media_file.name for media in created if is_image(media.media_type) and not media.thumbnails_ready}:
+        transaction.on_commit(lambda name=name: schedule_thumbnails(name))     # generated off the request path, once the rows are committed
+    return created
+
+def _content_hash(file):
+    content_hash = getattr(file, 'sha256', None)                # set while streaming by tracker.uploadhandlers
+    if content_hash is None:
+        sha256 = hashlib.sha256()
+        for chunk in file.chunks():
+            sha256.update(chunk)
+        file.seek(0)
+        content_hash = sha256.hexdigest()
+    return content_hash
+
+def _store_files(files):
+    field = MediaStore._meta.get_field('media_file')
+
+    def store(file):
+        name = field.generate_filename(None, file.name)
+        return field.storage.save(name, file, max_length=field.max_length)
+
+    if len(files) <= 1:
+        return [store(file) for file in files]
+    with ThreadPoolExecutor(max_workers=min(MEDIA_UPLOAD_WORKERS, len(files))) as pool:
+        return list(pool.map(store, files))
+
+
+def bulk_create_bugs(bugs, auth_user: User):
+    # bugs are validated dicts of BugBulkCreate.InputSerializer, returns one result per bug, in order
+    if auth_user is None:
+        raise ValueError("kindly provide auth_user")            # bulk_create skips BaseModel.save, the audit fields are set here
+
+    team_ids = {bug['team'] for bug in bugs if bug.get('team') is not None}
+    user_ids = {bug['found_by'] for bug in bugs if bug.get('found_by') is not None}
+    media_ids = {media_id for bug in bugs for media_id in bug.get('attachments', [])}
+    existing = {
+        'team': set(Teams.objects.filter(id__in=team_ids).values_list('id', flat=True)),
+        'found_by': set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)),
+        'attachments': set(MediaStore.objects.filter(id__in=media_ids).values_list('id', flat=True)),
+    }
+
+    results = []
+    to_create = []
+    for index, bug in enumerate(bugs):
+        errors = {}
+        for field in ('team', 'found_by'):
+            if bug.get(field) is not None and bug[field] not in existing[field]:
+                errors[field] = ['Invalid pk "%s" - object does not exist.' % bug[field]]
+        missing = [media_id for media_id in bug.get('attachments', []) if media_id not in existing['attachments']]
+        if missing:
+            errors['attachments'] = ['Invalid pk "%s" - object does not exist.' % media_id for media_id in missing]
+        if errors:
+            results.append({"index": index, "status": "error", "errors": errors})
+            continue
+        results.append({"index": index, "status": "created"})
+        to_create.append((results[-1], bug))
+
+    with transaction.atomic():
+        created = Bug.objects.bulk_create([
+            Bug(
+                title=bug['title'], description=bug.get('description'), reproduction_steps=bug.get('reproduction_steps'),
+                found_by_id=bug.get('found_by'), team_id=bug.get('team'),
+                attachment_count=len(set(bug.get('attachments', []))),              # the through rows below are bulk inserted, no signal counts them
+                created_by_id=auth_user.pk, modified_by_id=auth_user.pk,                # audit fields are filled once for the whole batch
+            )
+            for _, bug in to_create
+        ])
+        Bug.attachments.through.objects.bulk_create([
+            Bug.attachments.through(bug_id=obj.id, mediastore_id=media_id)
+            for obj, (_, bug) in zip(created, to_create)
+            for media_id in set(bug.get('attachments', []))
+        ])
+        index_bugs(created)                                     # bulk_create sends no post_save, index the batch in one go
+
+    for obj, (result, _) in zip(created, to_create):
+        result['pk'] = obj.id
+    return results
@@ -0,0 +1,101 @@
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from user.models import User
+
+from .models import Teams, Bug, BugResolution, BugDuplicate, Messeges, adjust_counters
+from .membership import team_membership
+from .duplicates import index_bug, link_duplicate, rebuild_clusters
+
+
+@receiver(m2m_changed, sender=User.teams.through)
+def drop_membership_on_team_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:                                         # team.users.add(...), instance is the team
+        team_membership.invalidate([instance.pk])
+    elif pk_set:                                        # user.teams.add(...), pk_set holds team ids
+        team_membership.invalidate(pk_set)
+    else:                                               # user.teams.clear(), the cleared teams are no longer known
+        team_membership.invalidate()
+
+
+@receiver(post_save, sender=Teams)
+@receiver(post_delete, sender=Teams)
+def drop_membership_on_team_save(sender, instance, **kwargs):
+    team_membership.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def drop_membership_on_user_save(sender, instance, created, **kwargs):
+    if created:                                         # a new user has no teams yet
+        return
+    team_membership.invalidate(User.teams.through.objects.filter(user_id=instance.pk).values_list('teams_id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def drop_membership_on_user_delete(sender, instance, **kwargs):
+    team_membership.invalidate()                        # the user's team rows are already gone
+
+
+@receiver(post_save, sender=Bug)
+def index_bug_on_save(sender, instance, raw=False, **kwargs):
+    if raw:                                             # loaddata, the index is rebuilt by the migration backfill or index_bugs
+        return
+    index_bug(instance)                                 # also drops the bug from the index once it is soft deleted
+
+
+@receiver(post_save, sender=BugDuplicate)
+def update_clusters_on_duplicate_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created and instance.deleted_at is None:         # the common case, merging two clusters is a single update
+        link_duplicate(instance.parent_id, instance.child_id)
+    else:                                               # soft deleted or re-pointed, the cluster may split
+        rebuild_clusters([instance.parent_id, instance.child_id])
+
+
+@receiver(post_delete, sender=BugDuplicate)
+def update_clusters_on_duplicate_delete(sender, instance, **kwargs):
+    rebuild_clusters([instance.parent_id, instance.child_id])
+
+
+
+# attachments are added and removed by the serializers and by obj.attachments.add() in the services, the counters follow the through tables.
+# bulk_create_bugs fills Bug.attachment_count of its new rows itself, bulk inserts into the through table send no signal.
+
+def attachments_change(action, pk_set, attached):
+    # (sign, ids of the other side whose count moves) for an m2m_changed of attachments, None for the uncounted actions
+    # both directions count the rows of the attached queryset, so a soft deleted row is neither added nor removed
+    if action == 'post_add':                            # pk_set only holds the newly attached rows
+        return 1, list(attached.filter(pk__in=pk_set).values_list('pk', flat=True))
+    if action == 'pre_remove':
+        return -1, list(attached.filter(pk__in=pk_set).values_list('pk', flat=True))
+    if action == 'pre_clear':
+        return -1, list(attached.values_list('pk', flat=True))
+    return None
+
+@receiver(m2m_changed, sender=Bug.attachments.through)
+def count_bug_attachments(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:                                     # bug.attachments.add(...), pk_set holds media ids
+        change = attachments_change(action, pk_set, instance.attachments.all())
+        if change is not None:
+            adjust_counters(Bug.all_objects.filter(pk=instance.pk), attachment_count=change[0] * len(change[1]))
+    elif instance.deleted_at is None:                   # media.bug_attachments.add(...), pk_set holds bug ids
+        change = attachments_change(action, pk_set, Bug.all_objects.filter(attachments=instance))
+        if change is not None:
+            adjust_counters(Bug.all_objects.filter(pk__in=change[1]), attachment_count=change[0])
+
+@receiver(m2m_changed, sender=Messeges.attachments.through)
+def count_message_attachments(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:                                     # message.attachments.add(...), pk_set holds media ids
+        change = attachments_change(action, pk_set, instance.attachments.all()) if instance.deleted_at is None else None
+        if change is not None:
+            adjust_counters(BugResolution.all_objects.filter(pk=instance.bug_resolution_id_id), attachment_count=change[0] * len(change[1]))
+    elif instance.deleted_at is None:                   # media.messeges_attachments.add(...), pk_set holds message ids
+        change = attachments_change(action, pk_set, Messeges.objects.filter(attachments=instance))
+        if change is not None:
+            per_resolution = Messeges.objects.filter(pk__in=change[1]).values_list('bug_resolution_id').annotate(count=Count('pk')).order_by()
+            for bug_resolution_id, count in per_resolution:
+                adjust_counters(BugResolution.all_objects.filter(pk=bug_resolution_id), attachment_count=change[0] * count)
@@ -1,3 +1,811 @@
-from django.test import TestCase
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.handlers.asgi import ASGIHandler
+from django.http import HttpResponse
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_save
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from PIL import Image
+from rest_framework.test import APIClient
+from silk.models import Request
+
+from api.serializers import MediaStoreSerializer
+from user.models import User
+from user.tokens import ClaimsRefreshToken
+from api.tests import as_request_user, make_bug, make_message, make_resolution, make_team, make_user
+
+from . import thumbnails
+from .duplicates import (
+    MIN_SIMILARITY, NUM_BANDS, NUM_PERM, band_buckets, bug_signature, cluster_members, estimated_similarity, index_bug, link_duplicate,
+    minhash_signature, pack_signature, resolve_clusters, shingles, similar_bugs, unpack_signature,
+)
+from .middlewares import ReplicaRoutingMiddleware, RequestMiddleware, StaticFilesMiddleware, get_request, get_request_user
+from .media import can_access_media, signed_media_url, source_name, verify_signature
+from .membership import TeamMembershipIndex, is_member, team_membership
+from .counters import reconcile_counters
+from .models import Bug, BugCluster, CountedModel, BugDuplicate, BugResolution, BugSignature, BugWatch, MediaStore, Messeges, Teams
+from .profiling import ProfileBuffer, SampledSilkyMiddleware
+from .routers import PrimaryReplicaRouter, get_routing_state, record_writes, start_routing, stop_routing, use_primary
+from .services import _create_media, upload_media_return_id
+from .views import _requested_range
+from .thumbnails import generate_thumbnails, icon_thumbnails_ready, record_thumbnails, schedule_thumbnails, thumbnail_name
+
+
+class MediaTestCase(TestCase):
+    # media is written to a temporary MEDIA_ROOT
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', is_staff=True, is_superuser=True)
+        cls.alice = make_user('alice')
+        cls.bob = make_user('bob')
+        cls.team = make_team('Core', cls.alice, cls.admin, members=[cls.bob])
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % ClaimsRefreshToken.for_user(user).access_token)
+        return client
+
+    def upload(self, user, *contents):
+        files = [SimpleUploadedFile('report.txt', content, content_type='text/plain') for content in contents]
+        return MediaStore.objects.filter(pk__in=upload_media_return_id(files, auth_user=user)['id']).order_by('pk')
+
+
+class MediaDeduplicationTests(MediaTestCase):
+    def test_identical_uploads_share_the_stored_file_not_the_row(self):
+        first, = self.upload(self.alice, b'same content')
+        second, = self.upload(self.bob, b'same content')
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual((first.created_by_id, second.created_by_id), (self.alice.pk, self.bob.pk))
+        self.assertEqual(first.media_file.name, second.media_file.name)
+        self.assertEqual(first.content_hash, second.content_hash)
+
+    def test_duplicates_in_one_upload_are_stored_once(self):
+        first, second, other = self.upload(self.alice, b'same content', b'same content', b'other content')
+        self.assertEqual(first.media_file.name, second.media_file.name)
+        self.assertNotEqual(first.media_file.name, other.media_file.name)
+        with second.media_file.open('rb') as file:
+            self.assertEqual(file.read(), b'same content')
+
+    def test_file_of_soft_deleted_media_is_reused(self):
+        deleted, = self.upload(self.alice, b'same content')
+        deleted.soft_delete(auth_user=self.alice)
+        media, = self.upload(self.alice, b'same content')
+        self.assertEqual(media.media_file.name, deleted.media_file.name)
+        self.assertIsNone(media.deleted_at)
+
+
+def png(color='red', size=(640, 480)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class ThumbnailTests(MediaTestCase):
+    def upload_image(self, user, content):
+        media_stores = _create_media([SimpleUploadedFile('photo.png', content, content_type='image/png')], user)
+        return media_stores[0]
+
+    def test_urls_are_read_from_the_row_without_touching_storage(self):
+        media = self.upload_image(self.alice, png())
+        with mock.patch.object(FileSystemStorage, 'exists', side_effect=AssertionError('storage stat on read')), \
+                mock.patch('tracker.thumbnails.schedule_thumbnails', side_effect=AssertionError('queued on read')):
+            self.assertEqual(MediaStoreSerializer(media).data['thumbnails'], {'small': None, 'medium': None})
+            media.thumbnails_ready = True
+            urls = MediaStoreSerializer(media).data['thumbnails']
+        self.assertTrue(urls['small'].startswith('/media/thumbnails/128x128/%s.jpg?' % media.media_file.name))
+
+    def test_generation_is_recorded_on_every_row_of_the_file(self):
+        first = self.upload_image(self.alice, png())
+        second = self.upload_image(self.bob, png())
+        other = self.upload_image(self.bob, png('blue'))
+        self.assertEqual(first.media_file.name, second.media_file.name)
+        generate_thumbnails(first.media_file.name)
+        record_thumbnails(first.media_file.name)
+        rows = {media.pk: media for media in MediaStore.objects.filter(pk__in=[first.pk, second.pk, other.pk])}
+        self.assertTrue(rows[first.pk].thumbnails_ready and rows[second.pk].thumbnails_ready)
+        self.assertFalse(rows[other.pk].thumbnails_ready)
+        self.assertGreater(rows[first.pk].modified_at, first.modified_at)
+        self.assertTrue(default_storage.exists(thumbnail_name(first.media_file.name, 512, 512)))
+        # a later upload of the same content starts with its thumbnails
+        self.assertTrue(self.upload_image(self.alice, png()).thumbnails_ready)
+
+    def test_command_backfills_images_and_icons(self):
+        media = self.upload_image(self.alice, png('green'))
+        self.alice.icon = default_storage.save('user_icons/alice.png', ContentFile(png('yellow')))
+        self.alice.save()
+        call_command('generate_thumbnails', stdout=StringIO())
+        media.refresh_from_db()
+        self.alice.refresh_from_db()
+        self.assertTrue(media.thumbnails_ready)
+        self.assertTrue(icon_thumbnails_ready(self.alice))
+        self.assertTrue(default_storage.exists(thumbnail_name(self.alice.icon.name, 128, 128)))
+
+    def test_failures_are_retried_after_a_while_and_bounded(self):
+        with mock.patch('tracker.thumbnails._failed', {}) as failed, mock.patch('tracker.thumbnails.FAILED_MAX', 2), \
+                mock.patch('tracker.thumbnails.generate_thumbnails', side_effect=OSError('not an image')), \
+                mock.patch('tracker.thumbnails._executor') as executor, mock.patch('tracker.thumbnails.connection'):
+            with self.assertLogs('tracker.thumbnails', 'ERROR'):
+                for name in ('a.png', 'b.png', 'c.png'):
+                    thumbnails._generate_and_release(name, default_storage)
+            self.assertEqual(list(failed), ['b.png', 'c.png'])
+            schedule_thumbnails('c.png')
+            executor.submit.assert_not_called()
+            failed['c.png'] -= thumbnails.FAILED_RETRY_AFTER
+            schedule_thumbnails('c.png')
+            executor.submit.assert_called_once()
+            self.assertNotIn('c.png', failed)
+        thumbnails._pending.discard('c.png')
+
+
+@override_settings(SILK_SAMPLE_RATE=0)
+class MetricsTests(TestCase):
+    def test_closed_without_a_token(self):
+        with override_settings(METRICS_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(METRICS_TOKEN='', DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_requests_are_labeled_by_route(self):
+        self.client.get('/api/bugs/12345/')
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token').content.decode()
+        self.assertIn('http_requests_total{route="api/bugs/<id>/",method="GET",status="401"}', body)
+        self.assertIn('http_request_db_queries_bucket{route="api/bugs/<id>/",method="GET",le="+Inf"}', body)
+
+
+class TeamMembershipIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', is_staff=True, is_superuser=True)
+        cls.alice = make_user('alice')
+        cls.bob = make_user('bob')
+        cls.team = make_team('Core', cls.alice, cls.admin)
+
+    def setUp(self):
+        team_membership.invalidate()
+
+    def test_members_are_loaded_once(self):
+        self.assertTrue(is_member(self.alice.pk, self.team.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_member(self.alice.pk, self.team.pk))
+            self.assertFalse(is_member(self.bob.pk, self.team.pk))
+            self.assertFalse(is_member(None, self.team.pk))
+
+    def test_membership_changes_drop_the_entry(self):
+        self.assertFalse(is_member(self.bob.pk, self.team.pk))
+        self.bob.teams.add(self.team)
+        self.assertTrue(is_member(self.bob.pk, self.team.pk))
+        self.team.users.remove(self.bob)
+        self.assertFalse(is_member(self.bob.pk, self.team.pk))
+
+    def test_soft_deleted_users_and_teams_have_no_members(self):
+        self.assertTrue(is_member(self.alice.pk, self.team.pk))
+        self.alice.soft_delete(auth_user=self.admin)
+        self.assertFalse(is_member(self.alice.pk, self.team.pk))
+        self.bob.teams.add(self.team)
+        self.team.soft_delete(auth_user=self.admin)
+        self.assertFalse(is_member(self.bob.pk, self.team.pk))
+
+    def test_entries_expire_after_the_ttl(self):
+        index = TeamMembershipIndex(ttl=0)
+        with self.assertNumQueries(2):
+            index.members(self.team.pk)
+            index.members(self.team.pk)
+
+
+class ActivityCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', is_staff=True, is_superuser=True)
+        cls.alice = make_user('alice')
+        cls.team = make_team('Core', cls.alice, cls.admin)
+        cls.other_team = make_team('Other', cls.alice, cls.admin)
+
+    def setUp(self):
+        self.bug = make_bug('Login crashes', self.team, self.alice)
+        self.media = MediaStore(media_file='attachments/log.txt', media_type='text/plain')
+        self.media.save(auth_user=self.alice)
+
+    def counts(self, obj, *fields):
+        return tuple(type(obj).all_objects.filter(pk=obj.pk).values_list(*fields).get())
+
+    def test_bug_watchers_and_attachments(self):
+        watch = BugWatch(bug=self.bug, watcher=self.alice)
+        watch.save(auth_user=self.alice)
+        self.bug.attachments.add(self.media)
+        self.assertEqual(self.counts(self.bug, 'watcher_count', 'attachment_count'), (1, 1))
+        watch.soft_delete(auth_user=self.alice)
+        self.media.soft_delete(auth_user=self.alice)
+        self.assertEqual(self.counts(self.bug, 'watcher_count', 'attachment_count'), (0, 0))
+        self.bug.attachments.clear()                            # the soft deleted media is no longer counted
+        self.assertEqual(self.counts(self.bug, 'attachment_count'), (0,))
+
+    def test_soft_deleted_attachments_are_not_counted_either_way(self):
+        deleted = MediaStore(media_file='attachments/old.txt', media_type='text/plain')
+        deleted.save(auth_user=self.alice)
+        deleted.soft_delete(auth_user=self.alice)
+        resolution = make_resolution(self.bug, self.alice)
+        message = make_message(resolution, self.alice)
+        for obj, counted in ((self.bug, self.bug), (message, resolution)):
+            obj.attachments.add(deleted, self.media)
+            self.assertEqual(self.counts(counted, 'attachment_count'), (1,))
+            obj.attachments.remove(deleted)
+            self.assertEqual(self.counts(counted, 'attachment_count'), (1,))
+            obj.attachments.add(deleted)
+            obj.attachments.clear()
+            self.assertEqual(self.counts(counted, 'attachment_count'), (0,))
+        deleted.bug_attachments.add(self.bug)                   # from the media side
+        self.assertEqual(self.counts(self.bug, 'attachment_count'), (0,))
+        self.assertEqual(reconcile_counters(), {'Teams': 0, 'Bug': 0, 'BugResolution': 0})
+
+    def test_resolution_messages_and_open_resolutions(self):
+        resolution = make_resolution(self.bug, self.alice)
+        self.assertEqual(self.counts(self.team, 'open_resolution_count'), (1,))
+        message = make_message(resolution, self.alice, attachments=[self.media])
+        make_message(resolution, self.alice)
+        self.assertEqual(self.counts(resolution, 'message_count', 'attachment_count'), (2, 1))
+        message.soft_delete(auth_user=self.alice)
+        self.assertEqual(self.counts(resolution, 'message_count', 'attachment_count'), (1, 0))
+
+        self.bug.team = self.other_team                         # the open resolution moves with its bug
+        self.bug.save(auth_user=self.alice)
+        self.assertEqual((self.counts(self.team, 'open_resolution_count'), self.counts(self.other_team, 'open_resolution_count')), ((0,), (1,)))
+        resolution.end_time = timezone.now()
+        with as_request_user(self.alice):
+            resolution.save(self.alice)
+        self.assertEqual(self.counts(self.other_team, 'open_resolution_count'), (0,))
+
+    def test_concurrent_updates_are_not_lost(self):
+        stale = Bug.objects.get(pk=self.bug.pk)                 # loaded before the watch below
+        BugWatch(bug=self.bug, watcher=self.alice).save(auth_user=self.alice)
+        stale.title = 'Login crashes on android'
+        stale.save(auth_user=self.alice)                        # watcher_count is not editable, the save leaves it alone
+        self.assertEqual(self.counts(self.bug, 'watcher_count'), (1,))
+
+    def test_full_saves_stay_full_saves(self):
+        seen = []
+
+        def receiver(sender, update_fields, created, **kwargs):
+            seen.append((created, update_fields))
+        post_save.connect(receiver, sender=Teams)
+        self.addCleanup(post_save.disconnect, receiver, sender=Teams)
+        self.team.save(auth_user=self.alice)
+        new_team = Teams(pk=self.team.pk + 1000, team_name='Never loaded', team_leader=self.alice, open_resolution_count=2)
+        new_team.save(auth_user=self.alice)                     # the row does not exist, the save falls back to an insert
+        self.assertEqual(seen, [(False, None), (True, None)])
+        self.assertEqual(self.counts(new_team, 'open_resolution_count'), (2,))
+        Teams.all_objects.filter(pk=self.team.pk).update(open_resolution_count=4)
+        self.team.open_resolution_count = 0
+        self.team.save(auth_user=self.alice, update_fields=['open_resolution_count'])   # named counters are written
+        self.assertEqual(self.counts(self.team, 'open_resolution_count'), (0,))
+
+    def test_counted_models_must_implement_update_counters(self):
+        self.assertEqual([error.id for error in BugWatch.check()], [])
+        with mock.patch.object(BugWatch, 'update_counters', CountedModel.update_counters):
+            self.assertEqual([error.id for error in BugWatch.check()], ['tracker.E001'])
+
+    def test_reconcile_fixes_drifted_counters(self):
+        resolution = make_resolution(self.bug, self.alice)
+        make_message(resolution, self.alice, attachments=[self.media])
+        self.bug.attachments.add(self.media)
+        Bug.all_objects.filter(pk=self.bug.pk).update(attachment_count=5, watcher_count=-1)
+        BugResolution.all_objects.filter(pk=resolution.pk).update(message_count=0)
+        Teams.all_objects.filter(pk=self.team.pk).update(open_resolution_count=3)
+
+        corrected = reconcile_counters(batch_size=1)
+        self.assertEqual((corrected['Bug'], corrected['BugResolution'], corrected['Teams']), (1, 1, 1))
+        self.assertEqual(self.counts(self.bug, 'attachment_count', 'watcher_count'), (1, 0))
+        self.assertEqual(self.counts(resolution, 'message_count', 'attachment_count'), (1, 1))
+        self.assertEqual(self.counts(self.team, 'open_resolution_count'), (1,))
+        self.assertEqual(reconcile_counters(), {'Teams': 0, 'Bug': 0, 'BugResolution': 0})
+
+        output = StringIO()
+        call_command('reconcile_counters', '--model', 'Bug', stdout=output)
+        self.assertIn('Bug            0 rows corrected', output.getvalue())
+
+
+class RequestMiddlewareTests(SimpleTestCase):
+    def test_request_is_exposed_while_it_is_served(self):
+        seen = []
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        RequestMiddleware(lambda request: seen.append((get_request(), get_request_user())) or HttpResponse())(request)
+        self.assertEqual(seen, [(request, None)])
+        self.assertIsNone(get_request())
+
+    def test_request_is_reset_when_the_view_raises(self):
+        def view(request):
+            raise ValueError
+        with self.assertRaises(ValueError):
+            RequestMiddleware(view)(RequestFactory().get('/'))
+        self.assertIsNone(get_request())
+
+    def test_concurrent_async_requests_do_not_see_each_other(self):
+        async def view(request):
+            await asyncio.sleep(0.01)                          # every request is in flight at once
+            return HttpResponse(get_request().path)
+        middleware = RequestMiddleware(view)
+
+        async def serve():
+            return await asyncio.gather(*[middleware(RequestFactory().get('/%d/' % index)) for index in range(5)])
+        self.assertEqual([response.content for response in asyncio.run(serve())], [b'/%d/' % index for index in range(5)])
+        self.assertIsNone(get_request())
+
+
+class MediaIngestionTests(MediaTestCase):
+    def files(self, *contents):
+        return [SimpleUploadedFile('report-%d.txt' % index, content, content_type='text/plain') for index, content in enumerate(contents)]
+
+    def test_upload_inserts_all_rows_at_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_for(self.alice).post('/api/etc/upload/', {'attachment': self.files(b'one', b'two', b'three')}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "tracker_mediastore"')]
+        self.assertEqual(len(inserts), 1)
+        media = MediaStore.objects.in_bulk(response.data['id'])
+        self.assertEqual([media[pk].media_file.read() for pk in response.data['id']], [b'one', b'two', b'three'])
+        self.assertEqual({media.created_by_id for media in media.values()}, {self.alice.pk})
+        self.assertEqual(self.client_for(self.alice).post('/api/etc/upload/', {}, format='multipart').status_code, 400)
+
+    def test_message_attachments_are_linked(self):
+        resolution = make_resolution(make_bug('Crash', self.team, self.bob), self.alice)
+        response = self.client_for(self.bob).post('/api/etc/comments/add/', {
+            'message': 'Logs attached', 'user_id': self.bob.pk, 'bug_resolution_id': resolution.pk, 'attachments': self.files(b'first log', b'second log'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        message = Messeges.objects.get(message='Logs attached')
+        self.assertEqual(sorted(media.media_file.read() for media in message.attachments.all()), [b'first log', b'second log'])
+
+    def test_stored_files_are_removed_when_the_insert_fails(self):
+        self.upload(self.alice, b'stored before')
+        stored = default_storage.listdir('attachments')[1]
+        with mock.patch.object(MediaStore.objects, 'bulk_create', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            _create_media(self.files(b'orphan'), self.alice)
+        self.assertEqual(default_storage.listdir('attachments')[1], stored)
+
+    def test_a_user_is_needed(self):
+        self.assertEqual(upload_media_return_id(self.files(b'anonymous')), {'error': 'Please login and try again'})
+        self.assertFalse(MediaStore.objects.exists())
+
+
+class MediaServingTests(MediaTestCase):
+    def setUp(self):
+        cache.clear()                                           # permission decisions are cached
+        self.media, = self.upload(self.alice, b'0123456789')
+        self.name = self.media.media_file.name
+
+    def test_signed_urls(self):
+        response = self.client.get(signed_media_url(self.name))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertRegex(response['Cache-Control'], r'^private, max-age=\d+$')
+        self.assertEqual(self.client.get(signed_media_url(self.name)[:-1] + '0').status_code, 404)
+
+    def test_signatures_expire_and_are_bound_to_the_name(self):
+        url = signed_media_url(self.name)
+        query = dict(pair.split('=') for pair in url.split('?')[1].split('&'))
+        self.assertTrue(verify_signature(self.name, query['e'], query['s']))
+        self.assertFalse(verify_signature('attachments/other.txt', query['e'], query['s']))
+        self.assertFalse(verify_signature(self.name, 'soon', query['s']))
+        self.assertFalse(verify_signature(self.name, query['e'], ''))
+        with mock.patch('tracker.media.time.time', return_value=int(query['e']) + 1):
+            self.assertFalse(verify_signature(self.name, query['e'], query['s']))
+
+    def test_unsigned_requests_need_permission(self):
+        url = '/media/' + self.name
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client_for(self.alice).get(url).status_code, 200)          # the uploader
+        self.assertEqual(self.client_for(self.bob).get(url).status_code, 404)
+        make_bug('With a log', self.team, self.alice).attachments.add(self.media)
+        cache.clear()
+        self.assertEqual(self.client_for(self.bob).get(url).status_code, 200)            # member of the bug's team
+        self.assertEqual(self.client_for(self.alice).get('/media/../settings.py').status_code, 404)
+
+    def test_permissions(self):
+        outsider = make_user('outsider')
+        self.assertFalse(can_access_media(None, self.name))
+        self.assertFalse(can_access_media(AnonymousUser(), self.name))
+        self.assertTrue(can_access_media(self.admin, self.name))
+        self.assertTrue(can_access_media(outsider, 'user_icons/alice.png'))
+        self.assertFalse(can_access_media(outsider, self.name))
+        self.assertEqual(source_name(thumbnail_name(self.name, 128, 128)), self.name)
+        self.assertTrue(can_access_media(self.alice, thumbnail_name(self.name, 128, 128)))
+
+    def test_ranges(self):
+        url = signed_media_url(self.name)
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, 'bytes 2-5/10'))
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        response = self.client.get(url, HTTP_RANGE='bytes=20-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_range_parsing(self):
+        def requested(header, size=10, **headers):
+            return _requested_range(RequestFactory().get('/', HTTP_RANGE=header, **headers), size, '"etag"', 1000)
+        self.assertEqual(requested('bytes=0-'), (0, 9))
+        self.assertEqual(requested('bytes=3-100'), (3, 9))
+        self.assertEqual(requested('bytes=-4'), (6, 9))
+        self.assertEqual(requested('bytes=-40'), (0, 9))
+        self.assertEqual(requested('bytes=-0'), 'unsatisfiable')
+        self.assertEqual(requested('bytes=10-'), 'unsatisfiable')
+        self.assertEqual(requested('bytes=5-2'), 'unsatisfiable')
+        self.assertIsNone(requested(''))
+        self.assertIsNone(requested('bytes=-'))
+        self.assertIsNone(requested('bytes=0-1,4-5'))            # several ranges, the whole file is sent
+        self.assertIsNone(requested('items=0-1'))
+        self.assertEqual(requested('bytes=0-1', HTTP_IF_RANGE='"etag"'), (0, 1))
+        self.assertIsNone(requested('bytes=0-1', HTTP_IF_RANGE='"other"'))
+
+
+class DuplicateTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', is_staff=True, is_superuser=True)
+        cls.alice = make_user('alice')
+        cls.team = make_team('Core', cls.alice, cls.admin)
+
+
+CRASH = ('App crashes on login', 'The android app closes right after the password is typed and the login button is pressed')
+
+
+class SimilarBugTests(DuplicateTestCase):
+    def test_signatures(self):
+        self.assertEqual(shingles('Login crash'), {'login', 'crash', 'login crash'})
+        self.assertIsNone(minhash_signature(shingles('', None, None)))
+        signature = minhash_signature(shingles(*CRASH))
+        self.assertEqual(len(signature), NUM_PERM)
+        self.assertEqual(unpack_signature(pack_signature(signature)), tuple(signature))
+        buckets = band_buckets(signature)
+        self.assertEqual(len(buckets), NUM_BANDS)
+        self.assertTrue(all(-2 ** 63 <= bucket < 2 ** 63 for bucket in buckets))
+        self.assertEqual(buckets, band_buckets(minhash_signature(shingles(*CRASH))))     # fixed salts, stored signatures stay comparable
+
+    def test_similarity_estimates_jaccard(self):
+        words = ['word%d' % index for index in range(200)]
+        first, second = set(words[:150]), set(words[50:])               # jaccard 100 / 200
+        similarity = estimated_similarity(minhash_signature(first), minhash_signature(second))
+        self.assertAlmostEqual(similarity, 0.5, delta=0.15)
+        self.assertEqual(estimated_similarity(minhash_signature(first), minhash_signature(set(first))), 1.0)
+
+    def test_similar_bugs_of_the_same_team(self):
+        bug = make_bug(CRASH[0], self.team, self.alice, description=CRASH[1])
+        rephrased = make_bug('App crashes on login', self.team, self.alice, description='The android app closes right after the password is typed')
+        make_bug('Dark mode colors', self.team, self.alice, description='The settings page ignores the dark theme')
+        make_bug(CRASH[0], make_team('Other', self.admin, self.admin), self.admin, description=CRASH[1])
+
+        similar = similar_bugs(bug)
+        self.assertEqual([candidate for candidate, similarity in similar], [rephrased])
+        self.assertGreaterEqual(similar[0][1], MIN_SIMILARITY)
+        rephrased.soft_delete(auth_user=self.alice)                     # dropped from the index
+        self.assertEqual(similar_bugs(bug), [])
+        self.assertFalse(BugSignature.objects.filter(bug=rephrased).exists())
+
+    def test_unchanged_bugs_are_not_reindexed(self):
+        bug = make_bug(CRASH[0], self.team, self.alice, description=CRASH[1])
+        with self.assertNumQueries(1):                                  # the stored signature is read and left as is
+            index_bug(bug)
+        bug.description = 'Only the title is left the same'
+        bug.save(auth_user=self.alice)
+        self.assertEqual(unpack_signature(BugSignature.objects.get(bug=bug).signature), tuple(bug_signature(bug)))
+
+    def test_created_bugs_list_their_possible_duplicates(self):
+        bug = make_bug(CRASH[0], self.team, self.alice, description=CRASH[1])
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % ClaimsRefreshToken.for_user(self.alice).access_token)
+        response = client.post('/api/bugs/', {'title': CRASH[0], 'description': CRASH[1], 'team': self.team.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['possible_duplicates'], [{'pk': bug.pk, 'title': bug.title, 'similarity': 1.0}])
+
+
+class DuplicateClusterTests(DuplicateTestCase):
+    def setUp(self):
+        self.bugs = [make_bug('Bug %d' % index, self.team, self.alice) for index in range(5)]
+
+    def link(self, parent, child):
+        duplicate = BugDuplicate(parent=parent, child=child)
+        duplicate.save(auth_user=self.alice)
+        return duplicate
+
+    def canonical(self):
+        clusters = dict(BugCluster.objects.values_list('bug_id', 'canonical_id'))
+        return [clusters.get(bug.pk) for bug in self.bugs]
+
+    def test_union_find(self):
+        self.assertEqual(resolve_clusters([(1, 2), (3, 4), (2, 3), (4, 1), (5, 6)]), {1: 1, 2: 1, 3: 1, 4: 1, 5: 5, 6: 5})
+        self.assertEqual(resolve_clusters([]), {})
+
+    def test_links_merge_clusters_under_the_parents_canonical_bug(self):
+        a, b, c, d, e = self.bugs
+        self.link(a, b)
+        self.link(c, d)
+        self.assertEqual(self.canonical(), [a.pk, a.pk, c.pk, c.pk, None])
+        with self.assertNumQueries(4):                  # savepoint, locked read of both rows, one update of the child's cluster, release
+            link_duplicate(b.pk, c.pk)
+        self.assertEqual(self.canonical(), [a.pk] * 4 + [None])
+        self.assertEqual(set(cluster_members(d)), {a, b, c, d})
+        self.assertEqual(list(cluster_members(e)), [e])
+
+    def test_removed_links_split_clusters(self):
+        a, b, c, d, e = self.bugs
+        self.link(a, b)
+        bridge = self.link(b, c)
+        self.link(c, d)
+        bridge.soft_delete(auth_user=self.alice)
+        self.assertEqual(self.canonical(), [a.pk, a.pk, c.pk, c.pk, None])
+        self.link(d, e).delete()
+        self.assertEqual(self.canonical(), [a.pk, a.pk, c.pk, c.pk, None])
+
+    def test_canonical_bug_is_serialized(self):
+        a, b = self.bugs[:2]
+        self.link(a, b)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % ClaimsRefreshToken.for_user(self.alice).access_token)
+        canonical = {row['pk']: row['canonical_bug'] for row in client.get('/api/bugs/').json()['results']}
+        self.assertEqual(canonical, {a.pk: a.pk, b.pk: a.pk, **{bug.pk: bug.pk for bug in self.bugs[2:]}})
+
+
+@mock.patch('tracker.profiling.close_old_connections')      # the flush thread's connection handling, it would close the test transaction
+class SampledProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', is_staff=True, is_superuser=True)
+        cls.alice = make_user('alice')
+        cls.team = make_team('Core', cls.alice, cls.admin)
+
+    def setUp(self):
+        self.buffer = ProfileBuffer()
+        self.buffer._pid = os.getpid()                      # no flush thread, the tests flush themselves
+        patcher = mock.patch('tracker.profiling.profile_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer %s' % ClaimsRefreshToken.for_user(self.alice).access_token
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([query for query in queries if 'silk_' in query['sql']])     # requests never write to silk's tables
+        return queries
+
+    @override_settings(SILK_SAMPLE_RATE=1.0)
+    def test_sampled_requests_are_buffered_then_saved_in_one_go(self, close_old_connections):
+        queries = [query for query in self.get('/api/teams/') if not query['sql'].startswith('EXPLAIN')]     # silk explains each query
+        self.assertEqual(len(self.buffer.profiles), 1)
+        with self.assertNumQueries(5):                      # one insert per silk table inside a savepoint
+            with mock.patch.object(Request, 'garbage_collect'):
+                self.buffer.flush()
+        request = Request.objects.get()
+        self.assertEqual((request.path, request.num_sql_queries, request.response.status_code), ('/api/teams/', len(queries), 200))
+        self.assertEqual(request.queries.count(), len(queries))
+        self.assertFalse(self.buffer.profiles)
+
+    @override_settings(SILK_SAMPLE_RATE=0.0, SILK_SLOW_REQUEST_THRESHOLD=None)
+    def test_requests_left_out_are_not_captured(self, close_old_connections):
+        self.get('/api/teams/')
+        self.assertFalse(self.buffer.profiles)
+
+    def test_slow_requests_are_kept(self, close_old_connections):
+        with override_settings(SILK_SAMPLE_RATE=0.0, SILK_SLOW_REQUEST_THRESHOLD=100.0):
+            self.get('/api/teams/')
+        self.assertFalse(self.buffer.profiles)
+        with override_settings(SILK_SAMPLE_RATE=0.0, SILK_SLOW_REQUEST_THRESHOLD=0.0):
+            self.get('/api/teams/')
+        self.assertEqual(len(self.buffer.profiles), 1)
+
+    @override_settings(SILK_SAMPLE_RATE=1.0, SILK_ROUTES=['api/teams/<id>/'])
+    def test_only_listed_routes_are_profiled(self, close_old_connections):
+        self.get('/api/teams/')
+        self.get('/api/teams/%d/' % self.team.pk)
+        self.assertEqual([request.path for request, *rest in self.buffer.profiles], ['/api/teams/%d/' % self.team.pk])
+
+    @override_settings(SILK_SAMPLE_RATE=1.0)
+    def test_async_requests_are_sampled_in_the_event_loop(self, close_old_connections):
+        with self.settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()                                   # a sync only middleware would be adapted, and logged, here
+
+        async def view(request):
+            return HttpResponse(str(await Teams.objects.acount()))
+        middleware = SampledSilkyMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/api/teams/'))
+        self.assertEqual(response.content, b'1')
+        request, response_model, queries, profiles, profiler = self.buffer.profiles[0]
+        self.assertEqual((request.path, response_model.status_code, len(queries)), ('/api/teams/', 200, 1))
+
+    @override_settings(SILK_BUFFER_SIZE=1)
+    def test_full_buffer_drops_profiles(self, close_old_connections):
+        self.buffer.add('first')
+        self.buffer.add('second')
+        self.assertEqual((list(self.buffer.profiles), self.buffer.dropped), (['first'], 1))
+        with mock.patch('tracker.profiling.save_profiles') as save_profiles, self.assertLogs('tracker.profiling', 'WARNING'):
+            self.buffer.flush()
+        save_profiles.assert_called_once_with(['first'])
+        self.assertEqual(self.buffer.dropped, 0)
+
+
+class SeedDataTests(TestCase):
+    def seed(self, **options):
+        call_command('seed_data', teams=2, users_per_team=3, bugs_per_team=5, messages_per_resolution=2, no_files=True, stdout=StringIO(), **options)
+
+    def test_seeds_a_consistent_dataset(self):
+        self.seed()
+        self.assertEqual(User.objects.filter(username__startswith='seed-').count(), 7)
+        self.assertEqual(Teams.objects.count(), 2)
+        self.assertEqual(Bug.objects.count(), 10)
+        self.assertEqual(BugSignature.objects.count(), 10)                  # bulk_create sends no post_save, the index is built by the command
+        self.assertFalse(BugResolution.objects.exclude(bug__acceptance=True).exists())
+        self.assertEqual(Messeges.objects.count(), BugResolution.objects.count() * 2)
+        self.assertFalse(any(reconcile_counters().values()))                 # the counters are already right
+        self.assertTrue(User.objects.get(username='seed-t0-u0').check_password('benchmark'))
+        with self.assertRaises(CommandError):
+            self.seed()
+
+    def test_same_seed_gives_the_same_dataset(self):
+        self.seed(prefix='first')
+        self.seed(prefix='second')
+        titles = [list(Bug.objects.filter(team__team_name='%s team 0' % prefix).order_by('id').values_list('title', flat=True)) for prefix in ('first', 'second')]
+        self.assertEqual(titles[0], titles[1])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], DB_READ_YOUR_WRITES_WINDOW=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.atomic = mock.Mock(in_atomic_block=False)
+        patcher = mock.patch('tracker.routers.connections', {'default': self.atomic})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_a_replica_unless_pinned(self):
+        self.assertEqual(self.router.db_for_read(Bug), 'replica_0')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertIsNone(self.router.db_for_read(Bug))
+        self.atomic.in_atomic_block = True
+        self.assertEqual(self.router.db_for_read(Bug), 'default')
+        self.atomic.in_atomic_block = False
+        bug = Bug()
+        bug._state.db = 'default'
+        self.assertEqual(self.router.db_for_read(Bug, instance=bug), 'default')      # related rows are read where their instance came from
+
+    def execute(self, sql):
+        record_writes(lambda sql, params, many, context: None, sql, None, False, {})
+
+    def test_a_write_pins_the_rest_of_the_request(self):
+        token = start_routing()
+        try:
+            self.assertEqual(self.router.db_for_read(Bug), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Bug), 'default')
+            self.execute('SELECT 1 FOR UPDATE')
+            self.execute('SAVEPOINT "s1"')
+            self.assertEqual(self.router.db_for_read(Bug), 'replica_0')             # asking where to write is not a write
+            self.execute(' update "tracker_bug" SET "title" = %s')
+            self.assertEqual(self.router.db_for_read(Bug), 'default')
+            self.assertTrue(get_routing_state().wrote)
+        finally:
+            stop_routing(token)
+        self.assertEqual(self.router.db_for_read(Bug), 'replica_0')
+
+    @override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1', 'replica_2'])
+    def test_one_replica_per_request(self):
+        for _ in range(5):
+            token = start_routing()
+            try:
+                self.assertEqual(len({self.router.db_for_read(Bug) for _ in range(20)}), 1)
+            finally:
+                stop_routing(token)
+
+    def test_use_primary(self):
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Bug), 'default')
+        self.assertIsNone(get_routing_state())
+        token = start_routing()
+        try:
+            with use_primary():
+                self.assertEqual(self.router.db_for_read(Bug), 'default')
+            self.assertEqual(self.router.db_for_read(Bug), 'replica_0')             # pinned only inside
+            with use_primary():
+                self.execute('INSERT INTO "tracker_bug" DEFAULT VALUES')
+            self.assertEqual(self.router.db_for_read(Bug), 'default')               # unless it wrote
+        finally:
+            stop_routing(token)
+
+    def serve(self, request, write=False):
+        def view(request):
+            self.reads.append(self.router.db_for_read(Bug))
+            self.router.db_for_write(Bug)
+            if write:
+                self.execute('DELETE FROM "tracker_bugwatch"')
+            return HttpResponse()
+        self.reads = []
+        response = ReplicaRoutingMiddleware(view)(request)
+        return self.reads[0], response
+
+    def test_clients_that_wrote_read_their_writes(self):
+        factory = RequestFactory()
+        self.assertEqual(self.serve(factory.get('/'))[0], 'replica_0')
+        read, response = self.serve(factory.post('/'), write=True)
+        self.assertEqual(read, 'default')                                           # unsafe methods read from the primary
+        cookie = response.cookies['db_primary']
+        self.assertTrue(cookie['httponly'])
+        self.assertEqual(cookie['max-age'], 5)
+
+        request = factory.get('/')
+        request.COOKIES['db_primary'] = cookie.value
+        self.assertEqual(self.serve(request)[0], 'default')
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 10):
+            self.assertEqual(self.serve(request)[0], 'replica_0')                   # the window is over
+        request.COOKIES['db_primary'] = 'forged'
+        self.assertEqual(self.serve(request)[0], 'replica_0')
+        self.assertNotIn('db_primary', self.serve(factory.get('/'))[1].cookies)
+
+
+class ReplicaWriteTrackingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', is_staff=True, is_superuser=True)
+        cls.team = make_team('Core', cls.admin, cls.admin)
+        cls.bug = make_bug('Login crashes', cls.team, cls.admin)
+
+    def test_statements_run_on_the_primary_mark_the_write(self):
+        self.assertIn(record_writes, connection.execute_wrappers)
+        token = start_routing()
+        try:
+            Bug.objects.get_or_create(pk=self.bug.pk, defaults={'title': 'Unused'})     # looked up on the write database, writes nothing
+            list(self.bug.attachments.all())
+            self.assertFalse(get_routing_state().wrote)
+            self.bug.save(auth_user=self.admin)
+            self.assertTrue(get_routing_state().wrote)
+        finally:
+            stop_routing(token)
+
+
+class StaticFilesMiddlewareTests(SimpleTestCase):
+    def test_static_files_and_views_are_served_in_the_event_loop(self):
+        async def view(request):
+            return HttpResponse(b'view')
+        with tempfile.TemporaryDirectory() as static_root:
+            with open(os.path.join(static_root, 'app.css'), 'wb') as file:
+                file.write(b'body {}')
+            with self.settings(STATIC_ROOT=static_root):
+                middleware = StaticFilesMiddleware(view)
+            self.assertTrue(asyncio.iscoroutinefunction(middleware))
+            response = async_to_sync(middleware)(RequestFactory().get('/static/app.css'))
+            self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, b'body {}'))
+            response.close()
+        self.assertEqual(async_to_sync(middleware)(RequestFactory().get('/api/bugs/')).content, b'view')
@@ -0,0 +1,113 @@
+import logging
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.dispatch import Signal
+from django.utils import timezone
+
+from PIL import Image
+
+from .media import signed_media_url
+from .models import MediaStore
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = {'small': (128, 128), 'medium': (512, 512)}   # overridable with settings.THUMBNAIL_SIZES
+THUMBNAIL_WORKERS = 2
+FAILED_RETRY_AFTER = 3600   # seconds before a source Pillow could not read is queued again
+FAILED_MAX = 1000           # failures remembered, the oldest are forgotten first
+
+_executor = None
+_pending = set()            # source names already queued, the same image is never queued twice
+_failed = {}                # source name -> time.monotonic() of its failure, oldest first
+_lock = Lock()
+
+thumbnails_recorded = Signal()      # sent with source_name once the rows of a file are marked, queryset.update sends no post_save
+
+
+def get_thumbnail_sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', THUMBNAIL_SIZES)
+
+def thumbnail_name(source_name, width, height):
+    # derivatives are keyed by source and size, the source names are stable so the cache never needs invalidation
+    return posixpath.join('thumbnails', '%dx%d' % (width, height), source_name + '.jpg')
+
+def is_image(media_type):
+    return bool(media_type) and media_type.startswith('image/')
+
+def thumbnail_urls(field_file, ready, storage=None):
+    # {size name: url} of an image file, the urls are None until ready is set by record_thumbnails
+    if not field_file:
+        return None
+    storage = storage or field_file.storage
+    return {
+        size: signed_media_url(thumbnail_name(field_file.name, width, height), storage) if ready else None
+        for size, (width, height) in get_thumbnail_sizes().items()
+    }
+
+def icon_thumbnails_ready(user):
+    return bool(user.icon) and user.icon_thumbnails_for == user.icon.name
+
+def schedule_thumbnails(source_name, storage=None):
+    global _executor
+    storage = storage or default_storage
+    with _lock:
+        if source_name in _pending:
+            return
+        failed_at = _failed.get(source_name)
+        if failed_at is not None:
+            if time.monotonic() - failed_at < FAILED_RETRY_AFTER:
+                return
+            del _failed[source_name]
+        _pending.add(source_name)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+    _executor.submit(_generate_and_release, source_name, storage)
+
+def _generate_and_release(source_name, storage):
+    try:
+        generate_thumbnails(source_name, storage)
+        record_thumbnails(source_name)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", source_name)
+        with _lock:
+            _failed[source_name] = time.monotonic()
+            while len(_failed) > FAILED_MAX:
+                del _failed[next(iter(_failed))]
+    finally:
+        with _lock:
+            _pending.discard(source_name)
+        connection.close()                                      # the worker threads outlive any request
+
+def record_thumbnails(source_name):
+    # marks the rows of source_name as having thumbnails, modified_at moves so their conditional GETs see the change
+    now = timezone.now()
+    MediaStore.all_objects.filter(media_file=source_name, thumbnails_ready=False).update(thumbnails_ready=True, modified_at=now)
+    get_user_model().all_objects.filter(icon=source_name).exclude(icon_thumbnails_for=source_name).update(icon_thumbnails_for=source_name, modified_at=now)
+    thumbnails_recorded.send(sender=MediaStore, source_name=source_name)
+
+def generate_thumbnails(source_name, storage=None):
+    storage = storage or default_storage
+    sizes = [(width, height) for width, height in get_thumbnail_sizes().values() if not storage.exists(thumbnail_name(source_name, width, height))]
+    if not sizes:
+        return
+    with storage.open(source_name) as source:
+        image = Image.open(source)
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    for width, height in sizes:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((width, height))
+        buffer = BytesIO()
+        thumbnail.save(buffer, format='JPEG', quality=85, optimize=True)
+        storage.save(thumbnail_name(source_name, width, height), ContentFile(buffer.getvalue()))
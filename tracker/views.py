@@ -1,7 +1,24 @@
+import mimetypes
+import os
+import posixpath
+import re
+
 from inspect import getargs
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from rest_framework.exceptions import AuthenticationFailed
+from user.authentication import ClaimsJWTAuthentication
+
 from tracker.middlewares import get_request
+from tracker.media import verify_signature, signature_expiry, can_access_media
+from tracker.metrics import request_metrics
 
 # Create your views here.
 
@@ -13,4 +30,130 @@ def testMiddleware(request):
 
     # print("test Getattr")
     # print(getattr(None, "user", "hi"))
-    return HttpResponse(get_request().user.id)
\ No newline at end of file
+    return HttpResponse(get_request().user.id)
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+@require_safe
+def serve_media(request, name):
+    """
+    Serves MEDIA_ROOT to signed urls (tracker.media.signed_media_url), or to authenticated users allowed to see the file.
+    With settings.MEDIA_ACCEL set the transfer is handed to the front server (X-Accel-Redirect for nginx,
+    X-Sendfile for apache / lighttpd), otherwise the file is streamed here with Range and conditional request support.
+    """
+    name = posixpath.normpath(name).lstrip('/')
+    if name.startswith('..') or name == '.':
+        raise Http404()
+
+    expires = request.GET.get('e')
+    if expires is not None and verify_signature(name, expires, request.GET.get('s')):
+        cache_control = 'private, max-age=%d' % signature_expiry(expires)
+    else:
+        user = request.user if getattr(request, 'user', None) is not None and request.user.is_authenticated else None
+        if user is None:
+            try:
+                user_auth = ClaimsJWTAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                user_auth = None
+            user = user_auth[0] if user_auth is not None else None
+        if not can_access_media(user, name):
+            raise Http404()                                     # do not tell which files exist
+        cache_control = 'private, no-cache'
+
+    try:
+        path = default_storage.path(name)
+        stat = os.stat(path)
+    except (NotImplementedError, FileNotFoundError, ValueError):
+        raise Http404()
+
+    etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, name, path, stat.st_size, etag, last_modified)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
+
+def _file_response(request, name, path, size, etag, last_modified):
+    content_type, encoding = mimetypes.guess_type(name)
+    content_type = content_type or 'application/octet-stream'
+
+    accel = getattr(settings, 'MEDIA_ACCEL', '')
+    if accel == 'nginx':                                        # nginx serves the internal location, ranges included
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = posixpath.join(settings.MEDIA_ACCEL_PREFIX, name)
+        return response
+    if accel == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+    byte_range = _requested_range(request, size, etag, last_modified)
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+    start, end = byte_range if byte_range is not None else (0, size - 1)
+
+    response = StreamingHttpResponse(_read_file(path, start, end), content_type=content_type, status=206 if byte_range else 200)
+    response['Content-Length'] = str(end - start + 1 if size else 0)
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range is not None:
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+def _requested_range(request, size, etag, last_modified):
+    """Returns (start, end) for a single satisfiable range, None to send the whole file, or 'unsatisfiable'."""
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        return None                                             # the client's copy is stale, it needs the whole file
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None                                             # multiple or malformed ranges, the full file is a valid answer
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first == '':                                             # suffix range, the last N bytes
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+def _read_file(path, start, end):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def metrics(request):
+    """Request metrics of this worker process in the prometheus text format, see tracker.metrics."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token and not settings.DEBUG:                    # closed until a token is configured
+        raise Http404
+    if token and not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer ' + token):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
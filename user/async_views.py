@@ -0,0 +1,12 @@
+from api.async_views import AsyncReadView
+
+from .models import User
+from .views import UserListView
+
+
+class AsyncUserListView(AsyncReadView):
+    sync_view_class = UserListView
+    validator_relations = ()
+
+    async def aget(self, request, user, *args, **kwargs):
+        return await self.paginated_response(User.objects.all(), UserListView.UserSerializer)
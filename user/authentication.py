@@ -0,0 +1,65 @@
+from asgiref.sync import sync_to_async
+from django.utils.functional import cached_property
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import CLAIMS_VERSION, user_claims
+
+
+class ClaimsUser(TokenUser):
+    """
+    Authenticated user built from the claims of an access token, see user.tokens.user_claims.
+    Enough for authorization and audit fields (set them by id), it is not a User row and can not be saved.
+    Claims are as fresh as the token: team or role changes show up at the next token refresh.
+    """
+    @cached_property
+    def account_type(self):
+        return self.token.get('account_type')
+
+    @cached_property
+    def team_ids(self):
+        return frozenset(self.token.get('teams', ()))
+
+    @cached_property
+    def led_team_ids(self):
+        return frozenset(self.token.get('led_teams', ()))
+
+    def in_team(self, team_id):
+        return team_id is not None and int(team_id) in self.team_ids
+
+    def leads_team(self, team_id):
+        return team_id is not None and int(team_id) in self.led_team_ids
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the user lookup, request.user is a ClaimsUser.
+    Tokens issued before the claims existed are checked against the db once per request until they expire.
+    """
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        if validated_token.get('claims') == CLAIMS_VERSION:
+            return ClaimsUser(validated_token)
+        return self.get_user_from_db(validated_token)
+
+    def get_user_from_db(self, validated_token):
+        user = super().get_user(validated_token)
+        validated_token.payload.update(user_claims(user))
+        return ClaimsUser(validated_token)
+
+    async def aauthenticate(self, request):
+        """Async authenticate(), returns a ClaimsUser or None when no token is sent."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if api_settings.USER_ID_CLAIM in validated_token and validated_token.get('claims') == CLAIMS_VERSION:
+            return ClaimsUser(validated_token)
+        return await sync_to_async(self.get_user)(validated_token)
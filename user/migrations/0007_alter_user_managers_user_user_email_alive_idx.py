@@ -0,0 +1,25 @@
+# Generated by Django 4.1 on 2026-10-18 11:31
+
+from django.db import migrations, models
+import user.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0006_user_teams'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', user.models.AliveUserManager()),
+                ('all_objects', user.models.UserManager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['email'], name='user_email_alive_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_alter_user_managers_user_user_email_alive_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['created_at', 'id'], name='user_created_alive_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_user_user_created_alive_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='icon_thumbnails_for',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
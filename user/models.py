@@ -6,7 +6,8 @@ from django.contrib.auth.hashers import make_password
 from django.utils.translation import gettext_lazy as _
 
 from django.utils import timezone
-from tracker.middlewares import get_request
+from tracker.middlewares import get_request, get_request_user
+from tracker.managers import AliveManagerMixin
 
 class UserManager(BaseUserManager):
     use_in_migrations = True
@@ -47,6 +48,9 @@ class UserManager(BaseUserManager):
 
         return self._create_user(username, email, password, force_insert= True, **extra_fields) #restrict force user to this function call only
 
+class AliveUserManager(AliveManagerMixin, UserManager):
+    pass
+
 # Create your models here.
 
 class User(AbstractUser):
@@ -55,6 +59,7 @@ class User(AbstractUser):
     teams = models.ManyToManyField('tracker.Teams', related_name='users', blank=True)
 
     icon = models.ImageField(upload_to='user_icons', blank=True, null=True)
+    icon_thumbnails_for = models.CharField(max_length=100, blank=True, default='', editable=False)     # icon name the thumbnails were generated for, see tracker.thumbnails
 
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
@@ -64,7 +69,8 @@ class User(AbstractUser):
     deleted_at = models.DateTimeField(null=True, blank=True)
     deleted_by = models.ForeignKey('self', related_name='%(class)s_deleted', on_delete=models.RESTRICT, null=True, blank=True)
 
-    objects = UserManager()
+    objects = AliveUserManager()        # default manager, soft deleted users can not be looked up or authenticated
+    all_objects = UserManager()         # escape hatch, includes soft deleted users
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -72,6 +78,10 @@ class User(AbstractUser):
     class Meta:
         verbose_name = _("user")
         verbose_name_plural = _("users")
+        indexes = [                                                  # live users only
+            models.Index(fields=['email'], name='user_email_alive_idx', condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['created_at', 'id'], name='user_created_alive_idx', condition=models.Q(deleted_at__isnull=True)),      # keyset pagination
+        ]
     
     def __str__(self):
         return getattr(self, self.USERNAME_FIELD)
@@ -86,38 +96,32 @@ class User(AbstractUser):
     
     def save(self, auth_user = None, *args, **kwargs):          # if calling via shell, user_id should be passed to the function.
         if auth_user is not None:
-            self.modified_by = auth_user
+            self.modified_by_id = auth_user.pk
         else:
-            req = get_request()
-            if req is not None:
-                auth_user = getattr(req, 'user', None)
-                if auth_user.is_anonymous is False:
-                    if self._state.adding:                          # if new object, set both created_by and modified_by to auth_user
-                        self.created_by = auth_user
-                        self.modified_by = auth_user
-                    else:                                           # if existing object, only update the modified_by
-                        self.modified_by = auth_user
+            auth_user = get_request_user()
+            if auth_user is not None:
+                if self._state.adding:                              # if new object, set both created_by and modified_by to auth_user
+                    self.created_by_id = auth_user.pk
+                    self.modified_by_id = auth_user.pk
+                else:                                               # if existing object, only update the modified_by
+                    self.modified_by_id = auth_user.pk
         return super(User,self).save(*args, **kwargs)           # if no auth_user is given, save without setting created_by or modified_by, since user can register themselves, that implies they are the creator and modifier.
 
     
     def soft_delete(self, auth_user = None, *args, **kwargs):   # if calling via shell, user_id should be passed to the function.
-        if auth_user is not None:                               # if user is passes as arguement, assign it
-            self.deleted_by = auth_user
-            self.modified_by = auth_user
-        else:
-            req = get_request()
-            if req is not None:
-                return ValueError("kindly provide auth_user")   # This case is possibe in case of shell use, ask user to provide required field, alternatively can give a cmd form to login in shell                                                   
-            auth_user = getattr(req, 'user', None)
-            if auth_user.is_anonymous is True:                               # this case can happed incase a not logged in user requests for deletion using any bug
+        if auth_user is None:
+            if get_request() is None:
+                raise ValueError("kindly provide auth_user")    # This case is possibe in case of shell use, ask user to provide required field, alternatively can give a cmd form to login in shell
+            auth_user = get_request_user()
+            if auth_user is None:                               # this case can happed incase a not logged in user requests for deletion using any bug
                 raise ValueError("Please login and try again")
-        self.deleted_by = auth_user
-        self.modified_by = auth_user                            # if user is not available in request, then it is a shell call, do not update deleted_by and modified_by
+        self.deleted_by_id = auth_user.pk
+        self.modified_by_id = auth_user.pk                      # if user is not available in request, then it is a shell call, do not update deleted_by and modified_by
         self.deleted_at = timezone.now()                        # set deleted_at to current time
         return self.save(auth_user=auth_user, *args, **kwargs)  # save the model
 
     @property
     def get_active_teams_list(self):
-        return self.teams.all().filter(deleted_at__isnull=True)
+        return self.teams.all()
 
     
\ No newline at end of file
@@ -2,11 +2,8 @@ from .models import User
 
 
 def get_user_instance(user_id):
-    qs = User.objects.get(id=user_id)
-    if qs is not None:
-        if qs.deleted_at is None:
-            return qs
-    return None
+    qs = User.objects.filter(id=user_id).first()                   # None if the user does not exist or is soft deleted
+    return qs
 
 def get_user_teams(user_id):
     user = User.objects.get(id=user_id)
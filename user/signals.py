@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from tracker.thumbnails import icon_thumbnails_ready, schedule_thumbnails
+
+from .models import User
+
+
+@receiver(post_save, sender=User)
+def queue_icon_thumbnails(sender, instance, update_fields=None, **kwargs):
+    if not instance.icon or icon_thumbnails_ready(instance):
+        return
+    if update_fields is not None and 'icon' not in update_fields:
+        return
+    transaction.on_commit(lambda: schedule_thumbnails(instance.icon.name, instance.icon.storage))
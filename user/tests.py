@@ -1,3 +1,62 @@
-from django.test import TestCase
+from django.test import RequestFactory
 
-# Create your tests here.
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from api.tests import ApiTestCase, make_user
+
+from .authentication import ClaimsJWTAuthentication
+from .models import User
+from .tokens import CLAIMS_VERSION, ClaimsRefreshToken
+
+
+class SoftDeletedUserTests(ApiTestCase):
+    def test_soft_deleted_user_is_hidden_from_default_manager(self):
+        user = make_user('gone')
+        user.soft_delete(auth_user=self.admin)
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+        self.assertTrue(User.all_objects.filter(pk=user.pk).exists())
+
+    def test_email_and_username_of_soft_deleted_user_are_still_taken(self):
+        make_user('gone').soft_delete(auth_user=self.admin)
+        response = APIClient().post('/api/auth/register/', {'username': 'gone', 'email': 'gone@example.com', 'password': 'secret-password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'username', 'email'})
+
+
+class ClaimsAuthenticationTests(ApiTestCase):
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer %s' % token)
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_obtained_tokens_carry_the_claims(self):
+        response = APIClient().post('/api/auth/token/', {'email': 'leader@example.com', 'password': 'secret-password'})
+        self.assertEqual(response.status_code, 200)
+        access = AccessToken(response.data['access'])
+        self.assertEqual(access['claims'], CLAIMS_VERSION)
+        self.assertEqual((access['teams'], access['led_teams'], access['account_type']), ([self.team.pk], [self.team.pk], 'T'))
+
+    def test_claims_token_is_authenticated_without_queries(self):
+        token = ClaimsRefreshToken.for_user(self.member).access_token
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+            self.assertTrue(user.in_team(self.team.pk))
+            self.assertFalse(user.leads_team(self.team.pk))
+            self.assertEqual((user.pk, user.account_type), (self.member.pk, 'C'))
+
+    def test_token_without_claims_is_checked_against_the_database(self):
+        token = RefreshToken.for_user(self.member).access_token
+        with self.assertNumQueries(3):                          # the user, its teams and the teams it leads
+            user = self.authenticate(token)
+        self.assertEqual(user.team_ids, {self.team.pk})
+        self.member.is_active = False
+        self.member.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_refresh_picks_up_team_changes(self):
+        refresh = ClaimsRefreshToken.for_user(self.outsider)
+        self.outsider.teams.add(self.team)
+        response = APIClient().post('/api/auth/token/refresh/', {'refresh': str(refresh)})
+        self.assertEqual(AccessToken(response.data['access'])['teams'], [self.team.pk])
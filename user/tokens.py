@@ -0,0 +1,56 @@
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from tracker.models import Teams
+
+from .models import User
+
+
+CLAIMS_VERSION = 1          # bump when the claims change, older tokens are then authenticated against the db until they expire
+
+
+def user_claims(user: User):
+    """Claims read by user.authentication.ClaimsUser, two queries, only run when a token is issued or refreshed."""
+    return {
+        'claims': CLAIMS_VERSION,
+        'username': user.username,
+        'account_type': user.account_type,
+        'is_superuser': user.is_superuser,
+        'is_staff': user.is_staff,
+        'teams': list(user.teams.values_list('id', flat=True)),
+        'led_teams': list(Teams.objects.filter(team_leader_id=user.pk).values_list('id', flat=True)),
+    }
+
+
+class ClaimsRefreshToken(RefreshToken):
+    # access tokens are copied from the refresh token, they carry the same claims
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Reloads the claims of the user into the new access token, team or role changes reach clients at the next refresh
+    instead of living as long as the refresh token. Disabled and deleted users can no longer refresh.
+    """
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}).first()
+        if user is None or not user.is_active:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        access = refresh.access_token
+        for claim, value in user_claims(user).items():
+            access[claim] = value
+        data['access'] = str(access)
+        return data
@@ -3,9 +3,15 @@ from django.shortcuts import render
 from rest_framework.response import Response
 from rest_framework import generics, status, serializers
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.validators import UniqueValidator
 
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .authentication import ClaimsJWTAuthentication
+from .tokens import ClaimsRefreshToken
+
+from api.pagination import KeysetPagination
+from api.serializers import SignedMediaField
+
+from tracker.thumbnails import icon_thumbnails_ready, thumbnail_urls
 
 from .models import User
 from .services import add_user_to_team, remove_team_from_user, update_account_type, disable_account
@@ -17,7 +23,7 @@ class AddUserToTeam(generics.GenericAPIView):
         user_id = serializers.IntegerField(required=True)
         team_id = serializers.IntegerField(required=True)
 
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated] # removed IsAdminUser permission since team leaders can also add users to team
     serializer_class = InputSerializer
 
@@ -35,7 +41,7 @@ class RemoveUserFromTeam(generics.GenericAPIView):
         user_id = serializers.IntegerField(required=True)
         team_id = serializers.IntegerField(required=True)
 
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated] # removed IsAdminUser permission since team leaders can also remove users from team
     serializer_class = InputSerializer
 
@@ -61,7 +67,7 @@ class UpdateAccountType(generics.GenericAPIView):
                 raise serializers.ValidationError("Invalid account type")
             return super().validate(attrs)
 
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
     serializer_class = InputSerializer
 
@@ -79,7 +85,7 @@ class DisableAccount(generics.GenericAPIView):
     class InputSerializer(serializers.Serializer):
         user_id = serializers.IntegerField(required=True)
 
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
     serializer_class = InputSerializer
 
@@ -95,13 +101,20 @@ class DisableAccount(generics.GenericAPIView):
 
 class UserListView(generics.ListAPIView):
     class UserSerializer(serializers.ModelSerializer):
+        icon = SignedMediaField()
+        icon_thumbnails = serializers.SerializerMethodField(read_only=True)
+
         class Meta:
             model = User
-            fields = ('pk', 'username', 'email')
+            fields = ('pk', 'username', 'email', 'icon', 'icon_thumbnails')
+
+        def get_icon_thumbnails(self, obj):
+            return thumbnail_urls(obj.icon, icon_thumbnails_ready(obj))
 
-    queryset = User.objects.all().filter(deleted_at__isnull=True)
+    queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
 
 class RegisterUser(generics.CreateAPIView):
@@ -109,6 +122,10 @@ class RegisterUser(generics.CreateAPIView):
         class Meta:
             model = User
             fields = ('pk', 'username', 'email', 'password')
+            extra_kwargs = {                                        # soft deleted users still hold their username and email in the database
+                'username': {'validators': [User.username_validator, UniqueValidator(queryset=User.all_objects.all())]},
+                'email': {'validators': [UniqueValidator(queryset=User.all_objects.all())]},
+            }
 
         def create(self, validated_data, *args, **kwargs):
             user = User.objects.create_user(**validated_data)
@@ -124,7 +141,7 @@ class RegisterUser(generics.CreateAPIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         self.perform_create(serializer)
         user = User.objects.get(username=serializer.data['username'])
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         headers = self.get_success_headers(serializer.data)
         return Response(
             {"data": serializer.data, "refresh": str(refresh), "access": str(refresh.access_token)},